@@ -21,7 +21,7 @@ build_dir="${root_dir}/ios-libs-layer"
 # download the python dependencies
 mkdir -p ${build_dir}/python/libs
 cd ${build_dir}/python/libs
-pip3 install -t . chardet requests urllib3 certifi idna pandas python-dateutil pytz six pyyaml pyparsing cycler kiwisolver numexpr mock tables bokeh selenium phantomjs
+pip3 install -t . chardet requests urllib3 certifi idna pandas python-dateutil pytz six pyyaml pyparsing cycler kiwisolver numexpr mock tables pyarrow bokeh selenium phantomjs
 
 # result is too big for a lambda layer (250 MB limit at time of writing
 # (2020-Feb-18)), so some of the packages need to be trimmed down to fit.
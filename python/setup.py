@@ -15,6 +15,7 @@ setup(
   install_requires=['bokeh==1.4.0', 'pyyaml', 'boto3', 'botocore', 'certifi',
                     'matplotlib', 'numpy', 'pandas==1.2.3', 'requests',
                     'urllib3', 'tables', 'fortranformat', 'netCDF4', 'phantomjs', 'selenium'],
+  extras_require={'parquet': ['pyarrow'], 'web': ['pyarrow']},
   package_dir={'fsoi': 'src/fsoi'},
   package_data={
     'fsoi': [
@@ -39,7 +40,11 @@ setup(
       'download_met=fsoi.ingest.met.download_met:main',
       'process_met=fsoi.ingest.met.process_met:main',
       'process_merra=fsoi.ingest.merra.process_merra:main',
-      'batch_merra=fsoi.ingest.merra.process_merra:batch'
+      'batch_merra=fsoi.ingest.merra.process_merra:batch',
+      'convert_storage_format=fsoi.data.convert_storage_format:main',
+      'rollup_fsoi=fsoi.ingest.rollup:main',
+      'cube_fsoi=fsoi.ingest.cube:main',
+      'backfill_fsoi=fsoi.ingest.backfill:main'
     ]
   }
 )
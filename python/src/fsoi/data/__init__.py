@@ -1,4 +1,5 @@
 """
 FSOI Data Management
 """
-__all__ = ['datastore', 's3_datastore']
+__all__ = ['datastore', 's3_datastore', 'storage_format', 'convert_storage_format', 'ftp_pool', 'disk_cache',
+           'frame_cache', 'frame_ipc']
@@ -0,0 +1,128 @@
+"""
+Convert FSOI products in the S3 data store from one storage format to another (e.g., HDF5 to
+Parquet).  The converted objects are written alongside the originals using the key template of
+the target storage format in datastore.yaml.
+"""
+
+import os
+import yaml
+import pkgutil
+import tempfile
+import shutil
+from argparse import ArgumentParser
+from argparse import ArgumentDefaultsHelpFormatter as FormatHelper
+from fsoi import log
+from fsoi.data.s3_datastore import S3DataStore
+from fsoi.data.storage_format import get_storage_format
+
+
+def _key_template(storage_format):
+    """
+    Get the S3 key template for a storage format
+    :param storage_format: {StorageFormat} The storage format
+    :return: {str} The key template from datastore.yaml
+    """
+    config = yaml.full_load(pkgutil.get_data('fsoi', 'data/datastore.yaml'))['fsoi']['s3']
+    return config['key'] if storage_format.name == 'hdf5' else config['%s_key' % storage_format.name]
+
+
+def convert_key(key, source_format, target_format):
+    """
+    Convert the S3 key of an object in the source format to the key in the target format
+    :param key: {str} S3 key of the source object
+    :param source_format: {StorageFormat} The source storage format
+    :param target_format: {StorageFormat} The target storage format
+    :return: {str} S3 key of the target object, or None if the key does not match the source format
+    """
+    source_template = _key_template(source_format)
+    target_template = _key_template(target_format)
+    source_prefix = source_template[:source_template.index('%s')]
+    target_prefix = target_template[:target_template.index('%s')]
+    source_extension = '.' + source_format.extension
+    target_extension = '.' + target_format.extension
+
+    if not key.startswith(source_prefix) or not key.endswith(source_extension):
+        return None
+
+    return target_prefix + key[len(source_prefix):-len(source_extension)] + target_extension
+
+
+def convert_products(datastore, center, source_format, target_format, overwrite=False):
+    """
+    Convert all products for a center from the source to the target storage format
+    :param datastore: {S3DataStore} The data store
+    :param center: {str} The center name
+    :param source_format: {StorageFormat} The source storage format
+    :param target_format: {StorageFormat} The target storage format
+    :param overwrite: {bool} Overwrite objects that have already been converted
+    :return: {list} List of S3 keys that failed to convert
+    """
+    config = yaml.full_load(pkgutil.get_data('fsoi', 'data/datastore.yaml'))['fsoi']['s3']
+    bucket = config['bucket']
+    source_template = _key_template(source_format)
+    prefix = source_template[:source_template.index('%s')] + center + '/'
+
+    sources = datastore.list_data_store({'bucket': bucket, 'prefix': prefix})
+    if sources is None:
+        log.error('Failed to list data store: s3://%s/%s' % (bucket, prefix))
+        return None
+
+    failed = []
+    work_dir = tempfile.mkdtemp()
+    try:
+        for source in sources:
+            target_key = convert_key(source['key'], source_format, target_format)
+            if target_key is None:
+                continue
+            target = {'bucket': bucket, 'key': target_key}
+            if not overwrite and datastore.data_exist(target):
+                continue
+
+            source_file = '%s/%s' % (work_dir, os.path.basename(source['key']))
+            target_file = '%s/%s' % (work_dir, os.path.basename(target_key))
+            try:
+                if not datastore.load_to_local_file(source, source_file):
+                    raise IOError('Failed to download s3://%s/%s' % (bucket, source['key']))
+                target_format.write(target_file, source_format.read(source_file))
+                if not datastore.save_from_local_file(target_file, target):
+                    raise IOError('Failed to upload s3://%s/%s' % (bucket, target_key))
+                log.info('Converted s3://%s/%s' % (bucket, target_key))
+            except Exception as e:
+                log.error('Failed to convert s3://%s/%s' % (bucket, source['key']), e)
+                failed.append(source['key'])
+            finally:
+                for local_file in [source_file, target_file]:
+                    if os.path.exists(local_file):
+                        os.remove(local_file)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return failed
+
+
+def main():
+    """
+    Convert the products for one or more centers
+    :return: None
+    """
+    parser = ArgumentParser(description='Convert FSOI products to another storage format', formatter_class=FormatHelper)
+    parser.add_argument('-c', '--center', help='center(s) to convert', type=str, nargs='+', required=True)
+    parser.add_argument('-s', '--source-format', help='source storage format', type=str, default='hdf5',
+                        choices=['hdf5', 'parquet'], required=False)
+    parser.add_argument('-t', '--target-format', help='target storage format', type=str, default='parquet',
+                        choices=['hdf5', 'parquet'], required=False)
+    parser.add_argument('-o', '--overwrite', help='overwrite converted objects', action='store_true', required=False)
+    args = parser.parse_args()
+
+    source_format = get_storage_format(args.source_format)
+    target_format = get_storage_format(args.target_format)
+    datastore = S3DataStore()
+
+    for center in args.center:
+        failed = convert_products(datastore, center, source_format, target_format, args.overwrite)
+        if failed:
+            log.error('Failed to convert %d objects for %s' % (len(failed), center))
+
+
+if __name__ == '__main__':
+    main()
@@ -40,6 +40,16 @@ class DataStore:
         """
         raise NotImplementedError('save_from_local_file not implemented')
 
+    def save_from_stream(self, stream, target):
+        """
+        Save data to the data store from a readable binary stream, without holding all of the data
+        in memory
+        :param stream: {file} An object with a read(size) method, e.g. an HTTP response
+        :param target: {dict} A dictionary with attributes to describe the data store target
+        :return: {bool} True if successful, otherwise False
+        """
+        raise NotImplementedError('save_from_stream not implemented')
+
     def load_to_local_file(self, source, local_file):
         """
         Load data from the data store to a local file
@@ -66,6 +76,31 @@ class DataStore:
         """
         raise NotImplementedError('data_exist not implemented')
 
+    def exists_many(self, targets):
+        """
+        Check if each of the specified targets exists
+        :param targets: {list} List of dictionaries that describe data store targets
+        :return: {list} True or False for each target, in the order of the targets
+        """
+        return [self.data_exist(target) for target in targets]
+
+    def etags_many(self, targets):
+        """
+        Get the ETag of each of the specified targets
+        :param targets: {list} List of dictionaries that describe data store targets
+        :return: {list} The ETag of each target, or None if the target does not exist, in the order of the targets
+        """
+        raise NotImplementedError('etags_many not implemented')
+
+    def list_prefix(self, bucket, prefix):
+        """
+        List the keys in a bucket that start with a prefix
+        :param bucket: {str} The bucket name
+        :param prefix: {str} The key prefix
+        :return: {set} Set of keys, or None if the request failed
+        """
+        raise NotImplementedError('list_prefix not implemented')
+
     def delete(self, target):
         """
         Delete the specified target from the data store
@@ -74,6 +109,23 @@ class DataStore:
         """
         raise NotImplementedError('delete not implemented')
 
+    def copy(self, source, target):
+        """
+        Copy data within the data store
+        :param source: {dict} A dictionary with attributes to describe the data store source
+        :param target: {dict} A dictionary with attributes to describe the data store target
+        :return: {bool} True if successful, otherwise False
+        """
+        raise NotImplementedError('copy not implemented')
+
+    def delete_many(self, targets):
+        """
+        Delete each of the specified targets from the data store
+        :param targets: {list} List of dictionaries that describe data store targets
+        :return: {list} True or False for each target, in the order of the targets
+        """
+        return [self.delete(target) for target in targets]
+
 
 class DataStoreOperation:
     """
@@ -248,3 +300,39 @@ class ThreadedDataStore(DataStore):
         operation = DataStoreOperation(self.datastore, 'delete', [target])
         self.operations.append(operation)
         self.futures.append(self.thread_pool.submit(operation.run))
+
+    def exists_many(self, targets):
+        """
+        Check if each of the specified targets exists with the backing data store's bulk check,
+        without waiting for the queued operations
+        :param targets: {list} List of dictionaries that describe data store targets
+        :return: {list} True or False for each target, in the order of the targets
+        """
+        return self.datastore.exists_many(targets)
+
+    def etags_many(self, targets):
+        """
+        Get the ETag of each of the specified targets with the backing data store's bulk check,
+        without waiting for the queued operations
+        :param targets: {list} List of dictionaries that describe data store targets
+        :return: {list} The ETag of each target, or None if the target does not exist, in the order of the targets
+        """
+        return self.datastore.etags_many(targets)
+
+    def list_prefix(self, bucket, prefix):
+        """
+        List the keys in a bucket that start with a prefix
+        :param bucket: {str} The bucket name
+        :param prefix: {str} The key prefix
+        :return: {set} Set of keys, or None if the request failed
+        """
+        return self.datastore.list_prefix(bucket, prefix)
+
+    def delete_many(self, targets):
+        """
+        Delete each of the specified targets with the backing data store's bulk delete, without
+        waiting for the queued operations
+        :param targets: {list} List of dictionaries that describe data store targets
+        :return: {list} True or False for each target, in the order of the targets
+        """
+        return self.datastore.delete_many(targets)
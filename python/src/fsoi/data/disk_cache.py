@@ -0,0 +1,503 @@
+"""
+A read-through disk cache for data store objects.  Cached files are named by the ETag of their
+content, so an object is downloaded once and shared by every request (and every thread) that needs
+it.  A cached object is used without any network I/O until it is older than a configurable time,
+then it is validated with a conditional request that only downloads the object if its ETag changed.
+The least recently used files are removed to keep the cache under a size cap.
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import pkgutil
+import yaml
+from contextlib import contextmanager
+from fsoi.data.datastore import DataStore
+from fsoi import log
+
+
+class DiskCache(DataStore):
+    """
+    Cache the objects loaded from a backing S3 data store on the local disk
+    """
+
+    def __init__(self, backing_datastore, directory=None, max_bytes=None, revalidate_after=None):
+        """
+        Create a cache; parameters that are None use the values in datastore.yaml
+        :param backing_datastore: {S3DataStore} Data store that holds the objects
+        :param directory: {str} Directory where cached files are stored
+        :param max_bytes: {int} Maximum total size of the cached files
+        :param revalidate_after: {float} Seconds that a cached file is used before it is validated again
+        """
+        config = yaml.full_load(pkgutil.get_data('fsoi', 'data/datastore.yaml'))['fsoi']['cache']
+        self.datastore = backing_datastore
+        self.directory = config['directory'] if directory is None else directory
+        self.max_bytes = config['max_bytes'] if max_bytes is None else max_bytes
+        self.revalidate_after = config['revalidate_after'] if revalidate_after is None else revalidate_after
+
+        self.objects_dir = os.path.join(self.directory, 'objects')
+        self.refs_dir = os.path.join(self.directory, 'refs')
+        self.tmp_dir = os.path.join(self.directory, 'tmp')
+        for directory in [self.objects_dir, self.refs_dir, self.tmp_dir]:
+            os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.refs = {}
+        self.size = sum(entry[2] for entry in self._list_objects())
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def _list_objects(self):
+        """
+        List the cached files
+        :return: {list} List of (last access time, path, size) tuples
+        """
+        entries = []
+        for name in os.listdir(self.objects_dir):
+            path = os.path.join(self.objects_dir, name)
+            try:
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, path, stat.st_size))
+            except OSError:
+                pass
+
+        return entries
+
+    def _object_file(self, etag):
+        """
+        Get the path to the cached file for an ETag
+        :param etag: {str} The ETag
+        :return: {str} Full path to the cached file
+        """
+        return os.path.join(self.objects_dir, hashlib.sha256(etag.encode()).hexdigest())
+
+    def _ref_file(self, name):
+        """
+        Get the path to the file that holds the ETag of an object
+        :param name: {str} The object name, bucket/key
+        :return: {str} Full path to the file
+        """
+        return os.path.join(self.refs_dir, hashlib.sha256(name.encode()).hexdigest())
+
+    def _get_ref(self, name):
+        """
+        Get the ETag of an object and the time that it was last validated
+        :param name: {str} The object name, bucket/key
+        :return: {dict} Dictionary with 'etag' and 'checked' attributes, or None if not cached
+        """
+        ref = self.refs.get(name)
+        if ref is None:
+            try:
+                with open(self._ref_file(name)) as fh:
+                    ref = json.load(fh)
+            except (OSError, ValueError):
+                return None
+            self.refs[name] = ref
+
+        return ref
+
+    def _set_ref(self, name, ref):
+        """
+        Save the ETag of an object and the time that it was last validated
+        :param name: {str} The object name, bucket/key
+        :param ref: {dict} Dictionary with 'etag' and 'checked' attributes, or None to forget the object
+        :return: None
+        """
+        ref_file = self._ref_file(name)
+        if ref is None:
+            self.refs.pop(name, None)
+            if os.path.exists(ref_file):
+                os.remove(ref_file)
+            return
+
+        self.refs[name] = ref
+        fd, temp = tempfile.mkstemp(dir=self.tmp_dir)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(ref, fh)
+        os.replace(temp, ref_file)
+
+    def _name(self, descriptor):
+        """
+        Get the object name for a descriptor
+        :param descriptor: {dict} A data descriptor for the backing data store
+        :return: {str} The object name, bucket/key, or None if the descriptor is invalid
+        """
+        if not self.datastore._validate_descriptor(descriptor):
+            return None
+
+        return '%s/%s' % self.datastore._to_bucket_and_key(descriptor)
+
+    @contextmanager
+    def _key_lock(self, name):
+        """
+        Hold the lock that serializes loading one object, so overlapping requests download it once.  The
+        lock is forgotten when no thread uses it, so the locks do not grow with the number of objects.
+        :param name: {str} The object name, bucket/key
+        :return: None
+        """
+        with self.lock:
+            entry = self.key_locks.setdefault(name, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.key_locks[name]
+
+    def _open(self, path):
+        """
+        Open a cached file while it cannot be evicted; an open file stays readable after it is evicted
+        :param path: {str} Full path to the cached file
+        :return: {file} The open file, or None if the file is not cached
+        """
+        with self.lock:
+            try:
+                return open(path, 'rb')
+            except FileNotFoundError:
+                return None
+
+    def fetch(self, source):
+        """
+        Get a cached copy of an object, downloading it if it is not cached or has changed.  A recently
+        validated file is used without network I/O, unless the descriptor has an 'etag' attribute, listed
+        from the backing data store, that does not match the cached copy.
+        :param source: {dict} A data descriptor for the backing data store
+        :return: {file} The cached file open for reading, or None if the data do not exist or could not be loaded
+        """
+        name = self._name(source)
+        if name is None:
+            return None
+
+        with self._key_lock(name):
+            ref = self._get_ref(name)
+            path = None if ref is None else self._object_file(ref['etag'])
+            fh = None if path is None else self._open(path)
+            if fh is None:
+                ref = None
+                path = None
+
+            # use a recently validated file without any network I/O
+            expected = source.get('etag')
+            if ref is not None and time.time() - ref['checked'] < self.revalidate_after and \
+                    expected in (None, ref['etag']):
+                self._touch(path)
+                with self.lock:
+                    self.hits += 1
+                return fh
+
+            # download the object, unless the cached file is still current
+            fd, temp = tempfile.mkstemp(dir=self.tmp_dir)
+            os.close(fd)
+            try:
+                etag = self.datastore.load_to_local_file_if_changed(source, temp, None if ref is None else ref['etag'])
+
+                # keep serving the cached file if it could not be validated, and validate it on the next fetch
+                if etag is False:
+                    if fh is not None:
+                        log.warn('Failed to validate %s, using the cached file' % name)
+                        self._touch(path)
+                        with self.lock:
+                            self.hits += 1
+                    return fh
+
+                if etag is None:
+                    if fh is not None:
+                        fh.close()
+                    self._set_ref(name, None)
+                    return None
+
+                if ref is not None and etag == ref['etag']:
+                    self._set_ref(name, {'etag': etag, 'checked': time.time()})
+                    self._touch(path)
+                    with self.lock:
+                        self.revalidations += 1
+                    return fh
+
+                # add the file, unless the same content is already cached for another object
+                if fh is not None:
+                    fh.close()
+                path = self._object_file(etag)
+                with self.lock:
+                    self.misses += 1
+                    if not os.path.exists(path):
+                        self.size += os.path.getsize(temp)
+                        os.replace(temp, path)
+                    fh = open(path, 'rb')
+                self._set_ref(name, {'etag': etag, 'checked': time.time()})
+
+            except Exception:
+                if fh is not None:
+                    fh.close()
+                raise
+
+            finally:
+                if os.path.exists(temp):
+                    os.remove(temp)
+
+        self._evict(keep=path)
+        return fh
+
+    def etag(self, source):
+        """
+        Get the ETag of the cached copy of an object, without network I/O
+        :param source: {dict} A data descriptor for the backing data store
+        :return: {str} The ETag, or None if the object is not cached
+        """
+        name = self._name(source)
+        if name is None:
+            return None
+
+        with self._key_lock(name):
+            ref = self._get_ref(name)
+
+        return None if ref is None else ref['etag']
+
+    @staticmethod
+    def _touch(path):
+        """
+        Mark a cached file as recently used
+        :param path: {str} Full path to the cached file
+        :return: None
+        """
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _evict(self, keep=None):
+        """
+        Remove the least recently used files until the cache is under the size cap
+        :param keep: {str} Do not remove this file
+        :return: None
+        """
+        with self.lock:
+            if self.size <= self.max_bytes:
+                return
+
+            entries = sorted(self._list_objects())
+            self.size = sum(entry[2] for entry in entries)
+            evicted = set()
+            for (_, path, size) in entries:
+                if self.size <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    self.size -= size
+                    evicted.add(path)
+                    log.debug('Evicted %s from the disk cache' % path)
+                except OSError:
+                    pass
+
+            # forget the evicted objects; their ref files are read again if the objects are used again
+            for (name, ref) in list(self.refs.items()):
+                if self._object_file(ref['etag']) in evicted:
+                    self.refs.pop(name, None)
+
+    def load_to_local_file(self, source, local_file):
+        """
+        Load data from the cache to a local file
+        :param source: {dict} A data descriptor for the backing data store
+        :param local_file: {str} Full path to the local file (directories will be created if they
+                                 do not already exist.
+        :return: True if successful, otherwise False
+        """
+        try:
+            fh = self.fetch(source)
+            if fh is None:
+                return False
+
+            local_dir = os.path.dirname(local_file)
+            if local_dir:
+                os.makedirs(local_dir, exist_ok=True)
+
+            with fh, open(local_file, 'wb') as out:
+                while True:
+                    data = fh.read(1024 * 1024)
+                    if not data:
+                        break
+                    out.write(data)
+
+            return True
+
+        except Exception as e:
+            log.error('Failed to load data from the disk cache')
+            log.error(e)
+            return False
+
+    def load(self, source):
+        """
+        Load data from the cache to memory
+        :param source: {dict} A data descriptor for the backing data store
+        :return: {bytes} The data, or None if unsuccessful
+        """
+        try:
+            fh = self.fetch(source)
+            if fh is None:
+                return None
+
+            with fh:
+                return fh.read()
+
+        except Exception as e:
+            log.error('Failed to load data from the disk cache')
+            log.error(e)
+            return None
+
+    def data_exist(self, target):
+        """
+        Check if the specified target exists, without network I/O if it was recently validated
+        :param target: {dict} A data descriptor for the backing data store
+        :return: True if the target exists, otherwise False
+        """
+        return self._is_fresh(target) or self.datastore.data_exist(target)
+
+    def _is_fresh(self, target):
+        """
+        Check if a target is cached and was recently validated
+        :param target: {dict} A data descriptor for the backing data store
+        :return: {bool} True if the cached file can be used without network I/O
+        """
+        name = self._name(target)
+        if name is None:
+            return False
+
+        with self._key_lock(name):
+            ref = self._get_ref(name)
+
+        return ref is not None and time.time() - ref['checked'] < self.revalidate_after and \
+            os.path.exists(self._object_file(ref['etag']))
+
+    def exists_many(self, targets):
+        """
+        Check if each of the specified targets exists, without network I/O for recently validated
+        targets and with the backing data store's bulk check for the others
+        :param targets: {list} List of data descriptors for the backing data store
+        :return: {list} True or False for each target, in the order of the targets
+        """
+        exists = [self._is_fresh(target) for target in targets]
+
+        unknown = [i for (i, known) in enumerate(exists) if not known]
+        if unknown:
+            for (i, found) in zip(unknown, self.datastore.exists_many([targets[i] for i in unknown])):
+                exists[i] = found
+
+        return exists
+
+    def etags_many(self, targets):
+        """
+        Get the ETag of each of the specified targets from the backing data store, since a cached
+        ETag may be out of date
+        :param targets: {list} List of data descriptors for the backing data store
+        :return: {list} The ETag of each target, or None if the target does not exist, in the order of the targets
+        """
+        return self.datastore.etags_many(targets)
+
+    def list_prefix(self, bucket, prefix):
+        """
+        List the keys in a bucket of the backing data store that start with a prefix
+        :param bucket: {str} The bucket name
+        :param prefix: {str} The key prefix
+        :return: {set} Set of keys, or None if the request failed
+        """
+        return self.datastore.list_prefix(bucket, prefix)
+
+    def _forget(self, target):
+        """
+        Forget the cached ETag of an object that is changed through the cache
+        :param target: {dict} A data descriptor for the backing data store
+        :return: None
+        """
+        name = self._name(target)
+        if name is not None:
+            with self._key_lock(name):
+                self._set_ref(name, None)
+
+    def save_from_http(self, url, target):
+        """
+        Save data from the URL to the backing data store
+        :param url: {str} URL with HTTPS or HTTP protocol
+        :param target: {dict} A data descriptor for the backing data store
+        :return: {bool} True if successful, otherwise False
+        """
+        self._forget(target)
+        return self.datastore.save_from_http(url, target)
+
+    def save_from_ftp(self, url, target):
+        """
+        Save data from the URL to the backing data store
+        :param url: {str} URL with FTP protocol
+        :param target: {dict} A data descriptor for the backing data store
+        :return: {bool} True if successful, otherwise False
+        """
+        self._forget(target)
+        return self.datastore.save_from_ftp(url, target)
+
+    def save_from_local_file(self, local_file, target):
+        """
+        Save data to the backing data store from a local file
+        :param local_file: {str} Full path to the local file
+        :param target: {dict} A data descriptor for the backing data store
+        :return: {bool} True if successful, otherwise False
+        """
+        self._forget(target)
+        return self.datastore.save_from_local_file(local_file, target)
+
+    def save_from_stream(self, stream, target):
+        """
+        Save data to the backing data store from a readable binary stream
+        :param stream: {file} An object with a read(size) method
+        :param target: {dict} A data descriptor for the backing data store
+        :return: {bool} True if successful, otherwise False
+        """
+        self._forget(target)
+        return self.datastore.save_from_stream(stream, target)
+
+    def list_data_store(self, filters):
+        """
+        Get a list of available data from the backing data store
+        :param filters: {dict} A dictionary with options for filtering the data sources
+        :return: {list} A list of dictionaries that describe data sources
+        """
+        return self.datastore.list_data_store(filters)
+
+    def delete(self, target):
+        """
+        Delete the specified target from the backing data store
+        :param target: {dict} A data descriptor for the backing data store
+        :return: True if successfully deleted, otherwise False
+        """
+        self._forget(target)
+        return self.datastore.delete(target)
+
+
+# the disk cache shared by all requests in this process
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """
+    Get the disk cache for FSOI data that is shared by all requests in this process, so a warm
+    Lambda container or a long-running server reuses the files that earlier requests downloaded
+    :return: {DiskCache} The disk cache
+    """
+    global _shared_cache
+
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            from fsoi.data.s3_datastore import FsoiS3DataStore
+            _shared_cache = DiskCache(FsoiS3DataStore())
+
+    return _shared_cache
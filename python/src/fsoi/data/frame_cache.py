@@ -0,0 +1,129 @@
+"""
+An in-memory cache of decoded and aggregated data frames, shared by all requests in a process, so a
+warm Lambda container or a long-running server answers overlapping requests without reading and
+aggregating the same files again.  The cache is bounded by the memory used by the data frames, and
+the least recently used data frames are removed first.
+"""
+
+import threading
+import pkgutil
+import yaml
+from collections import OrderedDict
+from fsoi import log
+
+
+class FrameCache:
+    """
+    A thread-safe least-recently-used cache of data frames, bounded by bytes
+    """
+
+    def __init__(self, max_bytes=None):
+        """
+        Create a cache
+        :param max_bytes: {int} Maximum memory used by the data frames, or None to use the value in datastore.yaml
+        """
+        if max_bytes is None:
+            config = yaml.full_load(pkgutil.get_data('fsoi', 'data/datastore.yaml'))['fsoi']['frame_cache']
+            max_bytes = config['max_bytes']
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version=None):
+        """
+        Get a data frame from the cache
+        :param key: {tuple} The cache key, e.g. (center, norm, datetime)
+        :param version: {str} The version of the source data, e.g. an ETag; a cached data frame
+                              from another version is removed
+        :return: {pandas.DataFrame} The data frame, which must not be modified, or None if not cached
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] != version:
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, df, version=None, size=None):
+        """
+        Add a data frame to the cache, removing the least recently used data frames if needed
+        :param key: {tuple} The cache key, e.g. (center, norm, datetime)
+        :param df: {pandas.DataFrame} The data frame, which must not be modified after it is added; may be
+                                      any other object if the size is given
+        :param version: {str} The version of the source data, e.g. an ETag
+        :param size: {int} Memory used by the object, or None to measure the data frame
+        :return: None
+        """
+        size = int(df.memory_usage(index=True, deep=True).sum()) if size is None else size
+        if size > self.max_bytes:
+            log.debug('Data frame is too large to cache: %s (%d bytes)' % (str(key), size))
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (version, df, size)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        """
+        Remove a data frame from the cache; the lock must be held
+        :param key: {tuple} The cache key
+        :return: None
+        """
+        (_, _, size) = self.entries.pop(key)
+        self.size -= size
+
+    def clear(self):
+        """
+        Remove all data frames from the cache
+        :return: None
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Get the cache statistics
+        :return: {dict} Dictionary with hits, misses, evictions, entries, bytes and max_bytes attributes
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self.entries), 'bytes': self.size, 'max_bytes': self.max_bytes}
+
+
+# the data frame cache shared by all requests in this process
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_frame_cache():
+    """
+    Get the data frame cache that is shared by all requests in this process
+    :return: {FrameCache} The data frame cache
+    """
+    global _shared_cache
+
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = FrameCache()
+
+    return _shared_cache
@@ -0,0 +1,128 @@
+"""
+Hand off the aggregated group bulk statistics of a center from a partial request to the full
+request as an Arrow IPC file.  The file is written to and read from memory (or memory-mapped from a
+local file), so no temporary files or pickles are needed, and the schema of the data is checked on
+both sides, so data from an incompatible build is rejected instead of being misread.  Arrow IPC
+requires the optional pyarrow package.
+"""
+
+# increase when the layout of the handoff changes
+version = '1'
+
+# the index levels and columns of the handoff data frame, in order
+index_names = ['DATETIME', 'PLATFORM']
+columns = ['TotImp', 'ObCnt', 'ObCntBen', 'ObCntNeu']
+
+# schema metadata key with the handoff version
+version_key = b'fsoi.frame_ipc.version'
+
+
+class SchemaError(ValueError):
+    """
+    The data do not have the expected handoff schema
+    """
+
+
+def get_schema():
+    """
+    Get the Arrow schema of a handoff
+    :return: {pyarrow.Schema} The schema, including the handoff version in the metadata
+    """
+    import pyarrow as pa
+
+    fields = [pa.field('DATETIME', pa.timestamp('ns')), pa.field('PLATFORM', pa.string())]
+    fields += [pa.field(column, pa.float64()) for column in columns]
+
+    return pa.schema(fields, metadata={version_key: version.encode()})
+
+
+def check_schema(schema):
+    """
+    Check that data have the handoff schema and version
+    :param schema: {pyarrow.Schema} The schema of the data
+    :return: None, raise SchemaError if the schema is different
+    """
+    expected = get_schema()
+    found_version = (schema.metadata or {}).get(version_key, b'none').decode()
+    if found_version != version:
+        raise SchemaError('Handoff version %s is not the expected version %s' % (found_version, version))
+    if not schema.remove_metadata().equals(expected.remove_metadata()):
+        raise SchemaError('Handoff schema is not the expected schema:\n%s\nexpected:\n%s' %
+                          (schema.remove_metadata(), expected.remove_metadata()))
+
+
+def to_ipc(df):
+    """
+    Write a data frame to an Arrow IPC file in memory
+    :param df: {pandas.DataFrame} Statistics with DATETIME and PLATFORM index levels; other index levels
+                                  are dropped
+    :return: {pyarrow.Buffer} The Arrow IPC file, which supports the buffer protocol
+    """
+    import pyarrow as pa
+
+    schema = get_schema()
+    try:
+        table = pa.Table.from_pandas(df.reset_index()[index_names + columns], schema=schema, preserve_index=False)
+    except (KeyError, pa.ArrowException) as e:
+        raise SchemaError('Data frame does not match the handoff schema: %s' % e)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue()
+
+
+def open_ipc(buffer):
+    """
+    Open a readable stream over an Arrow IPC file in memory, without copying it
+    :param buffer: {pyarrow.Buffer} The Arrow IPC file from to_ipc
+    :return: {pyarrow.BufferReader} An object with a read(size) method
+    """
+    import pyarrow as pa
+
+    return pa.BufferReader(buffer)
+
+
+def from_ipc(buffer):
+    """
+    Read a data frame from an Arrow IPC file in memory
+    :param buffer: {bytes} The Arrow IPC file, or any object that supports the buffer protocol
+    :return: {pandas.DataFrame} Statistics with DATETIME and PLATFORM index levels
+    """
+    import pyarrow as pa
+
+    try:
+        reader = pa.ipc.open_file(pa.py_buffer(buffer))
+    except pa.ArrowInvalid as e:
+        raise SchemaError('Data are not an Arrow IPC file: %s' % e)
+
+    return _to_frame(reader)
+
+
+def read_ipc_file(fname):
+    """
+    Read a data frame from a memory-mapped Arrow IPC file
+    :param fname: {str} Full path to the file
+    :return: {pandas.DataFrame} Statistics with DATETIME and PLATFORM index levels
+    """
+    import pyarrow as pa
+
+    # the memory map stays open while the data frame uses it
+    try:
+        reader = pa.ipc.open_file(pa.memory_map(fname, 'r'))
+    except pa.ArrowInvalid as e:
+        raise SchemaError('File is not an Arrow IPC file: %s (%s)' % (fname, e))
+
+    return _to_frame(reader)
+
+
+def _to_frame(reader):
+    """
+    Check the schema of an Arrow IPC file and convert it to a data frame
+    :param reader: {pyarrow.ipc.RecordBatchFileReader} The reader
+    :return: {pandas.DataFrame} Statistics with DATETIME and PLATFORM index levels
+    """
+    check_schema(reader.schema)
+
+    return reader.read_all().to_pandas().set_index(index_names)
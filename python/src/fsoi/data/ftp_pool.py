@@ -0,0 +1,164 @@
+"""
+A pool of authenticated FTP sessions.  Sessions are kept open and reused for many files, several
+files are downloaded in parallel (one session per thread), and a transfer that fails part way is
+resumed from the end of the partial local file with the FTP REST command.
+"""
+
+import os
+import queue
+import threading
+import ftplib
+from ftplib import FTP
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from fsoi import log
+
+
+class FtpConnectionPool:
+    """
+    A pool of FTP sessions to a single host
+    """
+
+    def __init__(self, host, username=None, password=None, size=4, port=21, timeout=60, retries=3):
+        """
+        Create a pool; sessions are opened when they are first needed
+        :param host: {str} The FTP host name
+        :param username: {str} The user name, or None to login anonymously
+        :param password: {str} The password, or None to login anonymously
+        :param size: {int} Maximum number of open sessions, which is also the number of parallel downloads
+        :param port: {int} The FTP port
+        :param timeout: {int} Socket timeout in seconds
+        :param retries: {int} Number of times to retry (and resume) a failed download
+        """
+        self.host = host
+        self.username = username
+        self.password = password
+        self.size = size
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        """
+        Open and login a new session
+        :return: {ftplib.FTP} The session
+        """
+        ftp = FTP()
+        ftp.connect(self.host, self.port, timeout=self.timeout)
+        if self.username is not None:
+            ftp.login(user=self.username, passwd=self.password)
+        else:
+            ftp.login()
+        ftp.set_pasv(True)
+        ftp.voidcmd('TYPE I')
+
+        return ftp
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a session from the pool, opening a new one if no idle session is alive
+        :return: {ftplib.FTP} The session, which goes back to the pool when the context exits
+        """
+        self.slots.acquire()
+        ftp = None
+        try:
+            while ftp is None and not self.idle.empty():
+                ftp = self.idle.get_nowait()
+                try:
+                    ftp.voidcmd('NOOP')
+                except ftplib.all_errors:
+                    self._close(ftp)
+                    ftp = None
+            if ftp is None:
+                ftp = self._connect()
+
+            yield ftp
+
+            # only sessions that finished without an error are reused
+            self.idle.put(ftp)
+            ftp = None
+
+        finally:
+            if ftp is not None:
+                self._close(ftp)
+            self.slots.release()
+
+    @staticmethod
+    def _close(ftp):
+        """
+        Close a session, ignoring errors
+        :param ftp: {ftplib.FTP} The session
+        :return: None
+        """
+        try:
+            ftp.quit()
+        except ftplib.all_errors:
+            ftp.close()
+
+    def download(self, remote_file, local_file):
+        """
+        Download a file, resuming from the end of an existing partial local file
+        :param remote_file: {str} Path to the remote file
+        :param local_file: {str} Full path to the local file
+        :return: {bool} True if successful, otherwise False
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with self.connection() as ftp:
+                    remote_size = ftp.size(remote_file)
+                    offset = os.path.getsize(local_file) if os.path.exists(local_file) else 0
+
+                    # start over if the local file is not a prefix of the remote file
+                    if remote_size is not None and offset > remote_size:
+                        offset = 0
+
+                    if remote_size is None or offset < remote_size:
+                        if offset > 0:
+                            log.info('resuming ftp://%s/%s at byte %d' % (self.host, remote_file, offset))
+                        with open(local_file, 'ab' if offset > 0 else 'wb') as out:
+                            ftp.retrbinary('RETR ' + remote_file, out.write, rest=offset if offset > 0 else None)
+
+                    if remote_size is not None and os.path.getsize(local_file) != remote_size:
+                        raise IOError('Downloaded %d of %d bytes' % (os.path.getsize(local_file), remote_size))
+
+                return True
+
+            except (IOError, EOFError) + ftplib.all_errors as e:
+                # a missing file will not appear by retrying
+                if isinstance(e, ftplib.error_perm) and str(e).startswith('550'):
+                    log.error('File not found: ftp://%s/%s' % (self.host, remote_file))
+                    return False
+                log.warning('Failed to download ftp://%s/%s (attempt %d)' % (self.host, remote_file, attempt + 1))
+                log.warning(e)
+
+        log.error('Failed to download ftp://%s/%s' % (self.host, remote_file))
+        return False
+
+    def download_many(self, files):
+        """
+        Download several files in parallel, one session per thread
+        :param files: {list} List of (remote file, local file) tuples
+        :return: {list} List of download results (True or False), in the order of the files
+        """
+        if not files:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.size, len(files))) as executor:
+            return list(executor.map(lambda f: self.download(*f), files))
+
+    def close(self):
+        """
+        Close all idle sessions
+        :return: None
+        """
+        while not self.idle.empty():
+            self._close(self.idle.get_nowait())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -11,6 +11,8 @@ import tempfile
 import pkgutil
 import yaml
 from ftplib import FTP
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
 from fsoi.data.datastore import DataStore
 from fsoi import log
 
@@ -24,6 +26,28 @@ class S3DataStore(DataStore):
     # the static s3 client
     s3_client = None
 
+    def __init__(self, multipart_threshold=None, multipart_chunksize=None, max_concurrency=None,
+                 stream_concurrency=None):
+        """
+        Create the transfer configuration; parameters that are None use the values in datastore.yaml
+        :param multipart_threshold: {int} Use multipart transfers for objects at least this many bytes
+        :param multipart_chunksize: {int} Size of each part in bytes
+        :param max_concurrency: {int} Number of threads transferring parts of a file, or byte ranges
+        :param stream_concurrency: {int} Number of parts of a stream in memory while it is uploaded
+        """
+        config = yaml.full_load(pkgutil.get_data('fsoi', 'data/datastore.yaml'))['fsoi']['s3']['transfer']
+        self.multipart_threshold = config['multipart_threshold'] if multipart_threshold is None else multipart_threshold
+        self.multipart_chunksize = config['multipart_chunksize'] if multipart_chunksize is None else multipart_chunksize
+        self.max_concurrency = config['max_concurrency'] if max_concurrency is None else max_concurrency
+        self.stream_concurrency = config['stream_concurrency'] if stream_concurrency is None else stream_concurrency
+
+        self.transfer_config = TransferConfig(multipart_threshold=self.multipart_threshold,
+                                              multipart_chunksize=self.multipart_chunksize,
+                                              max_concurrency=self.max_concurrency)
+        self.stream_transfer_config = TransferConfig(multipart_threshold=self.multipart_chunksize,
+                                                     multipart_chunksize=self.multipart_chunksize,
+                                                     max_concurrency=self.stream_concurrency)
+
     @staticmethod
     def _validate_descriptor(descriptor):
         """
@@ -84,6 +108,15 @@ class S3DataStore(DataStore):
             S3DataStore.s3_client = boto3.client('s3')
         return S3DataStore.s3_client
 
+    @staticmethod
+    def _is_missing(error):
+        """
+        Check if an error from S3 means that the object does not exist
+        :param error: {botocore.exceptions.ClientError} The error
+        :return: {bool} True if the object does not exist
+        """
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
     @staticmethod
     def get_suggested_file_name(descriptor):
         """
@@ -234,7 +267,7 @@ class S3DataStore(DataStore):
             s3_client = self.__get_s3_client()
 
             # upload the data to S3
-            s3_client.upload_file(Filename=local_file, Bucket=bucket, Key=key)
+            s3_client.upload_file(Filename=local_file, Bucket=bucket, Key=key, Config=self.transfer_config)
 
             # check to see if the target exists
             return self.data_exist(target)
@@ -243,6 +276,34 @@ class S3DataStore(DataStore):
             log.error('Failed to save data from local file: %s' % local_file)
             return False
 
+    def save_from_stream(self, stream, target):
+        """
+        Save data to the data store from a readable binary stream with a multipart upload, so only
+        a few parts are in memory at a time
+        :param stream: {file} An object with a read(size) method, e.g. an HTTP response
+        :param target: {dict} A dictionary with attributes to describe the data store target
+        :return: {bool} True if successful, otherwise False
+        """
+        try:
+            # validate the target descriptor
+            if not self._validate_descriptor(target):
+                return False
+
+            # ensure that the target has bucket and key attributes
+            bucket, key = self._to_bucket_and_key(target)
+
+            # get an S3 client
+            s3_client = self.__get_s3_client()
+
+            # upload the data to S3 one part at a time
+            s3_client.upload_fileobj(Fileobj=stream, Bucket=bucket, Key=key, Config=self.stream_transfer_config)
+            return True
+
+        except Exception as e:
+            log.error('Failed to save data from stream: s3://%s/%s' % self._to_bucket_and_key(target))
+            log.error(e)
+            return False
+
     def load_to_local_file(self, source, local_file):
         """
         Load data from the data store to a local file
@@ -256,10 +317,6 @@ class S3DataStore(DataStore):
             if not self._validate_descriptor(source):
                 return False
 
-            # verify that the data exist
-            if not self.data_exist(source):
-                return False
-
             # get the bucket and key from the descriptor
             bucket, key = self._to_bucket_and_key(source)
 
@@ -270,8 +327,14 @@ class S3DataStore(DataStore):
             # get the S3 client
             s3_client = self.__get_s3_client()
 
-            # download the data from S3 to a file
-            s3_client.download_file(Bucket=bucket, Key=key, Filename=local_file)
+            # download the data from S3 to a file, with large files in parallel parts
+            try:
+                s3_client.download_file(Bucket=bucket, Key=key, Filename=local_file, Config=self.transfer_config)
+            except botocore.exceptions.ClientError as ce:
+                if self._is_missing(ce):
+                    log.debug('Data do not exist: s3://%s/%s' % (bucket, key))
+                    return False
+                raise
 
             # check that the file was created
             return os.path.exists(local_file)
@@ -279,6 +342,54 @@ class S3DataStore(DataStore):
         except Exception as e:
             log.error('Failed to download data to local file')
             print(e)
+            return False
+
+    def load_to_local_file_if_changed(self, source, local_file, etag=None):
+        """
+        Load data from the data store to a local file with a conditional request, unless the
+        object still has the given ETag
+        :param source: {dict} A dictionary with attributes to describe the data store source
+        :param local_file: {str} Full path to the local file, which is only written if the ETag changed
+        :param etag: {str} The ETag of a copy of the object that is already available, or None
+        :return: {str} The ETag of the object, None if the data do not exist, or False if the request failed
+        """
+        try:
+            # validate the source descriptor
+            if not self._validate_descriptor(source):
+                return False
+
+            # get the bucket and key from the descriptor
+            bucket, key = self._to_bucket_and_key(source)
+
+            # get the S3 client
+            s3_client = self.__get_s3_client()
+
+            # get the data unless the ETag matches, which is a 304 response
+            try:
+                if etag is None:
+                    response = s3_client.get_object(Bucket=bucket, Key=key)
+                else:
+                    response = s3_client.get_object(Bucket=bucket, Key=key, IfNoneMatch=etag)
+            except botocore.exceptions.ClientError as ce:
+                if self._is_missing(ce):
+                    log.debug('Data do not exist: s3://%s/%s' % (bucket, key))
+                    return None
+                if ce.response.get('Error', {}).get('Code') == '304':
+                    return etag
+                raise
+
+            # write the data to the local file one part at a time
+            body = response['Body']
+            with open(local_file, 'wb') as fh:
+                for chunk in body.iter_chunks(self.multipart_chunksize):
+                    fh.write(chunk)
+
+            return response['ETag']
+
+        except Exception as e:
+            log.error('Failed to download data to local file')
+            log.error(e)
+            return False
 
     def load(self, source):
         """
@@ -286,33 +397,72 @@ class S3DataStore(DataStore):
         :param source: {dict} A dictionary with attributes to describe the data store source
         :return: {bytes} S3 data, or None if unsuccessful
         """
+        return self.load_range(source, 0)
+
+    def load_range(self, source, start, end=None):
+        """
+        Load a range of bytes from the data store to memory
+        :param source: {dict} A dictionary with attributes to describe the data store source
+        :param start: {int} Offset of the first byte, or a negative number to load the last -start bytes
+        :param end: {int} Offset after the last byte, or None to load to the end of the data
+        :return: {bytes} S3 data, or None if unsuccessful, the data do not exist or the range is empty
+        """
         try:
             # validate the source descriptor
             if not self._validate_descriptor(source):
-                return False
-
-            # verify that the data exist
-            if not self.data_exist(source):
-                return False
+                return None
 
             # get the bucket and key from the descriptor
             bucket, key = self._to_bucket_and_key(source)
 
+            # create the HTTP range header (the end of the range is inclusive)
+            if end is not None and end <= start:
+                return None
+            if start < 0:
+                byte_range = 'bytes=%d' % start
+            elif end is None:
+                byte_range = None if start == 0 else 'bytes=%d-' % start
+            else:
+                byte_range = 'bytes=%d-%d' % (start, end - 1)
+
             # get the S3 client
             s3_client = self.__get_s3_client()
 
-            # download the data from S3 to a file
-            from io import BytesIO
-            bio = BytesIO()
-            s3_client.download_fileobj(Bucket=bucket, Key=key, Fileobj=bio)
+            # get the data with a single request; a missing object is a 404 response
+            try:
+                if byte_range is None:
+                    response = s3_client.get_object(Bucket=bucket, Key=key)
+                else:
+                    response = s3_client.get_object(Bucket=bucket, Key=key, Range=byte_range)
+            except botocore.exceptions.ClientError as ce:
+                if self._is_missing(ce):
+                    log.debug('Data do not exist: s3://%s/%s' % (bucket, key))
+                    return None
+                if ce.response.get('Error', {}).get('Code') == 'InvalidRange':
+                    return None
+                raise
 
             # check that there was data returned
-            data = bio.getvalue()
+            data = response['Body'].read()
             return None if len(data) == 0 else data
 
         except Exception as e:
-            log.error('Failed to download data to local file')
+            log.error('Failed to load data from data store')
             print(e)
+            return None
+
+    def load_ranges(self, source, ranges):
+        """
+        Load several ranges of bytes from the data store to memory in parallel
+        :param source: {dict} A dictionary with attributes to describe the data store source
+        :param ranges: {list} List of (start, end) tuples, as for load_range
+        :return: {list} S3 data (or None) for each range, in the order of the ranges
+        """
+        if not ranges:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(ranges))) as executor:
+            return list(executor.map(lambda r: self.load_range(source, *r), ranges))
 
     def list_data_store(self, filters):
         """
@@ -355,6 +505,150 @@ class S3DataStore(DataStore):
             log.error('Failed to list data store')
             return None
 
+    def list_prefix(self, bucket, prefix):
+        """
+        List the keys in a bucket that start with a prefix
+        :param bucket: {str} The bucket name
+        :param prefix: {str} The key prefix
+        :return: {set} Set of keys, or None if the request failed
+        """
+        try:
+            s3_client = self.__get_s3_client()
+            keys = set()
+            for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+                keys.update(item['Key'] for item in page.get('Contents', []))
+
+            return keys
+
+        except Exception as e:
+            log.error('Failed to list s3://%s/%s' % (bucket, prefix))
+            log.error(e)
+            return None
+
+    def list_prefix_etags(self, bucket, prefix):
+        """
+        List the keys in a bucket that start with a prefix, with the ETag of each object
+        :param bucket: {str} The bucket name
+        :param prefix: {str} The key prefix
+        :return: {dict} Dictionary of key to ETag, or None if the request failed
+        """
+        try:
+            s3_client = self.__get_s3_client()
+            etags = {}
+            for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+                etags.update((item['Key'], item['ETag']) for item in page.get('Contents', []))
+
+            return etags
+
+        except Exception as e:
+            log.error('Failed to list s3://%s/%s' % (bucket, prefix))
+            log.error(e)
+            return None
+
+    @staticmethod
+    def _group_keys(keys, max_prefixes):
+        """
+        Group keys by prefix, so that listing the prefixes finds all of the keys with few requests:
+        start with one prefix per directory, then split the shortest prefixes while the number of
+        prefixes is within the limit
+        :param keys: {list} List of keys
+        :param max_prefixes: {int} Maximum number of prefixes, unless there are more directories
+        :return: {dict} Dictionary of prefix to list of keys
+        """
+        directories = {}
+        for key in keys:
+            directories.setdefault(key[:key.rfind('/') + 1], []).append(key)
+        groups = {os.path.commonprefix(members): members for members in directories.values()}
+
+        split = True
+        while split:
+            split = False
+            for prefix in sorted(groups, key=len):
+                children = {}
+                for key in groups[prefix]:
+                    children.setdefault(key[len(prefix):len(prefix) + 1], []).append(key)
+                if len(children) < 2 or len(groups) - 1 + len(children) > max_prefixes:
+                    continue
+
+                del groups[prefix]
+                for members in children.values():
+                    groups[os.path.commonprefix(members)] = members
+                split = True
+                break
+
+        return groups
+
+    def exists_many(self, targets, max_prefixes=8):
+        """
+        Check if each of the specified targets exists, with a few list requests instead of one
+        request per target
+        :param targets: {list} List of dictionaries that describe data store targets
+        :param max_prefixes: {int} Maximum number of prefixes listed per bucket and directory
+        :return: {list} True or False for each target, in the order of the targets
+        """
+        # get the bucket and key of each valid target
+        names = [self._to_bucket_and_key(target) if self._validate_descriptor(target) else None
+                 for target in targets]
+
+        buckets = {}
+        for name in names:
+            if name is not None:
+                buckets.setdefault(name[0], set()).add(name[1])
+
+        # list the keys that exist in each bucket
+        found = set()
+        for (bucket, keys) in buckets.items():
+            for prefix in self._group_keys(sorted(keys), max_prefixes):
+                listed = self.list_prefix(bucket, prefix)
+                if listed is None:
+                    # fall back to checking the targets one at a time
+                    listed = {key for key in keys if key.startswith(prefix) and
+                              self.data_exist({'bucket': bucket, 'key': key})}
+                found.update((bucket, key) for key in listed)
+
+        return [name is not None and tuple(name) in found for name in names]
+
+    def etags_many(self, targets, max_prefixes=8):
+        """
+        Get the ETag of each of the specified targets, with a few list requests instead of one
+        request per target
+        :param targets: {list} List of dictionaries that describe data store targets
+        :param max_prefixes: {int} Maximum number of prefixes listed per bucket and directory
+        :return: {list} The ETag of each target, or None if the target does not exist, in the order of the targets
+        """
+        # get the bucket and key of each valid target
+        names = [self._to_bucket_and_key(target) if self._validate_descriptor(target) else None
+                 for target in targets]
+
+        buckets = {}
+        for name in names:
+            if name is not None:
+                buckets.setdefault(name[0], set()).add(name[1])
+
+        # list the keys and ETags that exist in each bucket
+        found = {}
+        for (bucket, keys) in buckets.items():
+            for prefix in self._group_keys(sorted(keys), max_prefixes):
+                listed = self.list_prefix_etags(bucket, prefix)
+                if listed is None:
+                    # fall back to checking the targets one at a time
+                    listed = {key: self._head_etag(bucket, key) for key in keys if key.startswith(prefix)}
+                found.update(((bucket, key), etag) for (key, etag) in listed.items())
+
+        return [None if name is None else found.get(tuple(name)) for name in names]
+
+    def _head_etag(self, bucket, key):
+        """
+        Get the ETag of an object with a head request
+        :param bucket: {str} The bucket name
+        :param key: {str} The key
+        :return: {str} The ETag, or None if the object does not exist
+        """
+        try:
+            return self.__get_s3_client().head_object(Bucket=bucket, Key=key)['ETag']
+        except botocore.exceptions.ClientError:
+            return None
+
     def data_exist(self, target):
         """
         Check if the specified target exists
@@ -427,6 +721,63 @@ class S3DataStore(DataStore):
             log.error('Failed to delete target: s3://%s/%s' % self._to_bucket_and_key(target), e)
             return False
 
+    def copy(self, source, target):
+        """
+        Copy data within S3 without downloading it
+        :param source: {dict} A dictionary with attributes to describe the data store source
+        :param target: {dict} A dictionary with attributes to describe the data store target
+        :return: {bool} True if successful, otherwise False
+        """
+        try:
+            # validate the descriptors
+            if not self._validate_descriptor(source) or not self._validate_descriptor(target):
+                return False
+
+            # get the bucket and key of the source and target
+            source_bucket, source_key = self._to_bucket_and_key(source)
+            bucket, key = self._to_bucket_and_key(target)
+
+            # copy the object on the server
+            s3_client = self.__get_s3_client()
+            s3_client.copy_object(Bucket=bucket, Key=key, CopySource={'Bucket': source_bucket, 'Key': source_key})
+            return True
+
+        except Exception as e:
+            log.error('Failed to copy s3://%s/%s' % self._to_bucket_and_key(source), e)
+            return False
+
+    def delete_many(self, targets):
+        """
+        Delete each of the specified targets, with one request per 1000 targets in a bucket instead of
+        one request per target.  Targets that do not exist are deleted successfully.
+        :param targets: {list} List of dictionaries that describe data store targets
+        :return: {list} True or False for each target, in the order of the targets
+        """
+        # get the bucket and key of each valid target
+        names = [self._to_bucket_and_key(target) if self._validate_descriptor(target) else None
+                 for target in targets]
+
+        buckets = {}
+        for name in names:
+            if name is not None:
+                buckets.setdefault(name[0], []).append(name[1])
+
+        # delete the keys in each bucket
+        failed = set()
+        s3_client = self.__get_s3_client()
+        for (bucket, keys) in buckets.items():
+            for i in range(0, len(keys), 1000):
+                batch = keys[i:i + 1000]
+                try:
+                    response = s3_client.delete_objects(
+                        Bucket=bucket, Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+                    failed.update((bucket, error['Key']) for error in response.get('Errors', []))
+                except Exception as e:
+                    log.error('Failed to delete %d targets from s3://%s' % (len(batch), bucket), e)
+                    failed.update((bucket, key) for key in batch)
+
+        return [name is not None and tuple(name) not in failed for name in names]
+
 
 class FsoiS3DataStore(S3DataStore):
     """
@@ -481,9 +832,13 @@ class FsoiS3DataStore(S3DataStore):
         # construct the type of file: None, groupbulk, bulk, or accumbulk
         data_type = descriptor['type'] + ('.' if descriptor['type'] is not '' else '')
 
+        # select the key template for the storage format: hdf5 (default) or parquet
+        storage_format = descriptor.get('format', 'hdf5')
+        key_template = config['key'] if storage_format == 'hdf5' else config['%s_key' % storage_format]
+
         # create the key based on 'date' and 'hour' in the descriptor
         if 'date' in descriptor and 'hour' in descriptor:
-            key = config['key'] % (
+            key = key_template % (
                 descriptor['center'],
                 data_type,
                 descriptor['center'],
@@ -497,7 +852,7 @@ class FsoiS3DataStore(S3DataStore):
         if 'datetime' in descriptor:
             date = descriptor['datetime'][:8]
             hour = descriptor['datetime'][8:10]
-            key = config['key'] % (
+            key = key_template % (
                 descriptor['center'],
                 data_type,
                 descriptor['center'],
@@ -510,7 +865,7 @@ class FsoiS3DataStore(S3DataStore):
         return None
 
     @staticmethod
-    def create_descriptor(center=None, norm=None, date=None, hour=None, datetime=None, type=None):
+    def create_descriptor(center=None, norm=None, date=None, hour=None, datetime=None, type=None, format=None):
         """
         Convenience method to create a descriptor
         :param center: {str} The center name (NRL, GMAO, MET, MeteoFr, EMC, JMA_adj, or JMA_ens)
@@ -519,6 +874,7 @@ class FsoiS3DataStore(S3DataStore):
         :param hour: {str} Hour string (00, 06, 12, or 18) (not compatible with datetime parameter)
         :param datetime: {str} Date/Time String YYYYMMDDHH (not compatible with date or hour parameters)
         :param type: {str} The statistics type: None, groupbulk, accumbulk, or bulk
+        :param format: {str} The storage format: None (hdf5), hdf5, or parquet
         :return: Descriptor with given parameters
         """
         # check that options are compatible
@@ -540,6 +896,10 @@ class FsoiS3DataStore(S3DataStore):
         # set the type value
         descriptor['type'] = type if type is not None else ''
 
+        # set the storage format if it was specified
+        if format is not None:
+            descriptor['format'] = format
+
         return descriptor
 
     @staticmethod
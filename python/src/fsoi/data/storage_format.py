@@ -0,0 +1,182 @@
+"""
+Storage formats used to write and read FSOI data frames.  HDF5 is the default format; Parquet may
+be selected per deployment with the storage_format value in datastore.yaml, or with the
+FSOI_STORAGE_FORMAT environment variable.  Parquet requires the optional pyarrow package.
+"""
+
+import os
+import yaml
+import pkgutil
+import pandas as pd
+from fsoi import log
+from fsoi.stats import lib_utils
+
+
+class StorageFormat:
+    """
+    Abstract class that defines how a data frame is written to and read from a file
+    """
+    # name of the format, used in configuration and in data descriptors
+    name = None
+
+    # file name extension
+    extension = None
+
+    def write(self, fname, data):
+        """
+        Write a data frame to a file
+        :param fname: {str} Full path to the file
+        :param data: {pandas.DataFrame} The data frame
+        :return: None
+        """
+        raise NotImplementedError('write not implemented')
+
+    def read(self, fname, columns=None, filters=None):
+        """
+        Read a data frame from a file
+        :param fname: {str} Full path to the file
+        :param columns: {list} Only read these columns (index levels are always read), or None for all
+        :param filters: {dict} Only read rows where each named index level or column has one of the
+                               listed values, e.g. {'PLATFORM': ['Radiosonde', 'Aircraft']}
+        :return: {pandas.DataFrame} The data frame
+        """
+        raise NotImplementedError('read not implemented')
+
+
+class Hdf5StorageFormat(StorageFormat):
+    """
+    Store data frames in PyTables HDF5 files with coded index levels
+    """
+    name = 'hdf5'
+    extension = 'h5'
+
+    def write(self, fname, data):
+        """
+        Write a data frame to an HDF5 file
+        :param fname: {str} Full path to the file
+        :param data: {pandas.DataFrame} The data frame
+        :return: None
+        """
+        lib_utils.writeHDF(fname, 'df', data, complevel=1, complib='zlib', fletcher32=True, coded=True)
+
+    def read(self, fname, columns=None, filters=None):
+        """
+        Read a data frame from an HDF5 file
+        :param fname: {str} Full path to the file
+        :param columns: {list} Only read these columns (index levels are always read), or None for all
+        :param filters: {dict} Only read rows where each named index level or column has one of the
+                               listed values
+        :return: {pandas.DataFrame} The data frame
+        """
+        kwargs = {}
+        if columns is not None:
+            kwargs['columns'] = columns
+        if filters:
+            kwargs['where'] = self._filters_to_where(filters)
+
+        data = lib_utils.readHDF(fname, 'df', **kwargs)
+
+        # a filter without values matches nothing
+        if filters and not all(len(filters[name]) > 0 for name in filters):
+            data = data.iloc[:0]
+
+        return data
+
+    @staticmethod
+    def _filters_to_where(filters):
+        """
+        Convert filters to a list of PyTables where conditions
+        :param filters: {dict} Named index level or column to a list of values
+        :return: {list} List of where conditions
+        """
+        where = []
+        for name in filters:
+            terms = []
+            for value in filters[name]:
+                if isinstance(value, str):
+                    terms.append('%s="%s"' % (name, value))
+                else:
+                    terms.append('%s=%s' % (name, value))
+            if terms:
+                where.append('(%s)' % ' | '.join(terms))
+
+        return where
+
+
+class ParquetStorageFormat(StorageFormat):
+    """
+    Store data frames in Parquet files.  Index levels are stored as dictionary encoded columns, so
+    filters on them skip row groups and rows without reading the other columns.
+    """
+    name = 'parquet'
+    extension = 'parquet'
+
+    def write(self, fname, data):
+        """
+        Write a data frame to a Parquet file
+        :param fname: {str} Full path to the file
+        :param data: {pandas.DataFrame} The data frame
+        :return: None
+        """
+        log.debug('writing ... %s' % fname)
+        data.to_parquet(fname, engine='pyarrow', compression='zstd', index=True)
+
+    def read(self, fname, columns=None, filters=None):
+        """
+        Read a data frame from a Parquet file
+        :param fname: {str} Full path to the file
+        :param columns: {list} Only read these columns (index levels are always read), or None for all
+        :param filters: {dict} Only read rows where each named index level or column has one of the
+                               listed values
+        :return: {pandas.DataFrame} The data frame
+        """
+        log.debug('reading ... %s' % fname)
+        kwargs = {}
+        terms = [(name, 'in', list(filters[name])) for name in filters or {} if len(filters[name]) > 0]
+        if terms:
+            kwargs['filters'] = terms
+
+        data = pd.read_parquet(fname, engine='pyarrow', columns=columns, **kwargs)
+
+        # a filter without values matches nothing
+        if filters and not all(len(filters[name]) > 0 for name in filters):
+            data = data.iloc[:0]
+
+        return data
+
+
+# the available storage formats
+storage_formats = {storage_format.name: storage_format for storage_format in [Hdf5StorageFormat, ParquetStorageFormat]}
+
+
+def get_storage_format(name=None):
+    """
+    Get a storage format by name, or the storage format selected for this deployment
+    :param name: {str} Name of the storage format (hdf5 or parquet), or None for the deployment default
+    :return: {StorageFormat} The storage format, or None if the name is unknown
+    """
+    if name is None:
+        name = os.environ.get('FSOI_STORAGE_FORMAT')
+    if name is None:
+        config = yaml.full_load(pkgutil.get_data('fsoi', 'data/datastore.yaml'))
+        name = config['fsoi'].get('storage_format', Hdf5StorageFormat.name)
+
+    if name not in storage_formats:
+        log.error('Unknown storage format: %s' % name)
+        return None
+
+    return storage_formats[name]()
+
+
+def get_storage_format_for_file(fname):
+    """
+    Get the storage format of a file from its extension
+    :param fname: {str} Name of the file
+    :return: {StorageFormat} The storage format, or None if the extension is unknown
+    """
+    for storage_format in storage_formats.values():
+        if fname.endswith('.' + storage_format.extension):
+            return storage_format()
+
+    log.error('Unknown storage format for file: %s' % fname)
+    return None
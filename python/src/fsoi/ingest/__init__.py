@@ -1,7 +1,7 @@
 """
 FSOI Ingest
 """
-__all__ = ['emc', 'gmao', 'jma', 'met', 'meteofr', 'nrl', 'compute_date_from_lag']
+__all__ = ['emc', 'gmao', 'jma', 'met', 'meteofr', 'nrl', 'fixed_width', 'line_batches', 'parallel_bz2', 'rollup', 'cube', 'backfill', 'compute_date_from_lag']
 
 
 from datetime import datetime
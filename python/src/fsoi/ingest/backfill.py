@@ -0,0 +1,460 @@
+"""
+Reprocess the history of one or more centers.  Each (center, norm, date) is a task that runs in a
+pool of processes; only a bounded number of tasks are queued at a time, failed tasks are retried
+with an increasing delay, and the outcome of every task is appended to a journal file so that an
+interrupted backfill can be resumed without repeating the tasks that were already done.
+"""
+
+import os
+import json
+import time
+import heapq
+import yaml
+import pkgutil
+import tempfile
+import shutil
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from argparse import ArgumentParser
+from argparse import ArgumentDefaultsHelpFormatter as FormatHelper
+from fsoi import log
+from fsoi.data.s3_datastore import S3DataStore
+from fsoi.ingest.rollup import get_periods, rebuild_rollup
+from fsoi.ingest.cube import rebuild_cube
+
+
+# norms available for each center
+center_norms = {'NRL': ['dry'], 'MET': ['moist'], 'GMAO': ['dry', 'moist'], 'MERRA': ['dry', 'moist']}
+
+# cycles available for each center
+center_cycles = {'NRL': [0], 'MET': [0, 6, 12, 18], 'GMAO': [0, 6, 12, 18], 'MERRA': [0, 6, 12, 18]}
+
+
+def _ingest_nrl(norm, date, path=None):
+    """
+    Download a raw NRL file from S3, process it and upload the results
+    :param norm: {str} The norm (NRL only has dry)
+    :param date: {str} Date and cycle YYYYMMDDHH
+    :param path: {str} Not used
+    :return: {bool} True if successful, otherwise False
+    """
+    from fsoi.ingest.nrl.process_nrl import process_nrl
+
+    config = yaml.full_load(pkgutil.get_data('fsoi', 'ingest/nrl/nrl_ingest.yaml'))
+    datastore = S3DataStore()
+    work_dir = tempfile.mkdtemp()
+    try:
+        input_file = '%s/obimpact_gemops_%s.bz2' % (work_dir, date)
+        source = {'bucket': config['raw_data_bucket'], 'key': 'obimpact_gemops_%s.bz2' % date}
+        if not datastore.load_to_local_file(source, input_file):
+            log.error('Raw NRL file is not available: %s' % date)
+            return False
+
+        output_files = process_nrl(input_file, work_dir, 'NRL.%s.%s.h5' % (norm, date), date, workers=1)
+        if not output_files:
+            return False
+
+        ok = True
+        for output_file in output_files:
+            target = {'bucket': config['processed_data_bucket'],
+                      'key': '%s/%s' % (config['processed_data_prefix'], os.path.basename(output_file))}
+            ok = datastore.save_from_local_file(output_file, target) and ok
+
+        return ok
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _ingest_met(norm, date, path=None):
+    """
+    Download a raw MET file from S3, process it and upload the results
+    :param norm: {str} The norm (MET only has moist)
+    :param date: {str} Date and cycle YYYYMMDDHH
+    :param path: {str} Not used
+    :return: {bool} True if successful, otherwise False
+    """
+    from fsoi.ingest.met.process_met import process_met
+
+    config = yaml.full_load(pkgutil.get_data('fsoi', 'ingest/met/met_ingest.yaml'))
+    datastore = S3DataStore()
+    work_dir = tempfile.mkdtemp()
+    try:
+        input_file = '%s/%sT%s00Z.FSO.gz' % (work_dir, date[:8], date[8:])
+        source = {'bucket': config['raw_data_bucket'], 'key': os.path.basename(input_file)}
+        if not datastore.load_to_local_file(source, input_file):
+            log.error('Raw MET file is not available: %s' % date)
+            return False
+
+        return bool(process_met(input_file, work_dir, datetime.strptime(date, '%Y%m%d%H'), date))
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _ingest_gmao(norm, date, path=None):
+    """
+    Process the GMAO files for a cycle from S3 (or a local path) and upload the results
+    :param norm: {str} The norm (dry or moist)
+    :param date: {str} Date and cycle YYYYMMDDHH
+    :param path: {str} Local path to search for files, or None to read the raw files from S3
+    :return: {bool} True if successful, otherwise False
+    """
+    from fsoi.ingest.gmao.process_gmao import process_gmao
+
+    return bool(process_gmao(norm, date, path, workers=1))
+
+
+def _ingest_merra(norm, date, path=None):
+    """
+    Process the MERRA files for a cycle from a local path and upload the results
+    :param norm: {str} The norm (dry or moist)
+    :param date: {str} Date and cycle YYYYMMDDHH
+    :param path: {str} Local path to search for files
+    :return: {bool} True if successful, otherwise False
+    """
+    from fsoi.ingest.merra.process_merra import process_merra
+
+    return bool(process_merra(norm, date, path, workers=1))
+
+
+# function to ingest a single cycle for each center
+ingest_functions = {'NRL': _ingest_nrl, 'MET': _ingest_met, 'GMAO': _ingest_gmao, 'MERRA': _ingest_merra}
+
+
+def ingest_task(center, norm, date, path=None):
+    """
+    Ingest a single cycle for a center
+    :param center: {str} The center name
+    :param norm: {str} The norm (dry or moist)
+    :param date: {str} Date and cycle YYYYMMDDHH
+    :param path: {str} Local path to search for raw files (required for MERRA)
+    :return: {bool} True if successful, otherwise False
+    """
+    return ingest_functions[center](norm, date, path)
+
+
+class BackfillJournal:
+    """
+    Append-only record of the outcome of each backfill task, one JSON document per line
+    """
+
+    def __init__(self, filename):
+        """
+        Open a journal, reading the tasks that are already done
+        :param filename: {str} Full path to the journal file; created if it does not exist
+        """
+        self.filename = filename
+        self.done = set()
+
+        if os.path.exists(filename):
+            with open(filename, 'r') as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # the last line may be incomplete if the backfill was killed
+                        continue
+                    if entry['status'] == 'done':
+                        self.done.add(entry['task'])
+
+        self.fh = open(filename, 'a')
+
+        # finish an incomplete last line
+        if self.fh.tell() > 0:
+            with open(filename, 'rb') as fh:
+                fh.seek(-1, os.SEEK_END)
+                if fh.read(1) != b'\n':
+                    self.fh.write('\n')
+
+    @staticmethod
+    def task_id(task):
+        """
+        Get the identifier of a task in the journal
+        :param task: {tuple} The (center, norm, date) of the task
+        :return: {str} The task identifier
+        """
+        return '/'.join(task)
+
+    def is_done(self, task):
+        """
+        Check if a task is already done
+        :param task: {tuple} The (center, norm, date) of the task
+        :return: {bool} True if the task is done
+        """
+        return self.task_id(task) in self.done
+
+    def record(self, task, status, attempt, message=None):
+        """
+        Record the outcome of a task attempt
+        :param task: {tuple} The (center, norm, date) of the task
+        :param status: {str} 'done' or 'failed'
+        :param attempt: {int} The attempt number, starting at 1
+        :param message: {str} An error message, or None
+        :return: None
+        """
+        entry = {'task': self.task_id(task), 'status': status, 'attempt': attempt,
+                 'time': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')}
+        if message is not None:
+            entry['message'] = message
+        self.fh.write(json.dumps(entry) + '\n')
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+
+        if status == 'done':
+            self.done.add(entry['task'])
+
+    def close(self):
+        """
+        Close the journal file
+        :return: None
+        """
+        self.fh.close()
+
+
+def create_tasks(centers, start_date, end_date, norms=None, cycles=None):
+    """
+    Create the backfill tasks for a date range
+    :param centers: {list} List of center names
+    :param start_date: {str} First date YYYYMMDD (inclusive)
+    :param end_date: {str} Last date YYYYMMDD (inclusive)
+    :param norms: {list} List of norms, or None for all norms of each center
+    :param cycles: {list} List of cycle hours, or None for all cycles of each center
+    :return: {list} List of (center, norm, date) tuples, in date order
+    """
+    tasks = []
+    date = datetime.strptime(start_date, '%Y%m%d')
+    end = datetime.strptime(end_date, '%Y%m%d')
+    while date <= end:
+        for center in centers:
+            for cycle in center_cycles[center] if cycles is None else cycles:
+                for norm in center_norms[center]:
+                    if norms is None or norm in norms:
+                        tasks.append((center, norm, '%s%02d' % (date.strftime('%Y%m%d'), int(cycle))))
+        date += timedelta(days=1)
+
+    return tasks
+
+
+def run_backfill(tasks, journal_file, workers=None, retries=2, retry_delay=60., max_pending=None, path=None,
+                 task_function=ingest_task):
+    """
+    Run backfill tasks in a pool of processes
+    :param tasks: {iterable} The (center, norm, date) tasks
+    :param journal_file: {str} Full path to the journal file; tasks recorded as done are skipped
+    :param workers: {int} Number of worker processes, or None for the number of CPUs
+    :param retries: {int} Number of times to retry a failed task
+    :param retry_delay: {float} Seconds to wait before the first retry; doubled for each retry after
+    :param max_pending: {int} Maximum number of queued and running tasks, or None for twice the workers
+    :param path: {str} Local path to search for raw files, passed to the task function
+    :param task_function: {function} Module level function called with center, norm, date and path
+    :return: {dict} Lists of the tasks that were 'done', 'failed' and 'skipped'
+    """
+    workers = os.cpu_count() if workers is None else workers
+    max_pending = 2 * workers if max_pending is None else max_pending
+    journal = BackfillJournal(journal_file)
+    summary = {'done': [], 'failed': [], 'skipped': []}
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    pending = {}
+    retry = []
+    suspects = []
+    tasks = iter(tasks)
+    more_tasks = True
+
+    def _failed(task, attempt, message):
+        """
+        Record a failed attempt and schedule a retry with an increasing delay, or give up on the task
+        :param task: {tuple} The (center, norm, date) of the task
+        :param attempt: {int} Number of previous attempts
+        :param message: {str} An error message
+        :return: None
+        """
+        journal.record(task, 'failed', attempt + 1, message)
+        if attempt < retries:
+            log.warning('Backfill task failed, retrying: %s (%s)' % (journal.task_id(task), message))
+            heapq.heappush(retry, (time.time() + retry_delay * 2 ** attempt, task, attempt + 1))
+        else:
+            log.error('Backfill task failed: %s (%s)' % (journal.task_id(task), message))
+            summary['failed'].append(task)
+
+    try:
+        while more_tasks or pending or retry or suspects:
+            if suspects:
+                # run the tasks of a broken pool one at a time, so a task that kills its worker is found
+                if not pending:
+                    (task, attempt) = suspects.pop(0)
+                    pending[executor.submit(task_function, *task, path)] = (task, attempt)
+            else:
+                # submit the retries that are due, then keep the queue full
+                while retry and retry[0][0] <= time.time() and len(pending) < max_pending:
+                    (_, task, attempt) = heapq.heappop(retry)
+                    pending[executor.submit(task_function, *task, path)] = (task, attempt)
+                while more_tasks and len(pending) < max_pending:
+                    task = next(tasks, None)
+                    if task is None:
+                        more_tasks = False
+                    elif journal.is_done(task):
+                        summary['skipped'].append(task)
+                    else:
+                        pending[executor.submit(task_function, *task, path)] = (task, 0)
+
+            # wait for a task to finish or for the next retry to be due
+            timeout = None if suspects or not retry else max(0., retry[0][0] - time.time())
+            if not pending:
+                if timeout is not None:
+                    time.sleep(timeout)
+                continue
+            finished, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            # a broken pool fails all of its tasks, so handle all of them together
+            if any(not future.cancelled() and isinstance(future.exception(), BrokenProcessPool)
+                   for future in finished):
+                finished, _ = wait(pending)
+
+            # handle the tasks that finished
+            crashed = []
+            for future in finished:
+                task, attempt = pending.pop(future)
+                try:
+                    ok = future.result()
+                    message = None if ok else 'task returned False'
+                except BrokenProcessPool as e:
+                    crashed.append((task, attempt, 'worker process died: %s' % e))
+                    continue
+                except Exception as e:
+                    ok, message = False, '%s: %s' % (type(e).__name__, e)
+
+                if ok:
+                    journal.record(task, 'done', attempt + 1)
+                    summary['done'].append(task)
+                    log.info('Backfill task done: %s' % journal.task_id(task))
+                else:
+                    _failed(task, attempt, message)
+
+            if not crashed:
+                continue
+
+            # replace a pool that lost a worker process, e.g. to the OOM killer
+            log.warning('Restarting the backfill process pool')
+            executor.shutdown(wait=False, cancel_futures=True)
+            executor = ProcessPoolExecutor(max_workers=workers)
+
+            # only a task that ran alone is known to have killed its worker; the others are run again
+            # without counting the attempt
+            if len(crashed) == 1:
+                _failed(*crashed[0])
+            else:
+                suspects += [(task, attempt) for (task, attempt, _) in crashed]
+
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        journal.close()
+
+    log.info('Backfill: %d done, %d failed, %d skipped' %
+             (len(summary['done']), len(summary['failed']), len(summary['skipped'])))
+
+    return summary
+
+
+def _rebuild_rollup(rollup):
+    """
+    Rebuild a rollup in a worker process
+    :param rollup: {tuple} The (center, norm, cycle, period) of the rollup
+    :return: {bool} True if successful, otherwise False
+    """
+    return rebuild_rollup(*rollup)
+
+
+def rebuild_rollups(tasks, workers=None):
+    """
+    Rebuild the month and season rollups that contain the given tasks
+    :param tasks: {list} List of (center, norm, date) tuples
+    :param workers: {int} Number of worker processes, or None for the number of CPUs
+    :return: {list} List of (center, norm, cycle, period) tuples that failed to rebuild
+    """
+    rollups = []
+    for (center, norm, date) in tasks:
+        for period in get_periods(date):
+            rollup = (center, norm, int(date[8:10]), period)
+            if rollup not in rollups:
+                rollups.append(rollup)
+
+    with ProcessPoolExecutor(max_workers=os.cpu_count() if workers is None else workers) as executor:
+        results = list(executor.map(_rebuild_rollup, rollups))
+
+    return [rollup for (rollup, ok) in zip(rollups, results) if not ok]
+
+
+def _rebuild_cube(cube):
+    """
+    Rebuild a month of the comparison cube in a worker process
+    :param cube: {tuple} The (center, norm, month) of the cube object
+    :return: {bool} True if successful, otherwise False
+    """
+    return rebuild_cube(*cube)
+
+
+def rebuild_cubes(tasks, workers=None):
+    """
+    Rebuild the months of the comparison cube that contain the given tasks
+    :param tasks: {list} List of (center, norm, date) tuples
+    :param workers: {int} Number of worker processes, or None for the number of CPUs
+    :return: {list} List of (center, norm, month) tuples that failed to rebuild
+    """
+    cubes = []
+    for (center, norm, date) in tasks:
+        cube = (center, norm, date[0:6])
+        if cube not in cubes:
+            cubes.append(cube)
+
+    with ProcessPoolExecutor(max_workers=os.cpu_count() if workers is None else workers) as executor:
+        results = list(executor.map(_rebuild_cube, cubes))
+
+    return [cube for (cube, ok) in zip(cubes, results) if not ok]
+
+
+def main():
+    """
+    Backfill one or more centers over a date range
+    :return: None
+    """
+    parser = ArgumentParser(description='Reprocess FSOI data over a date range', formatter_class=FormatHelper)
+    parser.add_argument('-c', '--center', help='center(s) to process', type=str, nargs='+', required=True,
+                        choices=sorted(ingest_functions))
+    parser.add_argument('-b', '--begin-date', help='first date', metavar='YYYYMMDD', required=True)
+    parser.add_argument('-e', '--end-date', help='last date', metavar='YYYYMMDD', required=True)
+    parser.add_argument('-n', '--norm', help='norm(s) to process [all if not specified]', type=str, nargs='+',
+                        choices=['dry', 'moist'], required=False)
+    parser.add_argument('-y', '--cycles', help='cycle hours [all for the center if not specified]', type=int,
+                        nargs='+', required=False)
+    parser.add_argument('-p', '--path', help='path to search for raw files (required for MERRA)', required=False)
+    parser.add_argument('-j', '--journal', help='journal file used to resume the backfill', required=True)
+    parser.add_argument('-w', '--workers', help='number of worker processes [number of CPUs if not specified]',
+                        type=int, required=False)
+    parser.add_argument('-r', '--retries', help='number of retries for a failed task', type=int, default=2)
+    parser.add_argument('--retry-delay', help='seconds to wait before the first retry', type=float, default=60.)
+    parser.add_argument('--rollups', help='rebuild the rollups for the processed dates', action='store_true')
+    parser.add_argument('--cube', help='rebuild the comparison cube for the processed dates', action='store_true')
+    args = parser.parse_args()
+
+    tasks = create_tasks(args.center, args.begin_date, args.end_date, args.norm, args.cycles)
+    summary = run_backfill(tasks, args.journal, args.workers, args.retries, args.retry_delay, path=args.path)
+
+    if summary['failed']:
+        log.error('Failed backfill tasks:')
+        for task in summary['failed']:
+            log.error(BackfillJournal.task_id(task))
+
+    # rollups and the cube are rebuilt after all of the tasks, since concurrent updates of a rollup would conflict
+    if args.rollups:
+        for rollup in rebuild_rollups(summary['done'] + summary['skipped'], args.workers):
+            log.error('Failed to rebuild rollup: %s %s %02dZ %s' % rollup)
+    if args.cube:
+        for cube in rebuild_cubes(summary['done'] + summary['skipped'], args.workers):
+            log.error('Failed to rebuild cube: %s %s %s' % cube)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+Maintain the comparison cube: the group bulk statistics of every center, aggregated by unified
+platform, for every cycle.  The cube is stored as one small columnar object per center, norm and
+month, and is updated at ingest time, so inter-center comparison plots read only the months and
+centers that a request needs, instead of waiting for each center's summary plots.
+The cube version is part of the object keys, so a change to the layout starts a new cube.
+"""
+
+import yaml
+import pkgutil
+import tempfile
+import shutil
+import pandas as pd
+from datetime import datetime, timedelta
+from argparse import ArgumentParser
+from argparse import ArgumentDefaultsHelpFormatter as FormatHelper
+from fsoi import log
+from fsoi.data.s3_datastore import S3DataStore, FsoiS3DataStore
+from fsoi.ingest.rollup import get_period_dates, read_rollup, write_rollup, read_cycle
+
+# the columns stored in the cube, in order
+columns = ['TotImp', 'ObCnt', 'ObCntBen', 'ObCntNeu']
+
+
+def create_cube_descriptor(center, norm, month):
+    """
+    Create a descriptor for a cube object
+    :param center: {str} The center name
+    :param norm: {str} The norm (dry or moist)
+    :param month: {str} The month YYYYMM
+    :return: {dict} S3 descriptor with bucket and key
+    """
+    config = yaml.full_load(pkgutil.get_data('fsoi', 'data/datastore.yaml'))['fsoi']['s3']
+    key = config['cube_key'] % (int(config['cube_version']), norm, month, center, norm, month)
+
+    return {'bucket': config['bucket'], 'key': key}
+
+
+def read_cube(datastore, center, norm, month, work_dir):
+    """
+    Read the cube object of a center, norm and month
+    :param datastore: {S3DataStore} The data store
+    :param center: {str} The center name
+    :param norm: {str} The norm (dry or moist)
+    :param month: {str} The month YYYYMM
+    :param work_dir: {str} A working directory for temporary files
+    :return: {pandas.DataFrame, list} Statistics with DATETIME and PLATFORM index levels and the list of
+                                      datetimes (YYYYMMDDHH) they include, or None and an empty list if
+                                      the object does not exist or has another layout
+    """
+    descriptor = create_cube_descriptor(center, norm, month)
+    df, dates, _ = read_rollup(datastore, descriptor, work_dir)
+    if df is None:
+        return None, []
+
+    if list(df.columns) != columns or list(df.index.names) != ['DATETIME', 'PLATFORM']:
+        log.warn('Ignoring cube object with an unexpected layout: %s' % descriptor['key'])
+        return None, []
+
+    return df, dates
+
+
+def write_cube(datastore, center, norm, month, df, dates, work_dir):
+    """
+    Write the cube object of a center, norm and month
+    :param datastore: {S3DataStore} The data store
+    :param center: {str} The center name
+    :param norm: {str} The norm (dry or moist)
+    :param month: {str} The month YYYYMM
+    :param df: {pandas.DataFrame} Statistics with DATETIME and PLATFORM index levels
+    :param dates: {list} The list of datetimes (YYYYMMDDHH) in the statistics
+    :param work_dir: {str} A working directory for temporary files
+    :return: {bool} True if successful, otherwise False
+    """
+    df = df[columns].sort_index(level='DATETIME', sort_remaining=False)
+    return write_rollup(datastore, create_cube_descriptor(center, norm, month), df, dates, work_dir)
+
+
+def update_cube(center, norm, date_time, datastore=None):
+    """
+    Add the group bulk statistics of a cycle to the cube, replacing the cycle if it is already there
+    :param center: {str} The center name
+    :param norm: {str} The norm (dry or moist)
+    :param date_time: {str} Date and cycle YYYYMMDDHH
+    :param datastore: {S3DataStore} The data store, or None to create one
+    :return: {bool} True if successful, otherwise False
+    """
+    datastore = S3DataStore() if datastore is None else datastore
+    work_dir = tempfile.mkdtemp()
+    try:
+        cycle = read_cycle(datastore, center, norm, date_time, work_dir)
+        if cycle is None:
+            log.error('Group bulk statistics are not available: %s %s %s' % (center, norm, date_time))
+            return False
+
+        month = date_time[0:6]
+        df, dates = read_cube(datastore, center, norm, month, work_dir)
+        if df is not None and date_time in dates:
+            df = df.loc[df.index.get_level_values('DATETIME') != datetime.strptime(date_time, '%Y%m%d%H')]
+        frames = [cycle] if df is None else [df, cycle]
+        dates = sorted(set(dates) | {date_time})
+
+        return write_cube(datastore, center, norm, month, pd.concat(frames), dates, work_dir)
+
+    except Exception as e:
+        log.error('Failed to update cube: %s %s %s' % (center, norm, date_time), e)
+        return False
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def rebuild_cube(center, norm, month, datastore=None):
+    """
+    Rebuild the cube object of a month from the group bulk statistics of every cycle in the month
+    :param center: {str} The center name
+    :param norm: {str} The norm (dry or moist)
+    :param month: {str} The month YYYYMM
+    :param datastore: {S3DataStore} The data store, or None to create one
+    :return: {bool} True if successful, otherwise False
+    """
+    datastore = S3DataStore() if datastore is None else datastore
+    work_dir = tempfile.mkdtemp()
+    try:
+        frames = []
+        dates = []
+        for date in get_period_dates(month):
+            for cycle in [0, 6, 12, 18]:
+                date_time = '%s%02d' % (date, cycle)
+                df = read_cycle(datastore, center, norm, date_time, work_dir)
+                if df is not None:
+                    frames.append(df)
+                    dates.append(date_time)
+
+        if not frames:
+            log.warn('No group bulk statistics for cube: %s %s %s' % (center, norm, month))
+            return False
+
+        return write_cube(datastore, center, norm, month, pd.concat(frames), dates, work_dir)
+
+    except Exception as e:
+        log.error('Failed to rebuild cube: %s %s %s' % (center, norm, month), e)
+        return False
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def read_comparison_cube(centers, norm, cycles, start_date, end_date, datastore=None):
+    """
+    Read the slice of the cube for a comparison request.  The cube covers the request if every
+    requested cycle with group bulk statistics is in the cube.
+    :param centers: {list} List of center names
+    :param norm: {str} May be 'dry', 'moist', or 'both'
+    :param cycles: {list} List of cycle hours
+    :param start_date: {str} Start date YYYYMMDD (inclusive)
+    :param end_date: {str} End date YYYYMMDD (inclusive)
+    :param datastore: {S3DataStore} The data store, or None to create one
+    :return: {dict} Statistics with DATETIME and PLATFORM index levels for each center with data, or
+                    None if the cube does not cover the request
+    """
+    datastore = S3DataStore() if datastore is None else datastore
+    norms = ['dry', 'moist'] if norm == 'both' else [norm]
+    cycles = [int(cycle) for cycle in cycles]
+
+    # the requested cycles in each month
+    months = {}
+    date = datetime.strptime(start_date, '%Y%m%d')
+    while date <= datetime.strptime(end_date, '%Y%m%d'):
+        for cycle in cycles:
+            months.setdefault(date.strftime('%Y%m'), []).append('%s%02d' % (date.strftime('%Y%m%d'), cycle))
+        date += timedelta(days=1)
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        frames = {}
+        missing = []
+        for center in centers:
+            for cube_norm in norms:
+                for (month, date_times) in months.items():
+                    df, dates = read_cube(datastore, center, cube_norm, month, work_dir)
+                    dates = set(dates)
+                    missing += [(center, cube_norm, date_time) for date_time in date_times if date_time not in dates]
+                    if df is None:
+                        continue
+
+                    times = df.index.get_level_values('DATETIME')
+                    keep = times.strftime('%Y%m%d%H').isin(date_times)
+                    if keep.any():
+                        frames.setdefault(center, []).append(df.iloc[keep])
+
+        # cycles missing from the cube are only a problem if their statistics exist
+        if missing:
+            names = [FsoiS3DataStore._to_bucket_and_key(FsoiS3DataStore.create_descriptor(
+                center=center, norm=norm, datetime=date_time, type='groupbulk')) for (center, norm, date_time) in missing]
+            exist = datastore.exists_many([{'bucket': bucket, 'key': key} for (bucket, key) in names])
+            if any(exist):
+                log.info('Comparison cube is missing %d of the requested cycles' % sum(exist))
+                return None
+
+        return {center: pd.concat(frames[center]) for center in centers if center in frames}
+
+    except Exception as e:
+        log.error('Failed to read comparison cube', e)
+        return None
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    """
+    Rebuild the cube for a center and norm over a range of months
+    :return: None
+    """
+    parser = ArgumentParser(description='Rebuild the FSOI comparison cube', formatter_class=FormatHelper)
+    parser.add_argument('-c', '--center', help='center name', type=str, required=True)
+    parser.add_argument('-n', '--norm', help='norm', type=str, default='moist', choices=['dry', 'moist'])
+    parser.add_argument('-b', '--begin-month', help='first month', metavar='YYYYMM', required=True)
+    parser.add_argument('-e', '--end-month', help='last month', metavar='YYYYMM', required=True)
+    args = parser.parse_args()
+
+    datastore = S3DataStore()
+    year, month = int(args.begin_month[0:4]), int(args.begin_month[4:6])
+    while '%04d%02d' % (year, month) <= args.end_month:
+        if not rebuild_cube(args.center, args.norm, '%04d%02d' % (year, month), datastore):
+            log.warn('Cube not rebuilt: %s %s %04d%02d' % (args.center, args.norm, year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
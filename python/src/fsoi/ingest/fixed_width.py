@@ -0,0 +1,149 @@
+"""
+A columnar reader for fixed-width records described by a Fortran format string.  This reads an
+entire block of lines into NumPy arrays at once, rather than parsing one line at a time with a
+FortranRecordReader.
+"""
+
+import re
+import numpy as np
+
+
+class FixedWidthReader:
+    """
+    Read fixed-width records in bulk.  Supports the I, F, E, D, A and X edit descriptors, which are
+    the only descriptors used by the raw center files.
+    """
+
+    # pattern to match a single edit descriptor, e.g. 'i7', 'f9.3', '4x', 'a16', 'e13.6'
+    descriptor_pattern = re.compile(r'^(\d*)([a-z])(\d*)(?:\.(\d+))?$')
+
+    # pattern to split a float field without a decimal point into mantissa and exponent
+    implied_decimal_pattern = re.compile(r'^([+-]?\d*)(?:[edED]?([+-]?\d+))?$')
+
+    def __init__(self, fortran_format):
+        """
+        Create a reader for the given format
+        :param fortran_format: {str} A Fortran format string (e.g., 'i7,f9.3,1x,a16')
+        """
+        self.fortran_format = fortran_format
+        self.fields = []
+        self.width = 0
+
+        self._parse_format(fortran_format)
+
+    def _parse_format(self, fortran_format):
+        """
+        Convert the format string into a list of fields with a start offset, width, type and decimals
+        :param fortran_format: {str} A Fortran format string
+        :return: None
+        """
+        offset = 0
+        for token in fortran_format.lower().replace(' ', '').strip('()').split(','):
+            match = self.descriptor_pattern.match(token)
+            if match is None:
+                raise ValueError('Unsupported edit descriptor: %s' % token)
+            repeat, kind, width, decimals = match.groups()
+
+            # 'nx' skips n columns
+            if kind == 'x':
+                offset += int(repeat) if repeat else 1
+                continue
+
+            if kind not in ['i', 'f', 'e', 'd', 'a']:
+                raise ValueError('Unsupported edit descriptor: %s' % token)
+
+            for _ in range(int(repeat) if repeat else 1):
+                self.fields.append((offset, int(width), kind, int(decimals) if decimals else 0))
+                offset += int(width)
+
+        self.width = offset
+
+    def read_columns(self, lines):
+        """
+        Read a block of lines into columns
+        :param lines: {list} List of lines as {bytes} or {str}, without line terminators
+        :return: {list} A list of NumPy arrays, one per field, in the same order a
+                        FortranRecordReader would return the values for each line
+        """
+        if len(lines) == 0:
+            return [np.empty(0, dtype=self._dtype(kind)) for (_, _, kind, _) in self.fields]
+
+        if isinstance(lines[0], str):
+            lines = [line.encode() for line in lines]
+
+        # pad (or truncate) each line to the record width and view as a 2D array of characters
+        buf = np.array(lines, dtype='S%d' % self.width).view(np.uint8).reshape(len(lines), self.width)
+        buf = buf.copy()
+        buf[buf == 0] = ord(' ')
+
+        return [self._read_field(buf, *field) for field in self.fields]
+
+    @staticmethod
+    def _dtype(kind):
+        """
+        Get the NumPy data type for a kind of edit descriptor
+        :param kind: {str} One of 'i', 'f', 'e', 'd' or 'a'
+        :return: NumPy data type
+        """
+        if kind == 'i':
+            return np.int64
+        if kind == 'a':
+            return np.str_
+        return np.float64
+
+    def _read_field(self, buf, offset, width, kind, decimals):
+        """
+        Read a single field from every line
+        :param buf: {numpy.ndarray} 2D array of characters, one row per line
+        :param offset: {int} Start column of the field
+        :param width: {int} Width of the field
+        :param kind: {str} Type of edit descriptor
+        :param decimals: {int} Number of implied decimals for float descriptors
+        :return: {numpy.ndarray} The values of the field for every line
+        """
+        chars = np.ascontiguousarray(buf[:, offset:offset + width])
+        values = chars.view('S%d' % width).ravel()
+
+        if kind == 'a':
+            return values.astype('U%d' % width)
+
+        # a blank numeric field is read as zero
+        blank = (chars == ord(' ')).all(axis=1)
+        if blank.any():
+            values = values.copy()
+            values[blank] = b'0'
+
+        if kind == 'i':
+            return values.astype(np.int64)
+
+        # convert any Fortran double precision exponent to one that NumPy can parse
+        if np.isin(chars, [ord('d'), ord('D')]).any():
+            values = np.char.replace(np.char.lower(values), b'd', b'e')
+
+        has_point = blank | (chars == ord('.')).any(axis=1)
+        if has_point.all():
+            return values.astype(np.float64)
+
+        # fields without an explicit decimal point use the implied decimals of the descriptor
+        result = np.zeros(len(values), dtype=np.float64)
+        result[has_point] = values[has_point].astype(np.float64)
+        for i in np.flatnonzero(~has_point):
+            result[i] = self._implied_decimal(values[i], decimals)
+
+        return result
+
+    @classmethod
+    def _implied_decimal(cls, value, decimals):
+        """
+        Convert a float field without a decimal point
+        :param value: {bytes} The raw field value
+        :param decimals: {int} Number of implied decimals
+        :return: {float} The converted value
+        """
+        match = cls.implied_decimal_pattern.match(value.decode().replace(' ', ''))
+        if match is None:
+            raise ValueError('Failed to parse float field: %s' % value)
+        mantissa, exponent = match.groups()
+        if mantissa in ['', '+', '-']:
+            mantissa += '0'
+        return int(mantissa) / 10 ** decimals * 10 ** int(exponent or 0)
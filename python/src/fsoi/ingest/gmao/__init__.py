@@ -13,6 +13,8 @@ from argparse import ArgumentParser
 from argparse import ArgumentDefaultsHelpFormatter as HelpFormatter
 from fsoi.ingest.gmao.download_gmao import download_gmao
 from fsoi.ingest.gmao.process_gmao import process_gmao
+from fsoi.ingest.rollup import update_rollups
+from fsoi.ingest.cube import update_cube
 from fsoi import log
 from fsoi.fsoilog import enable_cloudwatch_logs
 
@@ -63,6 +65,12 @@ def download_and_process_gmao():
         files = download_gmao(lag, https_host, remote_path, bucket, cycle_hour)
         processed_files = process_gmao(norm, date=date_str)
 
+        # add the cycle to the month and season rollups and the comparison cube
+        if processed_files and not update_rollups('GMAO', norm, date_str):
+            log.error('Failed to update rollups for GMAO %s' % date_str)
+        if processed_files and not update_cube('GMAO', norm, date_str):
+            log.error('Failed to update the comparison cube for GMAO %s' % date_str)
+
         file_count = len(processed_files)
         ok = file_count > 0
 
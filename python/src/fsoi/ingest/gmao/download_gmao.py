@@ -9,94 +9,135 @@ import time
 import datetime
 import re
 import json
-from threading import Thread
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 import urllib3
 import certifi
 import pkgutil
 import yaml
 from fsoi import log
+from fsoi.data.s3_datastore import S3DataStore
 
 
-class Downloader(Thread):
+class CountingStream:
     """
-    Thread to download file and put data in S3
+    A readable stream that counts the bytes read from another stream
     """
 
-    # Static S3 client to be used by all threads
-    s3_client = boto3.client('s3')
+    def __init__(self, stream):
+        """
+        Wrap a stream
+        :param stream: {file} An object with a read(size) method
+        """
+        self.stream = stream
+        self.size = 0
 
-    def __init__(self, url, s3_bucket, s3_key):
+    def read(self, size=-1):
+        """
+        Read data from the stream
+        :param size: {int} Maximum number of bytes to read, or -1 to read to the end of the stream
+        :return: {bytes} The data
+        """
+        data = self.stream.read(size if size is not None and size >= 0 else None)
+        self.size += len(data)
+        return data
+
+
+class Downloader:
+    """
+    Download files over HTTPS with a bounded number of threads sharing one connection pool, and
+    stream each response body to a data store without reading the whole file into memory
+    """
+
+    # HTTP status codes that may succeed if the request is retried
+    retry_status = {429, 500, 502, 503, 504}
+
+    def __init__(self, datastore=None, workers=4, retries=3, retry_delay=5.):
         """
         Constructor
-        :param url: Source URL
-        :param s3_bucket: Target S3 bucket
-        :param s3_key: Target S3 key
+        :param datastore: {DataStore} Save the files in this data store, or None to use S3
+        :param workers: {int} Maximum number of files downloaded at the same time
+        :param retries: {int} Number of times to retry a failed download
+        :param retry_delay: {float} Seconds to wait before the first retry, doubled for each retry
         """
-        super(Downloader, self).__init__()
-        self.url = url
-        self.s3_bucket = s3_bucket
-        self.s3_key = s3_key
-        self.download_size = 0
-        self.success = False
-
-    def run(self):
+        self.datastore = S3DataStore() if datastore is None else datastore
+        self.workers = workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.http = urllib3.PoolManager(maxsize=workers, block=True, cert_reqs='CERT_REQUIRED',
+                                        ca_certs=certifi.where(),
+                                        retries=urllib3.Retry(connect=0, read=0, status=0, redirect=5),
+                                        timeout=urllib3.Timeout(connect=30, read=300))
+
+    def download(self, url, target):
         """
-        Download a file from the website
-        :return: None
+        Download a file and save it in the data store
+        :param url: {str} Source URL
+        :param target: {dict} Data store target descriptor
+        :return: {int} Number of bytes downloaded, or None if the download failed
         """
-        try:
-
-            # read the data from the URL
-            https = urllib3.PoolManager(cert_reqs='CERT_REQUIRED', ca_certs=certifi.where())
-            response = https.request('GET', self.url)
-
-            # check that the response is OK (200)
-            if response.status != 200:
-                log.error('Website responded with %d' % response.status)
-                log.error('URL: %s' % self.url)
-                log.error(response.data.decode())
-                return
-
-            # write the data to S3
-            s3_response = Downloader.s3_client.put_object(
-                Bucket=self.s3_bucket,
-                Key=self.s3_key,
-                Body=response.data
-            )
-
-            # check for an error in the response
-            if s3_response['ResponseMetadata']['HTTPStatusCode'] != 200:
-                log.error('Error uploading data to S3')
-                log.error('URL: %s' % self.url)
-                log.error('S3 URL: s3://%s/%s' % (self.s3_bucket, self.s3_key))
-                return
-
-            # happy
-            log.debug('Done: %s' % self.s3_key)
-            self.download_size = len(response.data)
-            self.success = True
-
-        except RuntimeError as exception:
-            log.error(exception)
-            self.success = False
-
-    def get_s3_url(self):
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+            response = None
+            try:
+                # read the response body as it is uploaded
+                response = self.http.request('GET', url, preload_content=False)
+
+                # check that the response is OK (200)
+                if response.status != 200:
+                    log.error('Website responded with %d' % response.status)
+                    log.error('URL: %s' % url)
+                    response.drain_conn()
+                    if response.status not in Downloader.retry_status:
+                        return None
+                    continue
+
+                stream = CountingStream(response)
+                if self.datastore.save_from_stream(stream, target):
+                    log.debug('Done: %s' % url)
+                    return stream.size
+
+                log.error('Error saving data from %s (attempt %d)' % (url, attempt + 1))
+
+                # do not reuse a connection with part of the response body still unread
+                response.close()
+
+            except urllib3.exceptions.HTTPError as exception:
+                log.error('Error downloading %s (attempt %d)' % (url, attempt + 1))
+                log.error(exception)
+                if response is not None:
+                    response.close()
+
+            finally:
+                if response is not None:
+                    response.release_conn()
+
+        return None
+
+    def download_all(self, transfers):
         """
-        Return the target S3 url for this object
-        :return: {str} S3 target url
+        Download files, up to the configured number at the same time
+        :param transfers: {list} List of (source URL, data store target descriptor) tuples
+        :return: {list} Number of bytes downloaded (or None if it failed) for each transfer, in order
         """
-        return 's3://%s/%s' % (self.s3_bucket, self.s3_key)
+        if not transfers:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(transfers))) as executor:
+            return list(executor.map(lambda transfer: self.download(*transfer), transfers))
 
 
-def get_list_of_files_from_url(url):
+def get_list_of_files_from_url(url, https=None):
     """
     Retrieve a list of files available at this URL
     :param url: The base URL to the GMAO download portal
+    :param https: {urllib3.PoolManager} Reuse connections from this pool, or None to create a pool
     :return: {list} A list of files at this URL (file name only), or None if an error occurred
     """
     # read the data on the website with a GET request
-    https = urllib3.PoolManager(cert_reqs='CERT_REQUIRED', ca_certs=certifi.where())
+    if https is None:
+        https = urllib3.PoolManager(cert_reqs='CERT_REQUIRED', ca_certs=certifi.where())
     response = https.request('GET', url)
     if response.status != 200:
         log.error('Website responded with %d' % response.status)
@@ -110,7 +151,7 @@ def get_list_of_files_from_url(url):
     return list(set(files))
 
 
-def download_gmao(lag, https_host, remote_path, bucket, cycle_hour):
+def download_gmao(lag, https_host, remote_path, bucket, cycle_hour, workers=None, datastore=None):
     """
     The main lambda entry point, or main function if called stand-alone
     :param lag: {int} Number of days to look back for data
@@ -118,40 +159,44 @@ def download_gmao(lag, https_host, remote_path, bucket, cycle_hour):
     :param remote_path: {str} The path on the server to find files
     :param bucket: {str} The bucket to which raw data will be uploaded
     :param cycle_hour: {int} The cycle hour (As of 2019-Apr, only 00Z is available)
+    :param workers: {int} Maximum number of files downloaded at the same time, or None to use the configured value
+    :param datastore: {DataStore} Save the files in this data store, or None to use S3
     :return: {list} A list of S3 URLs to the files that were downloaded from GMAO
     """
     status = {'ok': False, 'runtime': int(time.time()), 'size': -1, 'file_count': 0, 'name': 'n/a'}
 
     try:
+        config = yaml.full_load(pkgutil.get_data('fsoi', 'ingest/gmao/gmao_ingest.yaml'))
+        if workers is None:
+            workers = config['download_workers']
+        downloader = Downloader(datastore, workers, config['download_retries'])
 
         # compute the base url with the date
         date = datetime.datetime.utcfromtimestamp(time.time() - lag * 86400)
         remote_path = remote_path % (date.year, date.month, date.day, cycle_hour)
         base_url = 'https://%s/%s' % (https_host, remote_path)
-        files = get_list_of_files_from_url(base_url)
+        files = get_list_of_files_from_url(base_url, downloader.http)
         if files is None:
             log.warn('No files were found on the remote server')
             return []
 
-        # start all data transfer threads
-        threads = []
+        # transfer the files with a bounded number of threads
+        transfers = []
         s3_key_template = 'Y%04d/M%02d/D%02d/H%02d/%s'
         for remote_file in files:
             log.debug('Transferring %s' % remote_file)
             key = s3_key_template % (date.year, date.month, date.day, cycle_hour, remote_file)
             url = '%s/%s' % (base_url, remote_file)
-            thread = Downloader(url, bucket, key)
-            thread.start()
-            threads.append(thread)
+            transfers.append((url, {'bucket': bucket, 'key': key}))
+        sizes = downloader.download_all(transfers)
 
-        # wait for all threads to finish and collect results
+        # collect results
         urls = []
-        for thread in threads:
-            thread.join()
-            if thread.success:
-                urls.append(thread.get_s3_url())
+        for ((url, target), size) in zip(transfers, sizes):
+            if size is not None:
+                urls.append('s3://%s/%s' % (target['bucket'], target['key']))
                 status['file_count'] += 1
-                status['size'] += thread.download_size
+                status['size'] += size
                 status['ok'] = True
 
         # print the log info for CloudWatch
@@ -204,10 +249,12 @@ def main():
     parser.add_argument('--bucket-name', help='S3 bucket name', default=bucket)
     parser.add_argument('--cycle-hour', help='Forecast cycle hour', type=int, default=0,
                         choices=[0, 6, 12, 18])
+    parser.add_argument('-w', '--workers', help='Number of files downloaded at the same time', type=int)
     args = parser.parse_args()
 
     # run the download function
-    urls = download_gmao(args.lag, args.host, args.remote_path, args.bucket_name, args.cycle_hour)
+    urls = download_gmao(args.lag, args.host, args.remote_path, args.bucket_name, args.cycle_hour,
+                         args.workers)
 
     # print the new s3 urls
     log.info('Data copied to:')
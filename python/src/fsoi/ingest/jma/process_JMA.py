@@ -49,7 +49,7 @@ def main():
     if bufr != []:
         df = loi.list_to_dataframe(adate, bufr)
         if os.path.isfile(fname_out): os.remove(fname_out)
-        lutils.writeHDF(fname_out, 'df', df, complevel=1, complib='zlib', fletcher32=True)
+        lutils.writeHDF(fname_out, 'df', df, complevel=1, complib='zlib', fletcher32=True, coded=True)
 
     print('Total obs = %d' % (nobstot))
 
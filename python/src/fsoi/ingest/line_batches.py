@@ -0,0 +1,70 @@
+"""
+Read the lines of a (compressed) text file in batches.  The file is decompressed one block at a
+time, so only one block of decompressed data and one batch of lines are in memory at once, no
+matter how large the file is.
+"""
+
+from fsoi import log
+
+
+# default number of bytes to read from the file at a time
+default_block_size = 4 * 1024 * 1024
+
+# default number of lines in a batch
+default_batch_size = 200000
+
+
+def read_line_batches(fh, batch_size=default_batch_size, skip_lines=0, block_size=default_block_size,
+                      allow_truncated=False):
+    """
+    Read lines from an open binary file in batches
+    :param fh: {file} A binary file object, e.g. from bz2.BZ2File or gzip.open
+    :param batch_size: {int} Maximum number of lines in a batch
+    :param skip_lines: {int} Number of lines to skip at the beginning of the file
+    :param block_size: {int} Number of bytes to read from the file at a time
+    :param allow_truncated: {bool} True to end at a corrupt or truncated part of the file and keep the
+                                   lines before it, otherwise the read error is raised
+    :return: {generator} Generates lists of lines as {bytes}, without line terminators
+    """
+    batch = []
+    partial = b''
+    while True:
+        try:
+            block = fh.read(block_size)
+        except (EOFError, OSError) as e:
+            if not allow_truncated:
+                raise
+            log.error('Unexpected end of file after %d bytes of the last block' % len(partial))
+            log.error(e)
+            block = b''
+
+        # the last line of a block continues in the next block
+        if block:
+            lines = (partial + block).split(b'\n')
+            partial = lines.pop()
+        else:
+            lines = [partial] if partial else []
+            partial = b''
+
+        if skip_lines > 0:
+            skipped = min(skip_lines, len(lines))
+            lines = lines[skipped:]
+            skip_lines -= skipped
+
+        # handle files with DOS line terminators
+        if lines and (lines[0].endswith(b'\r') or lines[-1].endswith(b'\r')):
+            lines = [line.rstrip(b'\r') for line in lines]
+
+        while lines:
+            room = batch_size - len(batch)
+            batch.extend(lines[:room])
+            lines = lines[room:]
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+        if not block:
+            break
+
+    if batch:
+        yield batch
@@ -3,14 +3,19 @@ import yaml
 import pkgutil
 import boto3
 from datetime import datetime
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 # pylint wrongly believes No name 'Dataset' in module 'netCDF4' (no-name-in-module)
 # pylint: disable=E0611
 from netCDF4 import Dataset
 import numpy as np
+import pandas as pd
 from argparse import ArgumentParser
 from argparse import ArgumentDefaultsHelpFormatter as FormatHelper
 import fsoi.stats.lib_utils as lutils
 import fsoi.stats.lib_obimpact as loi
+from fsoi.ingest.rollup import update_rollups
+from fsoi.ingest.cube import update_cube
 from fsoi import log
 
 
@@ -105,6 +110,101 @@ class ODS:
             raise IOError(str(e) + ' ' + self.filename)
 
 
+def ods_to_columns(ods, platform, kx, kt, unknown_platforms):
+    """
+    Convert the observations in an ODS object into columns used by loi.columns_to_dataframe
+    :param ods: {ODS} An ODS object that has already been read
+    :param platform: {str} The platform name parsed from the file name, or CONV
+    :param kx: {dict} Map of kx values to platform names (used for CONV only)
+    :param kt: {dict} Map of kt values to observation types
+    :param unknown_platforms: {list} List saving unknown platform IDs; these observations are dropped
+    :return: {dict} Dictionary of column name to NumPy array
+    """
+    # platform names are looked up once per unique kx value
+    if platform in ['CONV']:
+        plat_codes, plat_ids = pd.factorize(ods.kx)
+        plat_names = []
+        for platid in plat_ids:
+            if platid in kx:
+                plat_names.append(kx[platid])
+            else:
+                if int(platid) not in unknown_platforms:
+                    unknown_platforms.append(int(platid))
+                plat_names.append(None)
+        keep = np.array([name is not None for name in plat_names], dtype=bool)[plat_codes]
+        plat = np.array(plat_names, dtype=object)[plat_codes][keep]
+    else:
+        keep = np.ones(ods.n_obs, dtype=bool)
+        plat = np.full(ods.n_obs, platform, dtype=object)
+
+    # observation types are looked up once per unique kt value
+    obtype_codes, obtype_ids = pd.factorize(ods.kt[keep])
+    obtype = np.array([kt[obtype_id][0] for obtype_id in obtype_ids], dtype=object)[obtype_codes]
+
+    if platform in ['CONV']:
+        channel = np.full(len(plat), -999, dtype=np.int64)
+    else:
+        channel = ods.lev[keep].astype(np.int64)
+
+    lon = ods.lon[keep].astype(np.float64)
+    lon = np.where(lon >= 0.0, lon, lon + 360.0)
+
+    lev = ods.lev[keep].astype(np.float64)
+    lev = np.where(obtype == 'ps', ods.obs[keep].astype(np.float64), lev)
+    lev = np.where(obtype == 'Tb', -999., lev)
+
+    columns = {
+        'PLATFORM': plat,
+        'OBTYPE': obtype,
+        'CHANNEL': channel,
+        'LONGITUDE': lon,
+        'LATITUDE': ods.lat[keep].astype(np.float64),
+        'PRESSURE': lev,
+        'IMPACT': ods.xvec[keep].astype(np.float64),
+        'OMF': ods.omf[keep].astype(np.float64),
+        'OBERR': np.full(len(plat), -999.)  # MERRA does not provide obs error in the impact ODS files
+    }
+
+    return columns
+
+
+def read_ods_file(path, platform, kx, kt):
+    """
+    Read an ODS file and convert the observations to columns
+    :param path: {str} Full path to the ODS file
+    :param platform: {str} The platform name parsed from the file name, or CONV
+    :param kx: {dict} Map of kx values to platform names (used for CONV only)
+    :param kt: {dict} Map of kt values to observation types
+    :return: {dict, int, list} Columns, number of observations read, and list of unknown platform IDs
+    """
+    ods = ODS(path)
+    ods = ods.read(only_good=True, platform=platform)
+    ods.close()
+
+    unknown_platforms = []
+    columns = ods_to_columns(ods, platform, kx, kt, unknown_platforms)
+
+    return columns, ods.n_obs, unknown_platforms
+
+
+def read_ods_files(paths, platforms, kx, kt, workers=1):
+    """
+    Read ODS files and convert the observations to columns.  With more than one worker the files are
+    read concurrently in a pool of processes; the results are always in the order of the paths.
+    :param paths: {list} List of full paths to ODS files
+    :param platforms: {list} List of platform names, one for each path
+    :param kx: {dict} Map of kx values to platform names (used for CONV only)
+    :param kt: {dict} Map of kt values to observation types
+    :param workers: {int} Number of worker processes, or 1 to read the files in this process
+    :return: {list} List of results from read_ods_file, one for each path
+    """
+    if workers is None or workers <= 1 or len(paths) <= 1:
+        return list(map(read_ods_file, paths, platforms, repeat(kx), repeat(kt)))
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as executor:
+        return list(executor.map(read_ods_file, paths, platforms, repeat(kx), repeat(kt)))
+
+
 def prepare_workspace():
     """
     Prepare workspace
@@ -221,15 +321,17 @@ def upload_to_s3(file, s3url):
         return False
 
 
-def process_merra(norm, date=None, path=None):
+def process_merra(norm, date=None, path=None, workers=None):
     """
     Process the MERRA data from a given day for the specified norm
     :param norm: {str} moist or dry
     :param date: {str} Date string in the format YYYYMMDDHH or None (required if path is None)
     :param path: {str} Full path to search for files to process or None (required if date is None)
+    :param workers: {int} Number of processes reading ODS files, or None to use the configured value
     :return: {list} List of local files
     """
     config = yaml.full_load(pkgutil.get_data('fsoi', 'ingest/merra/merra_ingest.yaml'))
+    workers = config.get('ods_workers', 1) if workers is None else workers
     kx = config['kx']
     kt = config['kt']
     file_norm = config['norm'][norm]
@@ -241,68 +343,50 @@ def process_merra(norm, date=None, path=None):
     # get a list of files
     file_list = find_files_in_path(path, date)
 
-    n_obs = 0
-    bufr = []
-    # create list of unknown platforms
-    ukwnplats = []
-
+    # get the platform name for each file with the requested norm
+    paths = []
+    platforms = []
     for path in file_list:
 
         # skip if the norm is not in the file name
         if file_norm not in path.split('/')[-1]:
             continue
 
-        # log debug
-        log.debug('processing %s' % path)
-
         # TODO: Request that NASA adds the platform name as a global attribute in the NetCDF file
         #       rather than trying to parse the platform name from the file name.
         platform = path.split('/')[-1].split('.')[3].split('imp3_%s_' % file_norm)[-1].upper()
         if path.split('/')[-1].startswith('M2obimp'):
             platform = path.split('/')[-1].split('.')[1].split('imp3_%s_' % file_norm)[-1].upper()
 
-        # read the data from the file
-        ods = ODS(path)
-        ods = ods.read(only_good=True, platform=platform)
-        ods.close()
+        paths.append(path)
+        platforms.append(platform)
 
-        # update the total obs count
-        n_obs += ods.n_obs
-        log.debug('platform = %s, nobs = %d' % (platform, ods.n_obs))
+    # read the files, possibly in a pool of processes
+    log.debug('reading %d files with %d workers' % (len(paths), max(1, workers)))
+    results = read_ods_files(paths, platforms, kx, kt, workers)
 
-        # create client boto3 for unknown platform error raising
-        sns = boto3.client("sns")
+    n_obs = 0
+    bufr = []
+    # create list of unknown platforms
+    ukwnplats = []
 
-        # iterate over each observation
-        for o in range(ods.n_obs):
+    for (path, platform, (columns, file_n_obs, file_ukwnplats)) in zip(paths, platforms, results):
 
-            try:
-                plat = kx[ods.kx[o]] if platform in ['CONV'] else platform
-            except KeyError as e:
-                platid = int(e.args[0])
-                if platid not in ukwnplats:
-                    ukwnplats.append(platid)
-                continue
+        # update the total obs count
+        n_obs += file_n_obs
+        log.debug('platform = %s, nobs = %d, file = %s' % (platform, file_n_obs, path))
 
-            obtype = kt[ods.kt[o]][0]
+        # collect the unknown platforms in file order
+        for platid in file_ukwnplats:
+            if platid not in ukwnplats:
+                ukwnplats.append(platid)
 
-            channel = -999 if platform in ['CONV'] else np.int(ods.lev[o])
-            lon = ods.lon[o] if ods.lon[o] >= 0.0 else ods.lon[o] + 360.0
-            lat = ods.lat[o]
-            if obtype == 'ps':
-                lev = ods.obs[o]
-            elif obtype == 'Tb':
-                lev = -999.
-            else:
-                lev = ods.lev[o]
-            imp = ods.xvec[o]
-            omf = ods.omf[o]
-            oberr = -999.  # MERRA does not provide obs error in the impact ODS files
-            bufr.append([plat, obtype, channel, lon,
-                         lat, lev, imp, omf, oberr])
+        if len(columns['IMPACT']) > 0:
+            bufr.append(columns)
 
     # send email if unknown platforms ID are encountered while processing MERRA files
-    if ukwnplats :
+    if ukwnplats:
+        sns = boto3.client("sns")
         sns.publish(
             TopicArn=config['arnUnknownPlatformsTopic'],
             Subject='Unknown Platform attribute MERRA file',
@@ -320,32 +404,32 @@ def process_merra(norm, date=None, path=None):
     out_file = 'MERRA.%s.%s.h5' % (norm, date)
     s3_template = 's3://' + config['processed_data_bucket'] + '/' + config['processed_data_prefix'] + '/%s'
 
-    df = loi.list_to_dataframe(dt, bufr)
+    columns = {col: np.concatenate([file_columns[col] for file_columns in bufr]) for col in bufr[0]}
+    df = loi.columns_to_dataframe(dt, columns)
     of = '%s/%s' % (work_dir, out_file)
-    lutils.writeHDF(of, 'df', df, complevel=1, complib='zlib', fletcher32=True)
+    lutils.writeHDF(of, 'df', df, complevel=1, complib='zlib', fletcher32=True, coded=True)
     out_file_list.append(of)
     if not upload_to_s3(of, s3_template % of.split('/')[-1]):
         log.error('Failed to upload file to S3: %s' % of)
 
-    df = loi.BulkStats(df)
+    platforms = loi.Platforms('OnePlatform')
+    bulk, accumbulk, groupbulk = loi.allBulkStats(df, platforms)
+
     of = '%s/bulk.%s' % (work_dir, out_file)
     out_file_list.append(of)
-    lutils.writeHDF(of, 'df', df)
+    lutils.writeHDF(of, 'df', bulk, coded=True)
     if not upload_to_s3(of, s3_template % of.split('/')[-1]):
         log.error('Failed to upload file to S3: %s' % of)
 
-    df = loi.accumBulkStats(df)
     of = '%s/accumbulk.%s' % (work_dir, out_file)
     out_file_list.append(of)
-    lutils.writeHDF(of, 'df', df)
+    lutils.writeHDF(of, 'df', accumbulk, coded=True)
     if not upload_to_s3(of, s3_template % of.split('/')[-1]):
         log.error('Failed to upload file to S3: %s' % of)
 
-    platforms = loi.Platforms('OnePlatform')
-    df = loi.groupBulkStats(df, platforms)
     of = '%s/groupbulk.%s' % (work_dir, out_file)
     out_file_list.append(of)
-    lutils.writeHDF(of, 'df', df)
+    lutils.writeHDF(of, 'df', groupbulk, coded=True)
     if not upload_to_s3(of, s3_template % of.split('/')[-1]):
         log.error('Failed to upload file to S3: %s' % of)
 
@@ -361,14 +445,21 @@ def main():
     parser.add_argument('-d', '--date', help='analysis date to process', metavar='YYYYMMDDHH', required=True)
     parser.add_argument('-p', '--path', help='path to search for files', required=True)
     parser.add_argument('-n', '--norm', help='norm to process', type=str, default='moist', choices=['dry', 'moist'], required=False)
+    parser.add_argument('-w', '--workers', help='number of processes reading ODS files [configured value if not specified]', type=int, required=False)
     args = parser.parse_args()
 
-    files = process_merra(args.norm, args.date, args.path)
+    files = process_merra(args.norm, args.date, args.path, args.workers)
     log.info('Processed MERRA files:')
     if files:
         for file in files:
             log.info(file)
 
+    # add the cycle to the month and season rollups and the comparison cube
+    if files and not update_rollups('MERRA', args.norm, args.date):
+        log.error('Failed to update rollups for MERRA %s' % args.date)
+    if files and not update_cube('MERRA', args.norm, args.date):
+        log.error('Failed to update the comparison cube for MERRA %s' % args.date)
+
 
 def batch():
     """
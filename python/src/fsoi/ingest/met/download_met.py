@@ -2,11 +2,16 @@
 This script will download a file from MET's password-protected FTP site and upload it to an S3 bucket.
 """
 
+import os
+import shutil
+import tempfile
 import pkgutil
 import yaml
+from datetime import datetime, timedelta
 from argparse import ArgumentParser
 from fsoi import log
 from fsoi.data.s3_datastore import S3DataStore
+from fsoi.data.ftp_pool import FtpConnectionPool
 from fsoi.ingest import compute_date_from_lag
 import boto3
 import json
@@ -21,33 +26,61 @@ def download_met(date_str, ftp_host, remote_file_templates, bucket_name):
     :param bucket_name: {str} The bucket name where the file should be uploaded
     :return: {list} List of S3 URLs to the new files, or None
     """
-    # create an S3 data store object
-    datastore = S3DataStore()
+    return download_met_dates([date_str], ftp_host, remote_file_templates, bucket_name)[date_str]
+
+
+def download_met_dates(date_strs, ftp_host, remote_file_templates, bucket_name, connections=None):
+    """
+    Download the files for several dates from MET in parallel over a pool of FTP sessions, and
+    upload them to S3
+    :param date_strs: {list} Look for the files for these dates (YYYYMMDD)
+    :param ftp_host: {str} The FTP host name (FQDN)
+    :param remote_file_templates: {list} Template list for the remote file name; the 'DATE' substring will be replaced
+    :param bucket_name: {str} The bucket name where the files should be uploaded
+    :param connections: {int} Number of FTP sessions, or None to use the configured value
+    :return: {dict} List of S3 URLs to the new files for each date, or None if a file for the date failed
+    """
+    if connections is None:
+        config = yaml.full_load(pkgutil.get_data('fsoi', 'ingest/met/met_ingest.yaml'))
+        connections = config['ftp_connections']
 
     # get FTP site credentials
     username, password = get_ftp_login_credentials()
     if username is None and password is None:
-        return
+        return {date_str: None for date_str in date_strs}
+
+    # compute the remote file names for all dates
+    remote_files = [(date_str, remote_file_template.replace('DATE', date_str))
+                    for date_str in date_strs for remote_file_template in remote_file_templates]
 
-    # download all files for the given date
-    successful = True
-    s3_urls = []
-    for remote_file_template in remote_file_templates:
-        # compute the remote file name
-        remote_file = remote_file_template.replace('DATE', date_str)
-
-        # download the file from the FTP site
-        url = 'ftp://%s/%s' % (ftp_host, remote_file)
-        key = remote_file.split('/')[-1]
-        target = {'bucket': bucket_name, 'key': key}
-        successful = successful and datastore.save_from_ftp(url, target, username, password)
-
-        # add S3 URL
-        if successful:
-            s3_urls.append('s3://%s/%s' % (bucket_name, key))
-        else:
-            log.error('Failed to save data from %s' % url)
-            return None
+    # download all files from the FTP site in parallel, then upload them
+    datastore = S3DataStore()
+    workdir = tempfile.mkdtemp()
+    s3_urls = {date_str: [] for date_str in date_strs}
+    try:
+        local_files = [os.path.join(workdir, remote_file.split('/')[-1]) for (_, remote_file) in remote_files]
+        with FtpConnectionPool(ftp_host, username, password, size=connections) as pool:
+            results = pool.download_many([(remote_file, local_file)
+                                          for ((_, remote_file), local_file) in zip(remote_files, local_files)])
+
+        for ((date_str, remote_file), local_file, successful) in zip(remote_files, local_files, results):
+            if s3_urls[date_str] is None:
+                continue
+
+            url = 'ftp://%s/%s' % (ftp_host, remote_file)
+            key = remote_file.split('/')[-1]
+            target = {'bucket': bucket_name, 'key': key}
+            successful = successful and datastore.save_from_local_file(local_file, target)
+
+            # add S3 URL
+            if successful:
+                s3_urls[date_str].append('s3://%s/%s' % (bucket_name, key))
+            else:
+                log.error('Failed to save data from %s' % url)
+                s3_urls[date_str] = None
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
 
     return s3_urls
 
@@ -88,6 +121,7 @@ def main():
     parser = ArgumentParser(description='Download MET data')
     parser.add_argument('--lag', help='time lag in days (not compatible with --date)', type=int)
     parser.add_argument('--date', help='specific date to download YYYYMMDD (not compatible with --lag)')
+    parser.add_argument('--days', help='also download the previous N-1 days', type=int, default=1)
     parser.add_argument('--host', help='download from specified FTP host', type=str, default=ftp_host)
     parser.add_argument('--remote-path', help='remote path template for FTP server', default=','.join(files))
     parser.add_argument('--s3-bucket', help='store in this bucket', default=bucket)
@@ -101,20 +135,22 @@ def main():
         log.error('One of --lag or --date must be provided')
         return
 
-    # compute or get the date string
+    # compute or get the date strings
     if args.lag:
-        date = compute_date_from_lag(args.lag)
+        dates = [compute_date_from_lag(args.lag + day) for day in range(args.days)]
     else:
-        date = args.date
+        date = datetime.strptime(args.date, '%Y%m%d')
+        dates = [(date - timedelta(days=day)).strftime('%Y%m%d') for day in range(args.days)]
 
-    # download and save the file
+    # download and save the files
     remote_paths = args.remote_path.split(',')
-    s3_urls = download_met(date, args.host, remote_paths, args.s3_bucket)
+    s3_urls = download_met_dates(dates, args.host, remote_paths, args.s3_bucket)
 
-    if s3_urls is not None:
-        log.info('Files saved to:')
-        for s3_url in s3_urls:
-            log.info('  %s' % s3_url)
+    for date in dates:
+        if s3_urls[date] is not None:
+            log.info('Files saved to:')
+            for s3_url in s3_urls[date]:
+                log.info('  %s' % s3_url)
 
 
 if __name__ == '__main__':
@@ -4,6 +4,7 @@ import yaml
 import pkgutil
 import tempfile
 import numpy as np
+import pandas as pd
 import boto3
 from datetime import datetime
 from fortranformat import FortranRecordReader
@@ -13,6 +14,10 @@ from fsoi.stats import lib_obimpact as loi
 from fsoi import log
 from fsoi.data.s3_datastore import FsoiS3DataStore, S3DataStore
 from fsoi.data.datastore import ThreadedDataStore
+from fsoi.ingest.rollup import update_rollups
+from fsoi.ingest.cube import update_cube
+from fsoi.ingest.fixed_width import FixedWidthReader
+from fsoi.ingest.line_batches import read_line_batches, default_batch_size
 
 
 def _parse_line(config, line, reader, unknown_platforms):
@@ -72,6 +77,111 @@ def _parse_line(config, line, reader, unknown_platforms):
     return dataout
 
 
+def _parse_lines(config, lines, reader, unknown_platforms):
+    """
+    Parse a batch of lines at once; produces the same rows as calling _parse_line on each line
+    :param config: {dict} The UK Met configuration read from met_ingest.yaml
+    :param lines: {list} List of lines as {bytes} or {str}, without line terminators
+    :param reader: {FixedWidthReader} Reader created from the fortran format of the lines
+    :param unknown_platforms: {list} List to store unknown platforms
+    :return: {dict} Same keys as _parse_line, but each value is a NumPy array with one row per
+                    observation that was not skipped
+    """
+    # extract data from the configuration
+    kt = config['kt']
+
+    # parse the lines
+    datain = reader.read_columns(lines)
+
+    # put the tokens into well-named variables
+    ob = datain[1]
+    omf = datain[2]
+    sens = datain[3]
+    lat = datain[4]
+    lon = datain[5]
+    lev = datain[6]
+    obtyp = datain[7]
+    instyp = datain[8]
+    oberr = datain[10]
+    schar = datain[12]
+
+    # calculate the impact value
+    impact = omf * sens
+
+    # determine which observations should be skipped (see _skip_ob)
+    keep = ~(np.abs(impact) > 1.e-3)
+    for i in np.flatnonzero(~keep):
+        line = lines[i].decode() if type(lines[i]) == bytes else lines[i]
+        log.warning('SKIPPING : %s' % line.strip())
+
+    # resolve the platform, channel and observation type once for each unique (obtyp, schar, instyp)
+    rows = np.flatnonzero(keep)
+    keys = pd.DataFrame({'obtyp': obtyp[rows], 'schar': schar[rows], 'instyp': instyp[rows]})
+    codes = keys.groupby(['obtyp', 'schar', 'instyp'], sort=False).ngroup().values
+    platforms = []
+    channels = []
+    obtypes = []
+    for (unique_obtyp, unique_schar, unique_instyp) in keys.drop_duplicates().itertuples(index=False):
+        try:
+            platform, channel = _get_platform_channel(config, int(unique_obtyp), str(unique_schar),
+                                                      int(unique_instyp), unknown_platforms)
+            obtypes.append(kt[int(unique_obtyp)][0])
+        except Exception:
+            platform, channel = None, -999
+            obtypes.append(None)
+        platforms.append(platform)
+        channels.append(channel)
+    platforms = np.array(platforms, dtype=object)[codes]
+
+    # lines that could not be parsed are skipped
+    parsed = np.not_equal(platforms, None)
+    for i in rows[~parsed]:
+        log.warning('Failed to parse line: %s' % lines[i])
+    rows = rows[parsed]
+    codes = codes[parsed]
+
+    dataout = dict()
+    dataout['platform'] = platforms[parsed]
+    dataout['channel'] = np.array(channels, dtype=np.int64)[codes]
+    dataout['obtype'] = np.array(obtypes, dtype=object)[codes]
+    dataout['lat'] = lat[rows]
+    dataout['lon'] = lon[rows]
+    dataout['lev'] = np.where(lev == -9999.9999, -999., lev)[rows]
+    dataout['impact'] = impact[rows]
+    dataout['omf'] = omf[rows]
+    dataout['ob'] = ob[rows]
+    dataout['oberr'] = oberr[rows]
+
+    return dataout
+
+
+def _parse_each_line(config, lines, reader, unknown_platforms):
+    """
+    Parse a batch of lines one line at a time, skipping lines that cannot be parsed
+    :param config: {dict} The UK Met configuration read from met_ingest.yaml
+    :param lines: {list} List of lines as {bytes} or {str}
+    :param reader: {FortranRecordReader} Object to parse a line
+    :param unknown_platforms: {list} List to store unknown platforms
+    :return: {dict} Same as _parse_lines
+    """
+    rows = []
+    for line in lines:
+        try:
+            data = _parse_line(config, line, reader, unknown_platforms)
+        except Exception:
+            log.warning('Failed to parse line: %s' % line)
+            continue
+        if data is not None:
+            rows.append(data)
+
+    dataout = dict()
+    for key in ['platform', 'channel', 'obtype', 'lat', 'lon', 'lev', 'impact', 'omf', 'ob', 'oberr']:
+        dtype = object if key in ['platform', 'obtype'] else (np.int64 if key == 'channel' else np.float64)
+        dataout[key] = np.array([row[key] for row in rows], dtype=dtype)
+
+    return dataout
+
+
 def _get_platform_channel(config, obtyp, schar, instyp, unknown_platforms):
     """
     Get a platform and channel
@@ -167,7 +277,13 @@ def main():
         log.error('Input data not available')
         return
 
-    process_met(input_file, output_path, date, date_str)
+    output_files = process_met(input_file, output_path, date, date_str)
+
+    # add the cycle to the month and season rollups and the comparison cube
+    if output_files and not update_rollups('MET', 'moist', date_str):
+        log.error('Failed to update rollups for MET %s' % date_str)
+    if output_files and not update_cube('MET', 'moist', date_str):
+        log.error('Failed to update the comparison cube for MET %s' % date_str)
 
     # maybe remove the input file
     if remove_input_file:
@@ -182,7 +298,7 @@ def process_met(input_file, output_path, date, date_str):
     :param output_path: {str} Full path to the output directory
     :param date: {datetime} A localized to UTC datetime object
     :param date_str: {str} A datetime string in the format YYYYMMDDHH
-    :return: {list} A list of output files, or None
+    :return: {list} A list of output files, or an empty list if there were no observations or an upload failed
     """
     # client to notify SNS topic if there are unknown platforms
     sns = boto3.client("sns")
@@ -195,86 +311,82 @@ def process_met(input_file, output_path, date, date_str):
 
     # pylint wrongly believes that the FortranRecordReader constructor is not callable
     # pylint: disable=E1102
-    reader = FortranRecordReader(config['fortran_format_string'])
+    line_reader = FortranRecordReader(config['fortran_format_string'])
+    reader = FixedWidthReader(config['fortran_format_string'])
+    batch_size = config.get('batch_size', default_batch_size)
 
-    # process each line in the file
-    # read the lines from the data file
+    # decompress and parse the lines in batches; like the line-by-line reader, keep the lines before a bad tail
     fh = gzip.open(input_file, 'rb')
-    bufr = []
-    nobs = 0
-    while True:
+    batches = []
+    for lines in read_line_batches(fh, batch_size, allow_truncated=True):
         try:
-            line = fh.readline()
-            if line == b'':
-                break
-        except Exception as e:
-            log.warning('Unexpected end of file after %d lines read' % nobs)
-            log.warning(e)
-            break
-
-        # parse a single line and increase the observation count
-        data = None
-        try:
-            data = _parse_line(config, line, reader, unknown_platforms)
+            data = _parse_lines(config, lines, reader, unknown_platforms)
         except Exception:
-            log.warning('Failed to parse line: %s' % line)
-
-        if data is None:
-            continue
-        nobs += 1
-
-        # extract the data from the parsed line
-        plat = data['platform']
-        channel = data['channel']
-        obtype = data['obtype']
-        lon = data['lon'] if data['lon'] >= 0.0 else data['lon'] + 360.0
-        lat = data['lat']
-        lev = data['lev']
-        imp = data['impact']
-        omf = data['omf']
-        oberr = data['oberr']
-
-        # reformat the data and add a new line
-        line = [plat, obtype, channel, lon, lat, lev, imp, omf, oberr]
-        bufr.append(line)
+            # a malformed line spoils the whole batch, so fall back to parsing one line at a time
+            log.warning('Failed to parse a batch of %d lines, parsing one line at a time' % len(lines))
+            data = _parse_each_line(config, lines, line_reader, unknown_platforms)
+        if len(data['impact']) > 0:
+            batches.append(data)
+    fh.close()
+
+    nobs = sum(len(data['impact']) for data in batches)
+    bufr = None
+    if batches:
+        data = {key: np.concatenate([batch[key] for batch in batches]) for key in batches[0]}
+        del batches
+        bufr = {
+            'PLATFORM': data['platform'],
+            'OBTYPE': data['obtype'],
+            'CHANNEL': data['channel'],
+            'LONGITUDE': np.where(data['lon'] >= 0.0, data['lon'], data['lon'] + 360.0),
+            'LATITUDE': data['lat'],
+            'PRESSURE': data['lev'],
+            'IMPACT': data['impact'],
+            'OMF': data['omf'],
+            'OBERR': data['oberr']
+        }
 
     # write the output files and upload to the S3 datastore
     os.makedirs(output_path, exist_ok=True)
     datastore = ThreadedDataStore(FsoiS3DataStore(), thread_pool_size=4)
     output_file = 'MET.moist.%s.h5' % date_str
+    output_files = []
     if bufr:
-        df = loi.list_to_dataframe(date, bufr)
+        df = loi.columns_to_dataframe(date, bufr)
         local_file = '%s/%s' % (output_path, output_file)
-        lutils.writeHDF(local_file, 'df', df, complevel=1, complib='zlib', fletcher32=True)
+        lutils.writeHDF(local_file, 'df', df, complevel=1, complib='zlib', fletcher32=True, coded=True)
         descriptor = FsoiS3DataStore.create_descriptor(center='MET', norm='moist', datetime=date_str)
         datastore.save_from_local_file(local_file, descriptor)
 
-        df = loi.BulkStats(df)
+        platforms = loi.Platforms('OnePlatform')
+        bulk, accumbulk, groupbulk = loi.allBulkStats(df, platforms)
+
         local_file = '%s/bulk.%s' % (output_path, output_file)
-        lutils.writeHDF(local_file, 'df', df)
+        lutils.writeHDF(local_file, 'df', bulk, coded=True)
         descriptor = FsoiS3DataStore.create_descriptor(center='MET', norm='moist', datetime=date_str, type='bulk')
         datastore.save_from_local_file(local_file, descriptor)
 
-        df = loi.accumBulkStats(df)
         local_file = '%s/accumbulk.%s' % (output_path, output_file)
-        lutils.writeHDF('%s/accumbulk.%s' % (output_path, output_file), 'df', df)
+        lutils.writeHDF('%s/accumbulk.%s' % (output_path, output_file), 'df', accumbulk, coded=True)
         descriptor = FsoiS3DataStore.create_descriptor(center='MET', norm='moist', datetime=date_str, type='accumbulk')
         datastore.save_from_local_file(local_file, descriptor)
 
-        platforms = loi.Platforms('OnePlatform')
-        df = loi.groupBulkStats(df, platforms)
         local_file = '%s/groupbulk.%s' % (output_path, output_file)
-        lutils.writeHDF('%s/groupbulk.%s' % (output_path, output_file), 'df', df)
+        lutils.writeHDF('%s/groupbulk.%s' % (output_path, output_file), 'df', groupbulk, coded=True)
         descriptor = FsoiS3DataStore.create_descriptor(center='MET', norm='moist', datetime=date_str, type='groupbulk')
         datastore.save_from_local_file(local_file, descriptor)
 
+        output_files = ['%s/%s' % (output_path, output_file), '%s/bulk.%s' % (output_path, output_file),
+                        '%s/accumbulk.%s' % (output_path, output_file), '%s/groupbulk.%s' % (output_path, output_file)]
+
     # wait here for uploads to finish
     datastore.join()
 
     # check for errors saving data to S3
     for operation in datastore.operations:
         if not operation.success:
-            log.debug('Failed to save file to S3: %s' % operation.parameters[0])
+            log.error('Failed to save file to S3: %s' % operation.parameters[0])
+            output_files = []
 
     # log a summary
     log.debug('Total obs = %d' % nobs)
@@ -288,6 +400,8 @@ def process_met(input_file, output_path, date, date_str):
                     ', '.join(str(e) for e in unknown_platforms) + ', file timestamp : ' + date_str
         )
 
+    return output_files
+
 
 
 if __name__ == '__main__':
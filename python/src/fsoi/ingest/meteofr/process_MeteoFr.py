@@ -312,7 +312,7 @@ if __name__ == '__main__':
     if bufr != []:
         df = pd.concat(bufr)
         if os.path.isfile(fname_out): os.remove(fname_out)
-        lutils.writeHDF(fname_out, 'df', df, complevel=1, complib='zlib', fletcher32=True)
+        lutils.writeHDF(fname_out, 'df', df, complevel=1, complib='zlib', fletcher32=True, coded=True)
 
     print('total number of observations for %s = %d' % (args.adate, nobs))
 
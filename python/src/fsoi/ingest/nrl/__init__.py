@@ -15,6 +15,8 @@ from fsoi.ingest.nrl.process_nrl import prepare_workspace
 from fsoi.ingest.nrl.process_nrl import download_from_s3
 from fsoi.ingest.nrl.process_nrl import process_nrl
 from fsoi.ingest.nrl.process_nrl import upload_to_s3
+from fsoi.ingest.rollup import update_rollups
+from fsoi.ingest.cube import update_cube
 from fsoi import log
 from fsoi.fsoilog import enable_cloudwatch_logs
 
@@ -77,6 +79,12 @@ def download_and_process_nrl():
             if not upload_to_s3(processed_file, target_url):
                 log.error('Failed to upload file to S3: aws s3 cp %s %s' % (processed_file, target_url))
 
+        # add the cycle to the month and season rollups and the comparison cube
+        if processed_files and not update_rollups('NRL', 'dry', date):
+            log.error('Failed to update rollups for NRL %s' % date)
+        if processed_files and not update_cube('NRL', 'dry', date):
+            log.error('Failed to update the comparison cube for NRL %s' % date)
+
         file_count = len(processed_files)
         ok = file_count > 0
 
@@ -11,27 +11,22 @@ import pkgutil
 import json
 import boto3
 import yaml
-from ftplib import FTP
 from argparse import ArgumentParser
 from argparse import ArgumentDefaultsHelpFormatter as HelpFormatter
 from fsoi import log
+from fsoi.data.ftp_pool import FtpConnectionPool
 
 
-def ftp_download_file(host, remote_file, local_file=None):
+def ftp_download_file(host, remote_file, local_file=None, pool=None):
     """
     Download a file from an FTP site anonymously
     :param host: FTP hostname
     :param remote_file: Full path to the remote file
     :param local_file: Full path to the local file
-    :return: None
+    :param pool: {FtpConnectionPool} Reuse a session from this pool, or None to open a new session
+    :return: Full path to the local file, or None
     """
-    # connect and login
-    ftp = FTP(host)
-    ftp.login()
-    ftp.makepasv()
-
     # parse file names
-    remote_dir = remote_file[0:remote_file.rfind('/')]
     remote_file_only = remote_file[1 + remote_file.rfind('/'):]
     if local_file is None:
         local_file = '/tmp/' + remote_file_only
@@ -39,12 +34,14 @@ def ftp_download_file(host, remote_file, local_file=None):
     # log info
     log.info('attempting to download ftp://%s/%s' % (host, remote_file))
 
-    # download the remote file
-    ftp.cwd(remote_dir)
-    out = open(local_file, 'wb')
-    ftp.retrbinary('RETR ' + remote_file_only, out.write)
+    # download the remote file, resuming a partial download
+    if pool is None:
+        with FtpConnectionPool(host, size=1) as single:
+            successful = single.download(remote_file, local_file)
+    else:
+        successful = pool.download(remote_file, local_file)
 
-    return local_file
+    return local_file if successful else None
 
 
 def download_nrl(lag, ftp_host, remote_file_template, bucket_name):
@@ -56,16 +53,56 @@ def download_nrl(lag, ftp_host, remote_file_template, bucket_name):
     :param bucket_name: {str} The bucket name where the file should be uploaded
     :return: {str} S3 URL to the new file, or None
     """
-    status = {'ok': False, 'runtime': int(time.time()), 'size': -1, 'name': 'n/a'}
+    return download_nrl_lags([lag], ftp_host, remote_file_template, bucket_name, connections=1)[0]
 
-    try:
-        # compute the date and remote file name
+
+def download_nrl_lags(lags, ftp_host, remote_file_template, bucket_name, connections=None):
+    """
+    Download the files for several days from NRL in parallel and upload them to S3, e.g. to catch
+    up after an outage
+    :param lags: {list} Look for the files N days ago for each N in the list
+    :param ftp_host: {str} The FTP host name (FQDN)
+    :param remote_file_template: {str} The template to create the remote file name
+    :param bucket_name: {str} The bucket name where the files should be uploaded
+    :param connections: {int} Number of FTP sessions, or None to use the configured value
+    :return: {list} S3 URL to each new file (or None if it failed), in the order of the lags
+    """
+    if connections is None:
+        config = yaml.full_load(pkgutil.get_data('fsoi', 'ingest/nrl/nrl_ingest.yaml'))
+        connections = config['ftp_connections']
+
+    # compute the dates and remote file names
+    remote_files = []
+    for lag in lags:
         date = datetime.datetime.utcfromtimestamp(time.time() - lag * 86400)
         date_str = '%04d%02d%02d' % (date.year, date.month, date.day)
-        remote_file = remote_file_template.replace('DATE', date_str)
+        remote_files.append(remote_file_template.replace('DATE', date_str))
 
-        # download the file from the FTP site
-        local_file = ftp_download_file(ftp_host, remote_file)
+    # download the files from the FTP site in parallel, reusing the sessions
+    local_files = ['/tmp/' + remote_file[1 + remote_file.rfind('/'):] for remote_file in remote_files]
+    for remote_file in remote_files:
+        log.info('attempting to download ftp://%s/%s' % (ftp_host, remote_file))
+    with FtpConnectionPool(ftp_host, size=connections) as pool:
+        results = pool.download_many(list(zip(remote_files, local_files)))
+    local_files = [local_file if ok else None for (local_file, ok) in zip(local_files, results)]
+
+    s3 = boto3.client('s3')
+    return [_upload_file(s3, local_file, bucket_name) for local_file in local_files]
+
+
+def _upload_file(s3, local_file, bucket_name):
+    """
+    Upload a downloaded file to S3
+    :param s3: {botocore.client.S3} An S3 client
+    :param local_file: {str} Full path to the local file, or None if the download failed
+    :param bucket_name: {str} The bucket name where the file should be uploaded
+    :return: {str} S3 URL to the new file, or None
+    """
+    status = {'ok': False, 'runtime': int(time.time()), 'size': -1, 'name': 'n/a'}
+
+    try:
+        if local_file is None:
+            raise IOError('Failed to download file from NRL')
 
         # create the S3 object key
         key = local_file[local_file.rfind('/') + 1:]
@@ -78,7 +115,6 @@ def download_nrl(lag, ftp_host, remote_file_template, bucket_name):
         log.info('attempting to upload data to s3://%s/%s' % (bucket_name, key))
 
         # copy the file to an S3 object
-        s3 = boto3.client('s3')
         s3.upload_file(Filename=local_file, Bucket=bucket_name, Key=key)
 
         # check the response and print our CloudWatch information
@@ -109,15 +145,18 @@ def main():
     # setup the arg parser
     parser = ArgumentParser(description='Download GMAO data', formatter_class=HelpFormatter)
     parser.add_argument('--lag', help='time lag in days', type=int, default=lag_in_days)
+    parser.add_argument('--days', help='also download the previous N-1 days', type=int, default=1)
     parser.add_argument('--host', help='ftp-ex.nrlmry.navy.mil', type=str, default=ftp_host)
     parser.add_argument('--remote-path', help='Remote path template', default=file)
     parser.add_argument('--s3-bucket', help='Store in this bucket', default=bucket)
     args = parser.parse_args()
 
-    s3_url = download_nrl(args.lag, args.host, args.remote_path, args.s3_bucket)
+    lags = [args.lag + day for day in range(args.days)]
+    s3_urls = download_nrl_lags(lags, args.host, args.remote_path, args.s3_bucket)
 
-    if s3_url is not None:
-        log.info('File saved at %s' % s3_url)
+    for s3_url in s3_urls:
+        if s3_url is not None:
+            log.info('File saved at %s' % s3_url)
 
 
 if __name__ == '__main__':
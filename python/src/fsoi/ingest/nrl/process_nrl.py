@@ -4,11 +4,16 @@ import pkgutil
 import yaml
 import boto3
 import shutil
+import numpy as np
+import pandas as pd
 import fsoi.stats.lib_utils as lutils
 import fsoi.stats.lib_obimpact as loi
 from fsoi.fsoilog import enable_cloudwatch_logs
 from datetime import datetime
 from fortranformat import FortranRecordReader
+from fsoi.ingest.fixed_width import FixedWidthReader
+from fsoi.ingest.line_batches import read_line_batches, default_batch_size
+from fsoi.ingest.parallel_bz2 import ParallelBZ2Reader
 from fsoi import log
 
 
@@ -64,6 +69,68 @@ def _parse_line(line, kt, kx, fortran_format, uknownplats):
     return dataout
 
 
+def _parse_lines(lines, kt, kx, reader, uknownplats):
+    """
+    Parse a block of lines at once; produces the same rows as calling _parse_line on each line
+    :param lines: {list} List of lines as {bytes} or {str}, without line terminators
+    :param kt:
+    :param kx:
+    :param reader: {FixedWidthReader} Reader created from the fortran format of the lines
+    :param uknownplats: List saving unknown platform IDs
+    :return: {dict} Same keys as _parse_line, but each value is a NumPy array with one row per
+                    observation that was not skipped
+    """
+    datain = reader.read_columns(lines)
+
+    ob = datain[1]
+    omf = datain[4]
+    oberr = datain[5]
+    lat = datain[7]
+    lon = datain[8]
+    lev = datain[9]
+    obtyp = datain[10]
+    instyp = datain[11]
+    resid = datain[22]
+    sens = datain[23]
+
+    impact = omf * sens
+
+    # discard [land_surface,ship] obs with zero impact (see _skip_ob)
+    keep = ~(np.isin(instyp, [1, 10]) & (impact == 0.))
+
+    # schar is only needed to find the platform and channel, so resolve each unique
+    # (instyp, schar) pair once, in order of first appearance
+    keys = pd.DataFrame({'instyp': instyp[keep], 'schar1': datain[15][keep], 'schar2': datain[16][keep]})
+    codes = keys.groupby(['instyp', 'schar1', 'schar2'], sort=False).ngroup().values
+    platforms = []
+    channels = []
+    for unique_instyp, schar1, schar2 in keys.drop_duplicates().itertuples(index=False):
+        schar = str(schar1) + '  ' + str(schar2)
+        platform, channel = _get_platform_channel(int(unique_instyp), schar, kx, uknownplats)
+        platforms.append(platform)
+        channels.append(channel)
+
+    obtyp = obtyp[keep]
+    unique_obtyp, obtyp_codes = np.unique(obtyp, return_inverse=True)
+    obtypes = np.array([kt[t][0] for t in unique_obtyp.tolist()], dtype=object)
+
+    dataout = {
+        'platform': np.array(platforms, dtype=object)[codes],
+        'channel': np.array(channels, dtype=np.int64)[codes],
+        'obtype': obtypes[obtyp_codes],
+        'lat': lat[keep],
+        'lon': lon[keep],
+        'lev': lev[keep],
+        'impact': impact[keep],
+        'omf': omf[keep],
+        'ob': ob[keep],
+        'oberr': oberr[keep],
+        'oma': resid[keep]
+    }
+
+    return dataout
+
+
 def _skip_ob(instyp, impact):
     """
     :param instyp:
@@ -225,13 +292,14 @@ def _get_platform_channel(instyp, schar, kx, uknownplats):
     return platform, channel
 
 
-def process_nrl(raw_bzip2_file, output_path, output_file, date):
+def process_nrl(raw_bzip2_file, output_path, output_file, date, workers=None):
     """
     Process a raw NRL file
     :param raw_bzip2_file: {str} Full path to a raw NRL gzip file
     :param output_path: {str} Full path to the output directory
     :param output_file: {str} Output file name only (will also create files with some prefixes)
     :param date: {str} Date and time string in the format YYYYMMDDHH
+    :param workers: {int} Number of threads decompressing the file, or None to use the configured value
     :return: {list} A list of output files, or None
     """
     sns = boto3.client("sns")
@@ -241,82 +309,69 @@ def process_nrl(raw_bzip2_file, output_path, output_file, date):
 
     parsed_date = datetime.strptime(date, '%Y%m%d%H')
 
-    # open the raw data file
-    try:
-        fh = bz2.BZ2File(raw_bzip2_file, 'rb')
-    except RuntimeError:
-        log.error('Failed to open file: %s' % raw_bzip2_file)
-        return None
-
-    # skip the first 75 lines
-    for _ in range(75):
-        fh.readline()
-
-    # read the remaining lines and close the file
-    lines = fh.readlines()
-    fh.close()
-
     # load constant values from a resources file
     config = yaml.full_load(pkgutil.get_data('fsoi', 'ingest/nrl/nrl_ingest.yaml'))
-    fortran_format = config['fortran_format_string']
+    reader = FixedWidthReader(config['fortran_format_string'])
     kt = config['kt']
     kx = config['kx']
+    batch_size = config.get('batch_size', default_batch_size)
+    workers = config.get('decompress_workers', 1) if workers is None else workers
 
-    # process each line
-    line_number = 75
-    n_obs = 0
-    bufr = []
-
-    for line in lines:
-
-        line_number += 1
-
-        # convert any byte array to a string
-        if isinstance(line, bytes):
-            line = line.decode()
-
-        data = _parse_line(line, kt, kx, fortran_format, unknown_platforms)
-
-        if data is None:
-            continue
-
-        n_obs += 1
-
-        plat = data['platform']
-        channel = data['channel']
-        obtype = data['obtype']
-        lon = data['lon'] if data['lon'] >= 0.0 else data['lon'] + 360.0
-        lat = data['lat']
-        lev = data['lev']
-        imp = data['impact']
-        omf = data['omf']
-        oberr = data['oberr']
+    # open the raw data file, decompressing blocks in parallel with more than one worker
+    try:
+        if workers > 1:
+            fh = ParallelBZ2Reader(raw_bzip2_file, workers)
+        else:
+            fh = bz2.BZ2File(raw_bzip2_file, 'rb')
+    except RuntimeError:
+        log.error('Failed to open file: %s' % raw_bzip2_file)
+        return None
 
-        line = [plat, obtype, channel, lon, lat, lev, imp, omf, oberr]
+    # decompress and parse the lines in batches, skipping the first 75 lines
+    batches = []
+    for lines in read_line_batches(fh, batch_size, skip_lines=75):
+        batches.append(_parse_lines(lines, kt, kx, reader, unknown_platforms))
+    fh.close()
 
-        bufr.append(line)
+    if not batches:
+        batches.append(_parse_lines([], kt, kx, reader, unknown_platforms))
+    data = {key: np.concatenate([batch[key] for batch in batches]) for key in batches[0]}
+    del batches
+    n_obs = len(data['impact'])
+
+    lon = data['lon']
+    bufr = {
+        'PLATFORM': data['platform'],
+        'OBTYPE': data['obtype'],
+        'CHANNEL': data['channel'],
+        'LONGITUDE': np.where(lon >= 0.0, lon, lon + 360.0),
+        'LATITUDE': data['lat'],
+        'PRESSURE': data['lev'],
+        'IMPACT': data['impact'],
+        'OMF': data['omf'],
+        'OBERR': data['oberr']
+    }
 
     # write a file if bufr is not empty
     output_files = []
-    if bufr:
+    if n_obs > 0:
         out = '%s/%s' % (output_path, output_file)
-        df = loi.list_to_dataframe(parsed_date, bufr)
+        df = loi.columns_to_dataframe(parsed_date, bufr)
         if os.path.isfile(out):
             os.remove(out)
-        lutils.writeHDF(out, 'df', df, complevel=1, complib='zlib', fletcher32=True)
+        lutils.writeHDF(out, 'df', df, complevel=1, complib='zlib', fletcher32=True, coded=True)
         output_files.append(out)
 
-        df = loi.BulkStats(df)
-        lutils.writeHDF('%s/bulk.%s' % (output_path, output_file), 'df', df)
+        platforms = loi.Platforms('OnePlatform')
+        bulk, accumbulk, groupbulk = loi.allBulkStats(df, platforms)
+
+        lutils.writeHDF('%s/bulk.%s' % (output_path, output_file), 'df', bulk, coded=True)
         output_files.append('%s/bulk.%s' % (output_path, output_file))
 
-        df = loi.accumBulkStats(df)
-        lutils.writeHDF('%s/accumbulk.%s' % (output_path, output_file), 'df', df)
+        lutils.writeHDF('%s/accumbulk.%s' % (output_path, output_file), 'df', accumbulk, coded=True)
         output_files.append('%s/accumbulk.%s' % (output_path, output_file))
 
-        platforms = loi.Platforms('OnePlatform')
-        df = loi.groupBulkStats(df, platforms)
-        lutils.writeHDF('%s/groupbulk.%s' % (output_path, output_file), 'df', df)
+        lutils.writeHDF('%s/groupbulk.%s' % (output_path, output_file), 'df', groupbulk, coded=True)
         output_files.append('%s/groupbulk.%s' % (output_path, output_file))
 
     else:
@@ -351,6 +406,8 @@ def main():
                             formatter_class=ArgumentDefaultsHelpFormatter)
     parser.add_argument('-d', '--date', help='analysis date to process', metavar='YYYYMMDDHH',
                         required=True)
+    parser.add_argument('-w', '--workers', help='number of threads decompressing the file [configured value if not specified]',
+                        type=int, required=False)
     args = parser.parse_args()
 
     # prepare the working directory
@@ -367,7 +424,7 @@ def main():
     config = yaml.full_load(pkgutil.get_data('fsoi', 'ingest/nrl/nrl_ingest.yaml'))
 
     # process the data
-    output_files = process_nrl(input_file, work_dir, output_file, date)
+    output_files = process_nrl(input_file, work_dir, output_file, date, args.workers)
     if not output_files:
         log.error('Error processing file: %s' % input_file)
     else:
@@ -0,0 +1,340 @@
+"""
+Decompress bzip2 files with a pool of threads.  A bzip2 stream is a sequence of independently
+compressed blocks that start with a 48-bit magic number, but are not aligned to byte boundaries.
+The compressed file is scanned for the block boundaries, and each block is shifted into a
+standalone single-block stream that the bz2 module decompresses (and checks against the block CRC)
+while the other blocks are being decompressed.  The bz2 module releases the GIL while it
+decompresses, so the blocks decompress in parallel.  The block CRCs are combined and checked against
+the CRC at the end of each stream.  The magic number can also appear by chance inside compressed
+data, so if a block fails to decompress, the rest of the file is decompressed sequentially from the
+start of the stream that contains that block, which raises the error if the data really are corrupt.
+"""
+
+import bz2
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from fsoi import log
+
+
+# magic number at the start of each compressed block (BCD pi)
+block_magic = 0x314159265359
+
+# magic number at the end of each stream (BCD sqrt(pi))
+end_magic = 0x177245385090
+
+
+def _magic_patterns(magic):
+    """
+    Create search patterns for a 48-bit magic number at each of the 8 possible bit offsets
+    :param magic: {int} The magic number
+    :return: {list} List of (bit offset, 5 byte pattern, 56-bit mask, 56-bit value) tuples
+    """
+    patterns = []
+    for shift in range(8):
+        value = magic << (8 - shift)
+        mask = ((1 << 48) - 1) << (8 - shift)
+        patterns.append((shift, value.to_bytes(7, 'big')[1:6], mask, value))
+
+    return patterns
+
+
+# search patterns for the block and end of stream magic numbers
+magic_patterns = [(kind, pattern) for (kind, magic) in [('block', block_magic), ('end', end_magic)]
+                  for pattern in _magic_patterns(magic)]
+
+
+def find_markers(data):
+    """
+    Find the start of every block and the end of every stream in bzip2 data
+    :param data: {bytes} Compressed data
+    :return: {list} Sorted list of (bit position, kind) tuples, where kind is 'block' or 'end'
+    """
+    markers = []
+    for (kind, (shift, pattern, mask, value)) in magic_patterns:
+        # the 5 bytes in the middle of the 7 bytes holding the magic number do not depend on
+        # the surrounding bits, so search for those and check the partial bytes at either end
+        pos = data.find(pattern, 1)
+        while 0 < pos and pos + 6 <= len(data):
+            window = int.from_bytes(data[pos - 1:pos + 6], 'big')
+            if window & mask == value:
+                markers.append((8 * (pos - 1) + shift, kind))
+            pos = data.find(pattern, pos + 1)
+
+    return sorted(set(markers))
+
+
+def _get_bits(data, start, nbits):
+    """
+    Get bits from data, aligned to a byte boundary
+    :param data: {bytes} The data
+    :param start: {int} Bit position of the first bit
+    :param nbits: {int} Number of bits, a multiple of 8
+    :return: {bytes} The bits
+    """
+    first = start // 8
+    last = (start + nbits + 7) // 8
+    bits = int.from_bytes(data[first:last], 'big') >> (8 * last - start - nbits)
+
+    return (bits & ((1 << nbits) - 1)).to_bytes(nbits // 8, 'big')
+
+
+def combine_crc(crc, block_crc):
+    """
+    Add the CRC of a block to the combined CRC of a stream
+    :param crc: {int} The combined CRC of the blocks before the block
+    :param block_crc: {int} The CRC of the block
+    :return: {int} The combined CRC
+    """
+    return (((crc << 1) | (crc >> 31)) ^ block_crc) & 0xffffffff
+
+
+def decompress_from(filename, start, skip=0, read_size=1024 * 1024):
+    """
+    Decompress a bzip2 file sequentially from the start of a stream to the end of the file.  The bz2
+    module checks the CRC of each block and stream, and the end of each stream.
+    :param filename: {str} Full path to the bzip2 file
+    :param start: {int} Bit position of the stream header in the file, which is on a byte boundary
+    :param skip: {int} Number of decompressed bytes to drop from the start, which were already read
+    :param read_size: {int} Number of compressed bytes to read from the file at a time
+    :return: {generator} Generates decompressed data; raises EOFError or OSError if the data are truncated
+                         or corrupt
+    """
+    with open(filename, 'rb') as fh:
+        fh.seek(start // 8)
+
+        # the following streams are byte aligned
+        decompressor = None
+        rest = b''
+        while True:
+            if decompressor is not None and decompressor.eof:
+                rest = decompressor.unused_data
+                decompressor = None
+            if not rest:
+                rest = fh.read(read_size)
+            if not rest and decompressor is None:
+                break
+            if decompressor is None:
+                decompressor = bz2.BZ2Decompressor()
+
+            # the decompressor may hold back output until it is called again, even without more data
+            out = decompressor.decompress(rest)
+            if not rest and not out and not decompressor.eof:
+                raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+            rest = b''
+
+            dropped = min(skip, len(out))
+            skip -= dropped
+            if dropped < len(out):
+                yield out[dropped:]
+
+
+def decompress_block(data, start, end):
+    """
+    Decompress a single block
+    :param data: {bytes} Compressed data that contains the block
+    :param start: {int} Bit position of the block magic number
+    :param end: {int} Bit position of the next magic number, or the end of the data
+    :return: {bytes} The decompressed block
+    """
+    first = start // 8
+    last = (end + 7) // 8
+    nbits = end - start
+
+    # the block bits, including the block magic number and CRC
+    bits = int.from_bytes(data[first:last], 'big') >> (8 * last - end)
+    bits &= (1 << nbits) - 1
+    crc = (bits >> (nbits - 80)) & 0xffffffff
+
+    # add the end of stream magic number and the stream CRC, which is the block CRC for a single
+    # block, then pad to a byte boundary
+    bits = (((bits << 48) | end_magic) << 32) | crc
+    nbits += 80
+    padding = -nbits % 8
+    stream = b'BZh9' + (bits << padding).to_bytes((nbits + padding) // 8, 'big')
+
+    return bz2.decompress(stream)
+
+
+class ParallelBZ2Reader:
+    """
+    A read-only binary file object that decompresses a bzip2 file with a pool of threads.  Blocks
+    are read, decompressed and returned in order, and only a few blocks per thread are in memory.
+    """
+
+    def __init__(self, filename, workers=4, read_size=8 * 1024 * 1024):
+        """
+        Open a bzip2 file
+        :param filename: {str} Full path to the bzip2 file
+        :param workers: {int} Number of threads decompressing blocks
+        :param read_size: {int} Number of compressed bytes to read from the file at a time
+        """
+        self.filename = filename
+        self.workers = workers
+        self.read_size = read_size
+        self.fh = open(filename, 'rb')
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = deque()
+        self.compressed = b''
+        self.offset = 0
+        self.decompressed = b''
+        self.eof = False
+        self.markers_found = False
+        self.sequential = None
+
+        # the start of the current stream, the number of bytes decompressed from it, and its combined CRC
+        self.stream_start = None
+        self.stream_size = 0
+        self.stream_crc = 0
+
+    def read(self, size=-1):
+        """
+        Read decompressed data
+        :param size: {int} Maximum number of bytes to read, or -1 to read to the end of the file
+        :return: {bytes} Decompressed data, or an empty bytes object at the end of the file
+        """
+        while size < 0 or len(self.decompressed) < size:
+            # after a block failed to decompress, the rest of the file is decompressed sequentially
+            if self.sequential is not None:
+                data = next(self.sequential, b'')
+                if not data:
+                    break
+                self.decompressed += data
+                continue
+
+            self._submit_blocks()
+            if not self.pending:
+                break
+            (future, start, crc) = self.pending.popleft()
+            if future is None:
+                self._end_stream(crc)
+                continue
+            try:
+                data = future.result()
+            except (EOFError, OSError, ValueError) as e:
+                log.warning('Failed to decompress the block at bit %d, decompressing sequentially: %s' %
+                            (start, self.filename))
+                log.warning(e)
+                self._decompress_sequentially(start)
+                continue
+
+            # the first block of a stream follows the 32-bit stream header
+            if self.stream_start is None:
+                self.stream_start = start - 32
+            self.decompressed += data
+            self.stream_size += len(data)
+            self.stream_crc = combine_crc(self.stream_crc, crc)
+
+        if size < 0:
+            size = len(self.decompressed)
+        data = self.decompressed[:size]
+        self.decompressed = self.decompressed[size:]
+
+        return data
+
+    def _submit_blocks(self):
+        """
+        Read compressed data and submit complete blocks to the thread pool, keeping up to two blocks
+        per thread in flight
+        :return: None
+        """
+        while not self.eof and len(self.pending) < 2 * self.workers:
+            data = self.fh.read(self.read_size)
+            self.eof = not data
+            self.compressed += data
+
+            markers = find_markers(self.compressed)
+            self.markers_found = self.markers_found or len(markers) > 0
+            if self.eof and not self.markers_found:
+                raise IOError('Not a bzip2 file: %s' % self.filename)
+
+            # submit the blocks that are followed by another block or the end of a stream, with the
+            # bit position and CRC of each block, and queue the stream CRC at the end of each stream
+            for ((start, kind), (end, _)) in zip(markers, markers[1:]):
+                if kind == 'block':
+                    future = self.executor.submit(decompress_block, self.compressed, start, end)
+                    self.pending.append((future, 8 * self.offset + start, self._read_crc(start)))
+                else:
+                    self.pending.append((None, 8 * self.offset + start, self._read_crc(start)))
+
+            # a block at the end of the file without an end of stream marker is truncated, which the
+            # sequential decompression reports
+            if self.eof and markers and markers[-1][1] == 'block':
+                future = self.executor.submit(self._truncated_block)
+                self.pending.append((future, 8 * self.offset + markers[-1][0], None))
+            elif self.eof and markers:
+                self.pending.append((None, 8 * self.offset + markers[-1][0], self._read_crc(markers[-1][0])))
+
+            # keep the data from the last marker, which may start a block that is not complete
+            if markers:
+                self.offset += markers[-1][0] // 8
+                self.compressed = self.compressed[markers[-1][0] // 8:]
+
+    def _read_crc(self, start):
+        """
+        Read the 32-bit CRC that follows a block or end of stream magic number
+        :param start: {int} Bit position of the magic number in the compressed data
+        :return: {int} The CRC, or None if the compressed data end before the CRC
+        """
+        if 8 * len(self.compressed) < start + 80:
+            return None
+
+        return int.from_bytes(_get_bits(self.compressed, start + 48, 32), 'big')
+
+    def _end_stream(self, crc):
+        """
+        Check the CRC at the end of a stream against the combined CRC of its blocks, which each passed
+        their own CRC check
+        :param crc: {int} The stream CRC, or None if the file ended before the stream CRC
+        :return: None; raises EOFError or OSError if the stream is truncated or corrupt
+        """
+        if crc is None:
+            raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+        if crc != self.stream_crc:
+            raise OSError('Invalid data stream, the stream CRC does not match: %s' % self.filename)
+
+        self.stream_start = None
+        self.stream_size = 0
+        self.stream_crc = 0
+
+    def _decompress_sequentially(self, start):
+        """
+        Stop decompressing blocks in parallel, and decompress the rest of the file sequentially from
+        the start of the stream that contains the block, so the bz2 module checks the stream CRC
+        :param start: {int} Bit position in the file of the block that failed to decompress
+        :return: None
+        """
+        for (future, _, _) in self.pending:
+            if future is not None:
+                future.cancel()
+        self.pending.clear()
+        self.compressed = b''
+        self.eof = True
+        if self.stream_start is None:
+            self.sequential = decompress_from(self.filename, start - 32, 0, self.read_size)
+        else:
+            self.sequential = decompress_from(self.filename, self.stream_start, self.stream_size, self.read_size)
+
+    @staticmethod
+    def _truncated_block():
+        """
+        Signal a block at the end of a truncated file
+        :return: None
+        """
+        raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+
+    def close(self):
+        """
+        Close the file and shut down the thread pool
+        :return: None
+        """
+        self.fh.close()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.pending.clear()
+        if self.sequential is not None:
+            self.sequential.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,379 @@
+"""
+Maintain per-month and per-season rollups of the group bulk statistics for each center, norm and
+cycle.  A rollup holds the number of cycles, sums and sums of squares for each platform (see
+lib_obimpact.rollupStats), so the time-averaged statistics of a long date range can be computed
+from a handful of rollup objects instead of one group bulk object per cycle.  The ETag of the group
+bulk object of each cycle is stored with the rollup, so a rollup of a reprocessed cycle is known to
+be out of date.
+"""
+
+import os
+import yaml
+import pkgutil
+import tempfile
+import shutil
+import calendar
+import pandas as pd
+from datetime import datetime, timedelta
+from argparse import ArgumentParser
+from argparse import ArgumentDefaultsHelpFormatter as FormatHelper
+from fsoi import log
+from fsoi.data.s3_datastore import S3DataStore, FsoiS3DataStore
+from fsoi.stats import lib_obimpact as loi
+from fsoi.stats import lib_utils as lutils
+
+# the three-month season of each month
+seasons = {12: 'DJF', 1: 'DJF', 2: 'DJF', 3: 'MAM', 4: 'MAM', 5: 'MAM',
+           6: 'JJA', 7: 'JJA', 8: 'JJA', 9: 'SON', 10: 'SON', 11: 'SON'}
+
+# the months of each season, in order
+season_months = {'DJF': [12, 1, 2], 'MAM': [3, 4, 5], 'JJA': [6, 7, 8], 'SON': [9, 10, 11]}
+
+
+def get_periods(date):
+    """
+    Get the month and season periods that contain a date.  Months are labeled YYYYMM, and seasons are
+    labeled with the year of their last month, e.g. December 2019 is in season 2020DJF.
+    :param date: {str} Date string YYYYMMDD or YYYYMMDDHH
+    :return: {list} The month and the season period labels
+    """
+    year = int(date[0:4])
+    month = int(date[4:6])
+    season_year = year + 1 if month == 12 else year
+
+    return ['%04d%02d' % (year, month), '%04d%s' % (season_year, seasons[month])]
+
+
+def get_period_dates(period):
+    """
+    Get all dates in a month or season period
+    :param period: {str} Period label: YYYYMM or YYYY plus a season name
+    :return: {list} List of date strings YYYYMMDD
+    """
+    year = int(period[0:4])
+    if period[4:] in season_months:
+        months = [(year - 1 if month == 12 else year, month) for month in season_months[period[4:]]]
+    else:
+        months = [(year, int(period[4:6]))]
+
+    dates = []
+    for (y, m) in months:
+        for day in range(1, calendar.monthrange(y, m)[1] + 1):
+            dates.append('%04d%02d%02d' % (y, m, day))
+
+    return dates
+
+
+def split_date_range(start_date, end_date):
+    """
+    Split a date range into whole seasons, whole months, and remaining dates
+    :param start_date: {str} Start date YYYYMMDD (inclusive)
+    :param end_date: {str} End date YYYYMMDD (inclusive)
+    :return: {list, list} List of period labels and list of remaining date strings YYYYMMDD
+    """
+    dates = []
+    date = datetime.strptime(start_date, '%Y%m%d')
+    end = datetime.strptime(end_date, '%Y%m%d')
+    while date <= end:
+        dates.append(date.strftime('%Y%m%d'))
+        date += timedelta(days=1)
+
+    # seasons before months, so the fewest objects cover the range
+    remaining = set(dates)
+    periods = []
+    for kind in [1, 0]:
+        for date in dates:
+            period = get_periods(date)[kind]
+            if period in periods:
+                continue
+            period_dates = get_period_dates(period)
+            if all(d in remaining for d in period_dates):
+                periods.append(period)
+                remaining.difference_update(period_dates)
+
+    return periods, sorted(remaining)
+
+
+def create_rollup_descriptor(center, norm, cycle, period):
+    """
+    Create a descriptor for a rollup object
+    :param center: {str} The center name
+    :param norm: {str} The norm (dry or moist)
+    :param cycle: {int} The cycle hour (0, 6, 12 or 18)
+    :param period: {str} The period label
+    :return: {dict} S3 descriptor with bucket and key
+    """
+    config = yaml.full_load(pkgutil.get_data('fsoi', 'data/datastore.yaml'))['fsoi']['s3']
+    key = config['rollup_key'] % (center, center, norm, period, int(cycle))
+
+    return {'bucket': config['bucket'], 'key': key}
+
+
+def read_rollup(datastore, descriptor, work_dir):
+    """
+    Read a rollup object
+    :param datastore: {S3DataStore} The data store
+    :param descriptor: {dict} The rollup descriptor
+    :param work_dir: {str} A working directory for temporary files
+    :return: {pandas.DataFrame, list, dict} The rollup, the list of datetimes it contains, and the ETag of
+                                            the group bulk object read for each datetime, or None, an empty
+                                            list and an empty dictionary if the rollup does not exist
+    """
+    local_file = '%s/%s' % (work_dir, os.path.basename(descriptor['key']))
+    if not datastore.load_to_local_file(descriptor, local_file):
+        return None, [], {}
+
+    rollup = lutils.readHDF(local_file, 'df')
+    dates = lutils.readHDF(local_file, 'dates')
+    os.remove(local_file)
+
+    # rollups written without ETags have none to compare
+    etags = dict(zip(dates['DATETIME'], dates['ETAG'])) if 'ETAG' in dates.columns else {}
+
+    return rollup, list(dates['DATETIME']), etags
+
+
+def write_rollup(datastore, descriptor, rollup, dates, work_dir, etags=None):
+    """
+    Write a rollup object
+    :param datastore: {S3DataStore} The data store
+    :param descriptor: {dict} The rollup descriptor
+    :param rollup: {pandas.DataFrame} The rollup
+    :param dates: {list} The list of datetimes (YYYYMMDDHH) in the rollup
+    :param work_dir: {str} A working directory for temporary files
+    :param etags: {dict} The ETag of the group bulk object read for each datetime, or None to store no ETags
+    :return: {bool} True if successful, otherwise False
+    """
+    local_file = '%s/%s' % (work_dir, os.path.basename(descriptor['key']))
+    if os.path.exists(local_file):
+        os.remove(local_file)
+
+    dates = pd.DataFrame({'DATETIME': sorted(dates)})
+    if etags is not None:
+        dates['ETAG'] = [etags.get(date_time) or '' for date_time in dates['DATETIME']]
+
+    lutils.writeHDF(local_file, 'df', rollup)
+    lutils.writeHDF(local_file, 'dates', dates)
+    saved = datastore.save_from_local_file(local_file, descriptor)
+    os.remove(local_file)
+
+    return saved
+
+
+def create_cycle_descriptor(center, norm, date_time):
+    """
+    Create a descriptor for the group bulk object of a cycle
+    :param center: {str} The center name
+    :param norm: {str} The norm (dry or moist)
+    :param date_time: {str} Date and cycle YYYYMMDDHH
+    :return: {dict} S3 descriptor with bucket and key
+    """
+    descriptor = FsoiS3DataStore.create_descriptor(center=center, norm=norm, datetime=date_time, type='groupbulk')
+    bucket, key = FsoiS3DataStore._to_bucket_and_key(descriptor)
+
+    return {'bucket': bucket, 'key': key}
+
+
+def get_cycle_etags(datastore, center, norm, date_times):
+    """
+    Get the ETags of the group bulk objects of a list of cycles, with a few list requests
+    :param datastore: {S3DataStore} The data store
+    :param center: {str} The center name
+    :param norm: {str} The norm (dry or moist)
+    :param date_times: {list} List of dates and cycles YYYYMMDDHH
+    :return: {dict} The ETag of each datetime, or None if the group bulk object does not exist
+    """
+    descriptors = [create_cycle_descriptor(center, norm, date_time) for date_time in date_times]
+
+    return dict(zip(date_times, datastore.etags_many(descriptors)))
+
+
+def read_cycle(datastore, center, norm, date_time, work_dir):
+    """
+    Read the group bulk statistics of a cycle, aggregated by unified platform
+    :param datastore: {S3DataStore} The data store
+    :param center: {str} The center name
+    :param norm: {str} The norm (dry or moist)
+    :param date_time: {str} Date and cycle YYYYMMDDHH
+    :param work_dir: {str} A working directory for temporary files
+    :return: {pandas.DataFrame} Statistics with DATETIME and PLATFORM index levels, or None if missing
+    """
+    descriptor = create_cycle_descriptor(center, norm, date_time)
+    local_file = '%s/%s' % (work_dir, os.path.basename(descriptor['key']))
+    if not datastore.load_to_local_file(descriptor, local_file):
+        return None
+
+    df = loi.aggregate_by_platform(lutils.readHDF(local_file, 'df'))
+    os.remove(local_file)
+
+    return df
+
+
+def update_rollups(center, norm, date_time, datastore=None):
+    """
+    Add the group bulk statistics of a cycle to the month and season rollups that contain it.  A cycle
+    that is already in a rollup is not added again, and a rollup is rebuilt if the cycle was reprocessed.
+    :param center: {str} The center name
+    :param norm: {str} The norm (dry or moist)
+    :param date_time: {str} Date and cycle YYYYMMDDHH
+    :param datastore: {S3DataStore} The data store, or None to create one
+    :return: {bool} True if successful, otherwise False
+    """
+    datastore = S3DataStore() if datastore is None else datastore
+    work_dir = tempfile.mkdtemp()
+    try:
+        # get the ETag before reading, so a later change to the object is not stored as read
+        etag = get_cycle_etags(datastore, center, norm, [date_time])[date_time]
+        df = None if etag is None else read_cycle(datastore, center, norm, date_time, work_dir)
+        if df is None:
+            log.error('Group bulk statistics are not available: %s %s %s' % (center, norm, date_time))
+            return False
+        cycle_rollup = loi.rollupStats(df)
+
+        ok = True
+        cycle = int(date_time[8:10])
+        for period in get_periods(date_time):
+            descriptor = create_rollup_descriptor(center, norm, cycle, period)
+            rollup, dates, etags = read_rollup(datastore, descriptor, work_dir)
+            if date_time in dates:
+                if etags.get(date_time) == etag:
+                    log.warn('Rollup already contains %s: %s' % (date_time, descriptor['key']))
+                    continue
+
+                # the sums of the earlier version of the cycle cannot be subtracted, so read every cycle again
+                log.info('Rebuilding rollup with reprocessed cycle %s: %s' % (date_time, descriptor['key']))
+                ok = rebuild_rollup(center, norm, cycle, period, datastore) and ok
+                continue
+
+            rollup = cycle_rollup if rollup is None else loi.mergeRollupStats([rollup, cycle_rollup])
+            etags[date_time] = etag
+            ok = write_rollup(datastore, descriptor, rollup, dates + [date_time], work_dir, etags) and ok
+
+        return ok
+
+    except Exception as e:
+        log.error('Failed to update rollups: %s %s %s' % (center, norm, date_time), e)
+        return False
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def rebuild_rollup(center, norm, cycle, period, datastore=None):
+    """
+    Rebuild a rollup from the group bulk statistics of every cycle in the period
+    :param center: {str} The center name
+    :param norm: {str} The norm (dry or moist)
+    :param cycle: {int} The cycle hour (0, 6, 12 or 18)
+    :param period: {str} The period label
+    :param datastore: {S3DataStore} The data store, or None to create one
+    :return: {bool} True if successful, otherwise False
+    """
+    datastore = S3DataStore() if datastore is None else datastore
+    work_dir = tempfile.mkdtemp()
+    try:
+        # get the ETags before reading, and skip the cycles that do not exist
+        etags = get_cycle_etags(datastore, center, norm,
+                                ['%s%02d' % (date, int(cycle)) for date in get_period_dates(period)])
+        frames = []
+        dates = []
+        for (date_time, etag) in etags.items():
+            df = None if etag is None else read_cycle(datastore, center, norm, date_time, work_dir)
+            if df is not None:
+                frames.append(df)
+                dates.append(date_time)
+
+        if not frames:
+            log.warn('No group bulk statistics for rollup: %s %s %02dZ %s' % (center, norm, int(cycle), period))
+            return False
+
+        descriptor = create_rollup_descriptor(center, norm, cycle, period)
+        return write_rollup(datastore, descriptor, loi.rollupStats(pd.concat(frames)), dates, work_dir, etags)
+
+    except Exception as e:
+        log.error('Failed to rebuild rollup: %s %s %02dZ %s' % (center, norm, int(cycle), period), e)
+        return False
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def read_rollups(center, norm, cycles, periods, datastore=None, date_times=None, etags=None):
+    """
+    Read and merge the rollups for a set of cycles and periods
+    :param center: {str} The center name
+    :param norm: {str} The norm (dry or moist)
+    :param cycles: {list} List of cycle hours
+    :param periods: {list} List of period labels
+    :param datastore: {S3DataStore} The data store, or None to create one
+    :param date_times: {list} The datetimes (YYYYMMDDHH) that the rollups should contain, or None to
+                              accept any rollup; a rollup with other datetimes is treated as missing
+    :param etags: {dict} The current ETag of the group bulk object of each datetime (see get_cycle_etags),
+                         or None to accept any rollup; a rollup read from other versions of the objects, or
+                         without an object that exists, is treated as missing
+    :return: {pandas.DataFrame, list} The merged rollup (None if no rollups exist), and a list of the
+                                      (cycle, period) pairs without a rollup
+    """
+    datastore = S3DataStore() if datastore is None else datastore
+    work_dir = tempfile.mkdtemp()
+    try:
+        rollups = []
+        missing = []
+        for cycle in cycles:
+            for period in periods:
+                descriptor = create_rollup_descriptor(center, norm, cycle, period)
+                rollup, dates, rollup_etags = read_rollup(datastore, descriptor, work_dir)
+                if rollup is not None and date_times is not None:
+                    period_dates = set(get_period_dates(period))
+                    expected = [d for d in date_times if int(d[8:10]) == int(cycle) and d[0:8] in period_dates]
+                    if sorted(dates) != sorted(expected):
+                        log.warn('Rollup is out of date: %s %s %02dZ %s' % (center, norm, int(cycle), period))
+                        rollup = None
+                if rollup is not None and etags is not None:
+                    period_dates = set(get_period_dates(period))
+                    current = {d: etag for (d, etag) in etags.items()
+                               if int(d[8:10]) == int(cycle) and d[0:8] in period_dates and etag is not None}
+                    if {d: rollup_etags.get(d) for d in dates} != current:
+                        log.warn('Rollup is out of date: %s %s %02dZ %s' % (center, norm, int(cycle), period))
+                        rollup = None
+                if rollup is None:
+                    missing.append((cycle, period))
+                else:
+                    rollups.append(rollup)
+
+        return (loi.mergeRollupStats(rollups) if rollups else None), missing
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    """
+    Rebuild the rollups for a center, norm and cycles over a range of months
+    :return: None
+    """
+    parser = ArgumentParser(description='Rebuild FSOI rollups', formatter_class=FormatHelper)
+    parser.add_argument('-c', '--center', help='center name', type=str, required=True)
+    parser.add_argument('-n', '--norm', help='norm', type=str, default='moist', choices=['dry', 'moist'])
+    parser.add_argument('-y', '--cycles', help='cycle hours', type=int, nargs='+', default=[0, 6, 12, 18])
+    parser.add_argument('-b', '--begin-date', help='first date', metavar='YYYYMMDD', required=True)
+    parser.add_argument('-e', '--end-date', help='last date', metavar='YYYYMMDD', required=True)
+    args = parser.parse_args()
+
+    periods = []
+    date = datetime.strptime(args.begin_date, '%Y%m%d')
+    while date <= datetime.strptime(args.end_date, '%Y%m%d'):
+        for period in get_periods(date.strftime('%Y%m%d')):
+            if period not in periods:
+                periods.append(period)
+        date += timedelta(days=1)
+
+    datastore = S3DataStore()
+    for cycle in args.cycles:
+        for period in periods:
+            if not rebuild_rollup(args.center, args.norm, cycle, period, datastore):
+                log.error('Failed to rebuild rollup: %s %s %02dZ %s' % (args.center, args.norm, cycle, period))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,19 @@
 import os
+import yaml
+import pkgutil
+import calendar
 import tempfile
-import numpy
 import pandas
 from datetime import datetime
 from fsoi import log
 from fsoi.data.datastore import ThreadedDataStore
 from fsoi.data.s3_datastore import FsoiS3DataStore, S3DataStore
-from fsoi.stats import lib_utils, lib_obimpact
+from fsoi.data.disk_cache import get_shared_cache
+from fsoi.data.frame_cache import get_shared_frame_cache
+from fsoi.data.storage_format import get_storage_format, get_storage_format_for_file
+from fsoi.stats import lib_obimpact
+from fsoi.ingest.rollup import split_date_range, get_period_dates, read_rollups, get_cycle_etags
+from fsoi.ingest.cube import read_comparison_cube
 from fsoi.plots.summary_fsoi import bokehsummaryplot, matplotlibsummaryplot, bokehsummarytseriesplot
 from fsoi.plots.compare_fsoi import bokehcomparesummaryplot, matplotlibcomparesummaryplot
 
@@ -111,7 +118,8 @@ class SummaryPlotGenerator(PlotGenerator):
     """
     A class to manage the creation of plots
     """
-    def __init__(self, start_date, end_date, center, norm, cycles, platforms, plot_util):
+
+    def __init__(self, start_date, end_date, center, norm, cycles, platforms, plot_util, datastore=None):
         """
         Create an object to manage a set of plots for one center
         :param start_date: {str} Start date in format YYYYMMDD
@@ -121,6 +129,7 @@ class SummaryPlotGenerator(PlotGenerator):
         :param cycles: {list} List of integers may include 0, 6, 12, and 18
         :param platforms: {list} List of platform strings
         :param plot_util: {str} May be 'bokeh' or 'matplotlib'
+        :param datastore: {S3DataStore} The data store of the rollups and the comparison cube, or None to create one
         """
         # call super constructor
         super().__init__()
@@ -134,10 +143,24 @@ class SummaryPlotGenerator(PlotGenerator):
         self.platforms = platforms
         self.plot_util = plot_util
 
+        # storage format of the group bulk statistics selected for this deployment
+        self.storage_format = get_storage_format()
+
         # additional empty fields
         self.descriptors = []
         self.json_data = []
-        self.pickles = []
+
+        # aggregated group bulk statistics handed off to the comparison plots, keyed by handoff name
+        self.frames = {}
+
+        # whole blocks of dates and dates at the edges of the range, and cached statistics of whole blocks
+        self.block = yaml.full_load(pkgutil.get_data('fsoi', 'data/datastore.yaml'))['fsoi']['block_cache']['block']
+        self.units = []
+        self.cached_blocks = {}
+
+        # statistics of whole seasons and months read from the rollups and the comparison cube
+        self.datastore = datastore
+        self.periods = {}
 
     def create_plot_set(self):
         """
@@ -146,6 +169,7 @@ class SummaryPlotGenerator(PlotGenerator):
         """
         # create the requested plots
         self._prepare_working_dir([self.center])
+        self._read_rollups()
         self._create_data_descriptors()
         self._download_data()
         self._create_plots()
@@ -159,28 +183,119 @@ class SummaryPlotGenerator(PlotGenerator):
         """
         data_dir = '%s/data/%s' % (self.work_dir, self.center)
 
-        # create the S3 data store
-        datastore = ThreadedDataStore(FsoiS3DataStore(), 5)
+        # create the S3 data store, reading through the disk cache shared with earlier requests
+        datastore = ThreadedDataStore(get_shared_cache(), 5)
+
+        # find the missing cycles and the versions of the others with a few list requests, instead of a
+        # request per object
+        for (descriptor, etag) in zip(self.descriptors, datastore.etags_many(self.descriptors)):
+            descriptor['etag'] = etag
+
+        # whole blocks of dates with statistics from an earlier request do not need to be downloaded
+        self._find_cached_blocks()
 
-        # download all the objects using the data store
+        # download all the available objects using the data store
         for descriptor in self.descriptors:
             # create the local file name
             descriptor['local_path'] = '%s%s' % (data_dir, descriptor['local_path'])
 
             # start the download
-            datastore.load_to_local_file(descriptor, descriptor['local_path'])
+            if descriptor['etag'] is not None and descriptor['block'] not in self.cached_blocks:
+                datastore.load_to_local_file(descriptor, descriptor['local_path'])
 
         # wait for downloads to finish
         datastore.join()
 
         # check that files were downloaded and prepare a response message
         for descriptor in self.descriptors:
-            if not os.path.exists(descriptor['local_path']):
+            cached = descriptor['block'] in self.cached_blocks
+            if descriptor['etag'] is None or (not cached and not os.path.exists(descriptor['local_path'])):
                 descriptor['downloaded'] = False
                 message = 'Missing data: %s' % S3DataStore.descriptor_to_string(descriptor)
                 self.warns.append(message)
             else:
-                descriptor['downloaded'] = True
+                descriptor['downloaded'] = not cached
+
+    def _read_rollups(self):
+        """
+        Read the statistics of the whole seasons and months in the range from the rollups, for the time
+        averages, and from the comparison cube, for the statistics of each cycle, instead of reading one
+        group bulk object per cycle.  A period is read from the group bulk objects instead if a rollup
+        is missing, does not contain the same cycles as the cube, or was read from other versions of the
+        group bulk objects.
+        :return: None
+        """
+        periods, _ = split_date_range(self.start_date, self.end_date)
+        if not periods:
+            return
+
+        norms = ['dry', 'moist'] if self.norm == 'both' else [self.norm]
+        cycles = [int(cycle) for cycle in self.cycles]
+        datastore = S3DataStore() if self.datastore is None else self.datastore
+        for period in periods:
+            dates = get_period_dates(period)
+            frames = []
+            rollups = []
+            warns = []
+            for norm in norms:
+                cube = read_comparison_cube([self.center], norm, cycles, dates[0], dates[-1], datastore)
+                if not cube:
+                    break
+                date_times = list(cube[self.center].index.get_level_values('DATETIME').unique().strftime('%Y%m%d%H'))
+                etags = get_cycle_etags(datastore, self.center, norm,
+                                        ['%s%02d' % (date, cycle) for date in dates for cycle in cycles])
+                rollup, missing = read_rollups(self.center, norm, cycles, [period], datastore, date_times, etags)
+                if missing:
+                    break
+                frames.append(cube[self.center])
+                rollups.append(rollup)
+
+                # the cycles of the period are not downloaded, so report the missing ones here
+                for date_time in [date_time for (date_time, etag) in etags.items() if etag is None]:
+                    descriptor = FsoiS3DataStore.create_descriptor(center=self.center, norm=norm, date=date_time[:8],
+                                                                   hour=date_time[8:], type='groupbulk',
+                                                                   format=self.storage_format.name)
+                    warns.append('Missing data: %s' % S3DataStore.descriptor_to_string(descriptor))
+            else:
+                self.periods[period] = (frames, lib_obimpact.mergeRollupStats(rollups))
+                self.warns += warns
+
+        log.info('Read %d of %d periods from rollups for %s' % (len(self.periods), len(periods), self.center))
+
+    def _find_cached_blocks(self):
+        """
+        Find the whole blocks of dates whose aggregated statistics were cached by an earlier request
+        from the same versions of the objects
+        :return: None
+        """
+        frame_cache = get_shared_frame_cache()
+        for (label, _) in self.units:
+            if label is None:
+                continue
+            descriptors = [descriptor for descriptor in self.descriptors if descriptor['block'] == label]
+            entry = frame_cache.get(self._block_key(label), self._block_version(descriptors))
+            if entry is not None:
+                self.cached_blocks[label] = entry
+
+        log.info('Reused %d of %d blocks for %s' %
+                 (len(self.cached_blocks), len([label for (label, _) in self.units if label]), self.center))
+
+    def _block_key(self, label):
+        """
+        Get the frame cache key of the statistics of a whole block of dates
+        :param label: {str} The block label
+        :return: {tuple} The cache key
+        """
+        return 'block', self.center, self.norm, tuple('%02d' % int(cycle) for cycle in self.cycles), label
+
+    @staticmethod
+    def _block_version(descriptors):
+        """
+        Get the version of the statistics of a whole block of dates
+        :param descriptors: {list} The descriptors of the objects in the block, in order
+        :return: {tuple} The ETags of the objects, with None for missing objects
+        """
+        return tuple(descriptor['etag'] for descriptor in descriptors)
 
     def _create_data_descriptors(self):
         """
@@ -190,55 +305,77 @@ class SummaryPlotGenerator(PlotGenerator):
         # create a list of norm values
         norms = ['dry', 'moist'] if self.norm == 'both' else [self.norm]
 
-        for date in self._dates_in_range(self.start_date, self.end_date):
-            for cycle in self.cycles:
-                for norm in norms:
-                    descriptor = FsoiS3DataStore.create_descriptor(
-                        type='groupbulk',
-                        center=self.center,
-                        norm=norm,
-                        date=date,
-                        hour=('%02d' % int(cycle))
-                    )
-                    descriptor['local_path'] = FsoiS3DataStore.get_suggested_file_name(descriptor)
-                    self.descriptors.append(descriptor)
+        # skip the periods read from the rollups, and split the other dates into whole blocks, whose
+        # statistics are cached, and dates at the edges
+        covered = set(date for period in self.periods for date in get_period_dates(period))
+        dates = [date for date in self._dates_in_range(self.start_date, self.end_date) if date not in covered]
+        self.units = self._split_into_blocks(dates, self.block)
+
+        for (label, dates) in self.units:
+            for date in dates:
+                for cycle in self.cycles:
+                    for norm in norms:
+                        descriptor = FsoiS3DataStore.create_descriptor(
+                            type='groupbulk',
+                            center=self.center,
+                            norm=norm,
+                            date=date,
+                            hour=('%02d' % int(cycle)),
+                            format=self.storage_format.name
+                        )
+                        descriptor['local_path'] = FsoiS3DataStore.get_suggested_file_name(descriptor)
+                        descriptor['block'] = label
+                        self.descriptors.append(descriptor)
 
     def _create_plots(self):
         """
         Run the fsoi_summary.py script on the groupbulk statistics
         :return: None
         """
-        # create a list of downloaded files for this center
-        files = []
-        for descriptor in self.descriptors:
-            if descriptor['downloaded']:
-                files.append(descriptor['local_path'])
-
-        # read all of the files
-        ddf = {}
-        for (i, file) in enumerate(files):
-            try:
-                ddf[i] = self._aggregate_by_platform(lib_utils.readHDF(file, 'df'))
-            except Exception as e:
-                log.error('Failed to aggregate by platform: %s' % file, e)
+        # read the files of each whole block and each date at the edges of the range, in order, and reuse
+        # the statistics of whole blocks from earlier requests
+        frames = []
+        accumulator = lib_obimpact.TavgAccumulator('PLATFORM')
+        frame_cache = get_shared_frame_cache()
+        for (label, dates) in self.units:
+            if label in self.cached_blocks:
+                (unit_frames, unit_accumulator) = self.cached_blocks[label]
+            else:
+                descriptors = [descriptor for descriptor in self.descriptors if descriptor['date'] in dates]
+                (unit_frames, unit_accumulator, complete) = self._read_unit(descriptors, frame_cache)
+
+                # cache the statistics of a whole block if every available object was read at its listed ETag
+                if label is not None and complete:
+                    size = sum(int(df.memory_usage(index=True, deep=True).sum()) for df in unit_frames)
+                    frame_cache.put(self._block_key(label), (unit_frames, unit_accumulator),
+                                    self._block_version(descriptors), size)
+
+            frames += unit_frames
+            accumulator.merge(unit_accumulator)
+        log.info('Data frame cache: %s' % frame_cache.stats())
+
+        # add the statistics of the periods read from the rollups, in time order
+        if self.periods:
+            rollups = [rollup for (_, rollup) in self.periods.values()]
+            if frames:
+                rollups.append(lib_obimpact.rollupStats(pandas.concat(frames)))
+            frames += [df for (period_frames, _) in self.periods.values() for df in period_frames]
+            frames.sort(key=lambda df: df.index.get_level_values('DATETIME').min())
 
         # finish if we have no data
-        if not ddf:
+        if not frames:
             self.warns.append('No data available for %s' % self.center)
             return
 
-        # concatenate the group bulk data and save to a pickle
-        concatenated = pandas.concat(ddf, axis=0)
-        pickle_dir = '%s/work/%s/%s' % (self.work_dir, self.center, self.norm)
-        pickle_file = '%s/%s_group_stats.pkl' % (pickle_dir, self.center)
-        os.makedirs(pickle_dir, exist_ok=True)
-        if os.path.exists(pickle_file):
-            os.remove(pickle_file)
-        lib_utils.pickle(pickle_file, concatenated)
-        self.pickles.append(pickle_file)
+        # concatenate the group bulk data and keep it for the comparison plots
+        concatenated = pandas.concat(dict(enumerate(frames)), axis=0)
+        self.frames['%s_group_stats.arrow' % self.center] = concatenated
 
         # time-average the data frames
-        df, df_std = lib_obimpact.tavg(concatenated, 'PLATFORM')
+        if self.periods:
+            df, df_std = lib_obimpact.tavgRollupStats(lib_obimpact.mergeRollupStats(rollups))
+        else:
+            df, df_std = accumulator.result()
         df = lib_obimpact.summarymetrics(df)
 
         # cycle data frames
@@ -303,6 +440,73 @@ class SummaryPlotGenerator(PlotGenerator):
             except Exception as e:
                 log.error('Failed to generate summary plots for %s' % qty, e)
 
+    def _read_unit(self, descriptors, frame_cache):
+        """
+        Read and aggregate the downloaded files of a whole block of dates or a date at an edge of the range
+        :param descriptors: {list} The descriptors of the objects, in order
+        :param frame_cache: {FrameCache} Cache of the aggregated data of each file
+        :return: {list, TavgAccumulator, bool} The aggregated data of each file, the accumulated statistics,
+                                               and True if every available object was read at its listed ETag
+        """
+        # platforms are not filtered here, since FracImp is relative to all platforms
+        columns = ['TotImp', 'ObCnt', 'ObCntBen', 'ObCntNeu']
+        frames = []
+        accumulator = lib_obimpact.TavgAccumulator('PLATFORM')
+        complete = all(descriptor['downloaded'] for descriptor in descriptors if descriptor['etag'] is not None)
+        for descriptor in descriptors:
+            if not descriptor['downloaded']:
+                continue
+            file = descriptor['local_path']
+            try:
+                # reuse the aggregated data from an earlier request if the file has not changed
+                key = (descriptor['center'], descriptor['norm'], descriptor['date'] + descriptor['hour'])
+                version = get_shared_cache().etag(descriptor)
+                if version != descriptor['etag']:
+                    # the file read is not the listed version, so the block must not be cached under it
+                    complete = False
+                df = frame_cache.get(key, version)
+                if df is None:
+                    df = get_storage_format_for_file(file).read(file, columns=columns)
+                    df = self._aggregate_by_platform(df)
+                    if version is not None:
+                        frame_cache.put(key, df, version)
+                accumulator.add(df)
+                frames.append(df)
+            except Exception as e:
+                complete = False
+                log.error('Failed to aggregate by platform: %s' % file, e)
+
+        return frames, accumulator, complete
+
+    @staticmethod
+    def _split_into_blocks(dates, block='week'):
+        """
+        Split a range of dates into whole blocks aligned to the calendar and the dates at the edges of the
+        range, so the statistics of a whole block can be shared by every range that contains it
+        :param dates: {list} Consecutive dates yyyyMMdd, in order
+        :param block: {str} May be 'week' (Monday to Sunday) or 'month'
+        :return: {list} List of (label, dates) tuples in order; the label of a date at an edge is None
+        """
+        groups = []
+        for date in dates:
+            day = datetime.strptime(date, '%Y%m%d')
+            label = '%04dW%02d' % day.isocalendar()[0:2] if block == 'week' else date[0:6]
+            if groups and groups[-1][0] == label:
+                groups[-1][1].append(date)
+            else:
+                groups.append((label, [date]))
+
+        units = []
+        for (label, block_dates) in groups:
+            day = datetime.strptime(block_dates[0], '%Y%m%d')
+            length = 7 if block == 'week' else calendar.monthrange(day.year, day.month)[1]
+            if len(block_dates) == length:
+                units.append((label, block_dates))
+            else:
+                units += [(None, [date]) for date in block_dates]
+
+        return units
+
     @staticmethod
     def _dates_in_range(start_date, end_date):
         """
@@ -338,62 +542,14 @@ class SummaryPlotGenerator(PlotGenerator):
         :param df: The original data frame, which will be deleted upon successful completion
         :return: {pandas.DataFrame} A new data frame with data aggregated by unified platform list
         """
-        # turn the unified platform list inside-out for quick look up
-        platform_to_aggregate_map = {}
-        unified_platforms = lib_obimpact.Platforms('OnePlatform')
-        for common_platform in unified_platforms:
-            for specific_platform in unified_platforms[common_platform]:
-                platform_to_aggregate_map[specific_platform] = common_platform
-            platform_to_aggregate_map[common_platform] = common_platform
-
-        # iterate through the rows of the data frame and make a new data array
-        columns = ['TotImp', 'ObCnt', 'ObCntBen', 'ObCntNeu']
-        common_row_map = {}
-        for index, row in df.iterrows():
-            # get the date/time and specific platform from the index
-            dt, specific_platform = index
-
-            # get the common platform name for this row
-            if specific_platform in platform_to_aggregate_map:
-                common_platform = platform_to_aggregate_map[specific_platform]
-            else:
-                common_platform = 'Unknown'
-                log.warn('Unknown platform: %s' % specific_platform)
-
-            # create the common index
-            common_index = (dt, common_platform)
-
-            # get (or create a new) data row for the common platform name
-            if common_index not in common_row_map:
-                common_row_map[common_index] = [dt, common_platform] + [0] * len(columns)
-            common_row = common_row_map[common_index]
-
-            # sum the values from the row with the new common row
-            for i in range(len(row)):
-                common_row[i+2] += row[i]
-
-        # put the new values into a new values array
-        common_values = [common_row_map[common_index][2:] for common_index in common_row_map]
-
-        # create the new index for the common data frame
-        common_platform_list = [common_index[1] for common_index in common_row_map]
-        levels = [[list(common_row_map)[0][0]], common_platform_list]
-        codes = [[0] * len(common_platform_list), list(range(len(common_platform_list)))]
-        new_index = pandas.MultiIndex(levels=levels, codes=codes, names=['DATETIME', 'PLATFORM'])
-        common_df = pandas.DataFrame(
-            common_values,
-            index=new_index,
-            columns=columns
-        )
-
-        return common_df
+        return lib_obimpact.aggregate_by_platform(df)
 
 
 class ComparisonPlotGenerator(PlotGenerator):
     """
     A class to manage the creation of plots
     """
-    def __init__(self, centers, norm, cycles, platforms, plot_util, pickles):
+    def __init__(self, centers, norm, cycles, platforms, plot_util, frames):
         """
         Create an object to manage a set of inter-center comparison plots
         :param centers: {list} List of strings of center names
@@ -401,7 +557,8 @@ class ComparisonPlotGenerator(PlotGenerator):
         :param cycles: {list} List of integers may include 0, 6, 12, and 18
         :param platforms: {list} List of platform strings
         :param plot_util: {str} May be 'bokeh' or 'matplotlib'
-        :param pickles: {list} List of pickle files for all centers
+        :param frames: {list} List of data frames with the aggregated group bulk statistics of each center,
+                              from the summary plots or the comparison cube
         """
         # call the super constructor
         super().__init__()
@@ -412,7 +569,7 @@ class ComparisonPlotGenerator(PlotGenerator):
         self.cycles = cycles
         self.platforms = platforms
         self.plot_util = plot_util
-        self.pickles = pickles
+        self.frames = frames
 
         self.json_data = []
 
@@ -487,12 +644,8 @@ class ComparisonPlotGenerator(PlotGenerator):
         :return: {list<pandas.DataFrame>} The loaded data as a list of data frames
         """
         data_frame_list = []
-        for pickle in self.pickles:
-            df = lib_utils.unpickle(pickle)
-            dt_filter = df.index.get_level_values('DATETIME').hour == -1
-            for c in self.cycles:
-                dt_filter = numpy.ma.logical_or(dt_filter, df.index.get_level_values('DATETIME').hour == c)
-            df = df[dt_filter]
+        for df in self.frames:
+            df = lib_obimpact.select(df, cycles=self.cycles)
 
             df, df_std = lib_obimpact.tavg(df, level='PLATFORM')
             df = lib_obimpact.summarymetrics(df)
@@ -14,6 +14,9 @@ from fsoi.stats import lib_utils as _lutils
 
 all_platforms = {}
 
+# the unified platform list turned inside-out, created on first use
+one_platform_map = {}
+
 
 class FSOI(object):
     """
@@ -389,10 +392,61 @@ def list_to_dataframe(adate, data):
     return df
 
 
+def columns_to_dataframe(adate, data):
+    """
+    INPUT:  data = dictionary of columns. Each key is a column name and each value is an array
+           adate = date to append to the dataframe
+    OUTPUT:   df = convert column data into a pandas dataframe; same result as list_to_dataframe
+    :param adate:
+    :param data:
+    :return:
+    """
+    columns = ['PLATFORM', 'OBTYPE', 'CHANNEL', 'LONGITUDE', 'LATITUDE', 'PRESSURE', 'IMPACT',
+               'OMF', 'OBERR']
+    index_cols = columns[0:3]
+
+    # read data into a DataFrame object
+    df = _pd.DataFrame({col: data[col] for col in columns}, columns=columns)
+
+    for col in ['LONGITUDE', 'LATITUDE', 'PRESSURE', 'IMPACT', 'OMF', 'OBERR']:
+        df[col] = df[col].astype(_np.float64)
+    df['CHANNEL'] = df['CHANNEL'].astype(_np.int64)
+
+    # Append the DateTime as the 1st level
+    df['DATETIME'] = adate
+    df.set_index(['DATETIME'] + index_cols, inplace=True)
+
+    return df
+
+
+def _level_mask(index, name, predicate):
+    """
+    Evaluate a predicate on the unique values of an index level, and expand the result to a mask
+    over every row using the level codes
+    :param index: {pandas.Index} The index of the data frame
+    :param name: {str} Name of the index level
+    :param predicate: {function} Takes a {pandas.Index} of values and returns a boolean array
+    :return: {numpy.ndarray} Boolean mask with one value per row
+    """
+    if not isinstance(index, _pd.MultiIndex):
+        return _np.asarray(predicate(index.get_level_values(name)), dtype=bool)
+
+    if name not in index.names:
+        raise KeyError('Level %s not found' % name)
+    level = index.names.index(name)
+
+    # a code of -1 marks a missing value, which never matches, and indexes the appended False
+    matches = _np.append(_np.asarray(predicate(index.levels[level]), dtype=bool), False)
+
+    return matches[index.codes[level]]
+
+
 def select(df, cycles=None, dates=None, platforms=None, obtypes=None, channels=None, latitudes=None,
            longitudes=None, pressures=None):
     """
-    Successively slice a dataframe given ranges of cycles, dates, platforms, obtypes, channels, latitudes, longitudes and pressures
+    Slice a dataframe given ranges of cycles, dates, platforms, obtypes, channels, latitudes, longitudes and pressures.
+    Each criterion is evaluated once on the unique values of its index level, and all criteria are
+    combined into a single mask before the rows are taken.
     :param df:
     :param cycles:
     :param dates:
@@ -404,48 +458,30 @@ def select(df, cycles=None, dates=None, platforms=None, obtypes=None, channels=N
     :param pressures:
     :return:
     """
+    predicates = []
     if cycles is not None:
-        indx = df.index.get_level_values('DATETIME') == ''
-        for cycle in cycles:
-            indx = _np.ma.logical_or(indx, df.index.get_level_values('DATETIME').hour == cycle)
-        df = df.iloc[indx]
+        predicates.append(('DATETIME', lambda level: level.hour.isin(list(cycles))))
     if dates is not None:
-        indx = df.index.get_level_values('DATETIME') == ''
-        for date in dates:
-            indx = _np.ma.logical_or(indx, df.index.get_level_values('DATETIME') == date)
-        df = df.iloc[indx]
+        predicates.append(('DATETIME', lambda level: level.isin(_pd.to_datetime(list(dates)))))
     if platforms is not None:
-        indx = df.index.get_level_values('PLATFORM') == ''
-        for platform in platforms:
-            indx = _np.ma.logical_or(indx, df.index.get_level_values('PLATFORM') == platform)
-        df = df.iloc[indx]
+        predicates.append(('PLATFORM', lambda level: level.isin(list(platforms))))
     if obtypes is not None:
-        indx = df.index.get_level_values('OBTYPE') == ''
-        for obtype in obtypes:
-            indx = _np.ma.logical_or(indx, df.index.get_level_values('OBTYPE') == obtype)
-        df = df.iloc[indx]
+        predicates.append(('OBTYPE', lambda level: level.isin(list(obtypes))))
     if channels is not None:
-        indx = df.index.get_level_values('CHANNEL') == ''
-        for channel in channels:
-            indx = _np.ma.logical_or(indx, df.index.get_level_values('CHANNEL') == channel)
-        df = df.iloc[indx]
-    if latitudes is not None:
-        indx1 = df.index.get_level_values('LATITUDE') >= _np.min(latitudes)
-        indx2 = df.index.get_level_values('LATITUDE') <= _np.max(latitudes)
-        indx = _np.ma.logical_and(indx1, indx2)
-        df = df.iloc[indx]
-    if longitudes is not None:
-        indx1 = df.index.get_level_values('LONGITUDE') >= _np.min(longitudes)
-        indx2 = df.index.get_level_values('LONGITUDE') <= _np.max(longitudes)
-        indx = _np.ma.logical_and(indx1, indx2)
-        df = df.iloc[indx]
-    if pressures is not None:
-        indx1 = df.index.get_level_values('PRESSURE') >= _np.min(pressures)
-        indx2 = df.index.get_level_values('PRESSURE') <= _np.max(pressures)
-        indx = _np.ma.logical_and(indx1, indx2)
-        df = df.iloc[indx]
+        predicates.append(('CHANNEL', lambda level: level.isin(list(channels))))
+    for name, bounds in [('LATITUDE', latitudes), ('LONGITUDE', longitudes), ('PRESSURE', pressures)]:
+        if bounds is not None:
+            predicates.append(
+                (name, lambda level, lo=_np.min(bounds), hi=_np.max(bounds): (level >= lo) & (level <= hi)))
 
-    return df
+    if not predicates:
+        return df
+
+    mask = _np.ones(len(df), dtype=bool)
+    for name, predicate in predicates:
+        mask &= _level_mask(df.index, name, predicate)
+
+    return df.iloc[mask]
 
 
 def BulkStats(DF, threshold=1.e-10):
@@ -457,20 +493,24 @@ def BulkStats(DF, threshold=1.e-10):
     """
     log.debug('... computing bulk statistics ...')
 
-    columns = ['TotImp', 'ObCnt', 'ObCntBen', 'ObCntNeu']
     names = ['DATETIME', 'PLATFORM', 'OBTYPE', 'CHANNEL']
-    df = _lutils.EmptyDataFrame(columns, names, dtype=_np.float)
 
-    tmp = DF.reset_index()
-    tmp.drop(['LONGITUDE', 'LATITUDE', 'PRESSURE', 'OMF', 'OBERR'], axis=1, inplace=True)
-
-    df[['TotImp', 'ObCnt']] = tmp.groupby(names)['IMPACT'].agg(['sum', 'count'])
-    df[['ObCntBen']] = tmp.groupby(names)['IMPACT'].apply(lambda c: (c < -threshold).sum())
-    df[['ObCntNeu']] = tmp.groupby(names)['IMPACT'].apply(
-        lambda c: ((-threshold < c) & (c < threshold)).sum())
+    # sum, count, beneficial and neutral counts are all sums over per-observation columns,
+    # so they are computed together in a single groupby
+    impact = DF['IMPACT'].to_numpy()
+    tmp = _pd.DataFrame(
+        {
+            'TotImp': impact,
+            'ObCnt': ~_np.isnan(impact),
+            'ObCntBen': impact < -threshold,
+            'ObCntNeu': (-threshold < impact) & (impact < threshold)
+        },
+        index=DF.index
+    )
+    df = tmp.groupby(level=names).sum()
 
     for col in ['ObCnt', 'ObCntBen', 'ObCntNeu']:
-        df[col] = df[col].astype(_np.int)
+        df[col] = df[col].astype(_np.int64)
 
     return df
 
@@ -486,15 +526,80 @@ def accumBulkStats(DF):
 
     columns = ['TotImp', 'ObCnt', 'ObCntBen', 'ObCntNeu']
     names = ['DATETIME', 'PLATFORM']
-    df = _lutils.EmptyDataFrame(columns, names, dtype=_np.float)
 
-    tmp = DF.reset_index()
-    tmp.drop(['OBTYPE', 'CHANNEL'], axis=1, inplace=True)
-
-    df[['TotImp', 'ObCnt', 'ObCntBen', 'ObCntNeu']] = tmp.groupby(names).agg('sum')
+    df = DF[columns].groupby(level=names).sum()
 
     for col in ['ObCnt', 'ObCntBen', 'ObCntNeu']:
-        df[col] = df[col].astype(_np.int)
+        df[col] = df[col].astype(_np.int64)
+
+    return df
+
+
+def map_platforms(platforms, Platforms):
+    """
+    Map platform names to aggregated platform names.  Each unique name is looked up once, and the
+    keys of Platforms are applied in order, so a name may be renamed more than once.
+    :param platforms: {array-like} Platform names
+    :param Platforms: {dict} Aggregated platform name to a list of platform names
+    :return: {numpy.ndarray} Array of aggregated platform names
+    """
+    codes, uniques = _pd.factorize(_np.asarray(platforms, dtype=object))
+
+    mapped = []
+    for name in uniques:
+        for key in Platforms:
+            if name in Platforms[key]:
+                name = key
+        mapped.append(name)
+
+    return _np.array(mapped, dtype=object)[codes]
+
+
+def OnePlatformMap():
+    """
+    Get the unified platform list turned inside-out for quick look up
+    :return: {dict} Specific platform name to common platform name
+    """
+    if not one_platform_map:
+        unified_platforms = Platforms('OnePlatform')
+        for common_platform in unified_platforms:
+            for specific_platform in unified_platforms[common_platform]:
+                one_platform_map[specific_platform] = common_platform
+            one_platform_map[common_platform] = common_platform
+
+    return one_platform_map
+
+
+def aggregate_by_platform(DF):
+    """
+    Aggregate group bulk statistics by platform using the unified platform list (e.g. [MODIS_Wind and
+    AMV-MODIS] go under a single index called MODIS Wind).  Platforms are kept in order of first appearance.
+    :param DF: {pandas.DataFrame} Group bulk statistics for a single DATETIME
+    :return: {pandas.DataFrame} A new data frame with data aggregated by unified platform list
+    """
+    platform_map = OnePlatformMap()
+
+    # look up the common platform name once for each unique specific platform
+    codes, specific_platforms = _pd.factorize(DF.index.get_level_values('PLATFORM'))
+    common_platforms = []
+    for specific_platform in specific_platforms:
+        if specific_platform in platform_map:
+            common_platforms.append(platform_map[specific_platform])
+        else:
+            common_platforms.append('Unknown')
+            log.warn('Unknown platform: %s' % specific_platform)
+    common_platforms = _np.array(common_platforms, dtype=object)[codes]
+
+    # sum the rows for each common platform, in order of first appearance
+    columns = ['TotImp', 'ObCnt', 'ObCntBen', 'ObCntNeu']
+    dt = DF.index.get_level_values('DATETIME')
+    df = DF[columns].astype(_np.float64).groupby([dt, common_platforms], sort=False).sum()
+
+    # create the new index for the common data frame
+    common_platform_list = list(df.index.get_level_values(1))
+    levels = [[dt[0]], common_platform_list]
+    codes = [[0] * len(common_platform_list), list(range(len(common_platform_list)))]
+    df.index = _pd.MultiIndex(levels=levels, codes=codes, names=['DATETIME', 'PLATFORM'])
 
     return df
 
@@ -509,19 +614,33 @@ def groupBulkStats(DF, Platforms):
     log.debug('... grouping bulk statistics ...')
 
     tmp = DF.reset_index()
-
-    for key in Platforms:
-        tmp.replace(to_replace=Platforms[key], value=key, inplace=True)
+    tmp['PLATFORM'] = map_platforms(tmp['PLATFORM'], Platforms)
 
     names = ['DATETIME', 'PLATFORM']
     df = tmp.groupby(names).agg('sum')
 
     for col in ['ObCnt', 'ObCntBen', 'ObCntNeu']:
-        df[col] = df[col].astype(_np.int)
+        df[col] = df[col].astype(_np.int64)
 
     return df
 
 
+def allBulkStats(DF, Platforms, threshold=1.e-10):
+    """
+    Compute the bulk, accumulated and grouped statistics of observations in one pass.  Only the
+    bulk statistics read the observations; the other levels are derived from the bulk statistics.
+    :param DF: {pandas.DataFrame} Observations as created by list_to_dataframe or columns_to_dataframe
+    :param Platforms: {dict} Aggregated platforms used to group the statistics
+    :param threshold: {float} Impacts with a smaller magnitude are neutral
+    :return: {tuple} Data frames with the same content as BulkStats, accumBulkStats and groupBulkStats
+    """
+    bulk = BulkStats(DF, threshold)
+    accum = accumBulkStats(bulk)
+    group = groupBulkStats(accum, Platforms)
+
+    return bulk, accum, group
+
+
 def tavg(DF, level=None):
     """
 
@@ -545,18 +664,190 @@ def tavg(DF, level=None):
     return df, df2
 
 
-def bin_df(DF, dlat=5., dlon=5., dpres=None):
+class TavgAccumulator(object):
+    """
+    Streaming time-average of statistics over a level.  Statistics are added one file (or any other
+    batch of cycles) at a time and only the count, sum and sum of squared deviations of each value
+    of the level are kept, so memory does not grow with the number of cycles.  Accumulators of
+    partial results are combined with merge, using the pairwise update of Chan et al.  The mean is
+    the sum divided by the count, as in tavg, so the integer counts are truncated the same way.
     """
-    Bin a dataframe given dlat, dlon and dpres using Pandas method
+    columns = ['TotImp', 'ObCnt', 'ObCntBen', 'ObCntNeu']
+
+    def __init__(self, level='PLATFORM'):
+        """
+        :param level: {str} The index level to average over
+        """
+        self.level = level
+        self.count = None
+        self.total = None
+        self.m2 = None
+
+    def add(self, DF):
+        """
+        Add a batch of statistics
+        :param DF: {pandas.DataFrame} Statistics with the level in the index
+        :return: {TavgAccumulator} This accumulator
+        """
+        values = DF[self.columns].astype(_np.float64)
+        grouped = values.groupby(level=self.level, sort=False)
+        count = grouped.count().astype(_np.float64)
+        total = grouped.sum()
+        m2 = ((values - grouped.transform('mean')) ** 2).groupby(level=self.level, sort=False).sum()
+
+        self._combine(count, total, m2)
+
+        return self
+
+    def merge(self, other):
+        """
+        Merge the statistics of another accumulator into this one
+        :param other: {TavgAccumulator} An accumulator of a disjoint set of cycles
+        :return: {TavgAccumulator} This accumulator
+        """
+        if other.count is not None:
+            self._combine(other.count, other.total, other.m2)
+
+        return self
+
+    def _combine(self, count, total, m2):
+        """
+        Combine count, sum and sum of squared deviations with the accumulated values
+        :param count: {pandas.DataFrame} Number of non-missing values
+        :param total: {pandas.DataFrame} Sum of the values
+        :param m2: {pandas.DataFrame} Sum of squared deviations from the mean
+        :return: None
+        """
+        if self.count is None:
+            self.count, self.total, self.m2 = count, total, m2
+            return
+
+        # keep the order in which the values of the level first appear, like tavg
+        index = self.count.index.append(count.index.difference(self.count.index, sort=False))
+        na = self.count.reindex(index, fill_value=0.)
+        nb = count.reindex(index, fill_value=0.)
+        ta = self.total.reindex(index, fill_value=0.)
+        tb = total.reindex(index, fill_value=0.)
+
+        n = na + nb
+        delta = (tb / nb).fillna(0.) - (ta / na).fillna(0.)
+        self.count = n
+        self.total = ta + tb
+        self.m2 = self.m2.reindex(index, fill_value=0.) + m2.reindex(index, fill_value=0.) + \
+            (delta * delta * na * nb / n).where(n > 0., 0.)
+
+    def result(self):
+        """
+        Get the time-averaged statistics, the same as tavg on all of the statistics that were added
+        :return: {tuple} Mean and standard deviation data frames, or None and None if nothing was added
+        """
+        if self.count is None:
+            return None, None
+
+        df = (self.total / self.count).where(self.count > 0.)
+        df2 = _np.sqrt((self.m2 / (self.count - 1.)).where(self.count > 1.))
+
+        for col in ['ObCnt', 'ObCntBen', 'ObCntNeu']:
+            df[col] = df[col].astype(_np.int64)
+            df2[col] = df2[col].fillna(0).astype(_np.int64)
+
+        return df, df2
+
+
+def rollupStats(DF):
+    """
+    Roll up a time series of statistics into partial aggregates over DATETIME: the number of cycles,
+    sums and sums of squares.  Rollups of disjoint time ranges can be merged with mergeRollupStats,
+    and tavgRollupStats reconstructs the result of tavg(DF, level='PLATFORM').
+    :param DF: {pandas.DataFrame} Statistics with DATETIME and PLATFORM index levels
+    :return: {pandas.DataFrame} Partial aggregates indexed by PLATFORM
+    """
+    columns = ['TotImp', 'ObCnt', 'ObCntBen', 'ObCntNeu']
+    values = DF[columns].astype(_np.float64)
+
+    sums = values.groupby(level='PLATFORM').sum()
+    sumsq = (values * values).groupby(level='PLATFORM').sum()
+
+    df = _pd.DataFrame(index=sums.index)
+    df['NCycles'] = values.groupby(level='PLATFORM').size().astype(_np.int64)
+    for col in columns:
+        df['%s_sum' % col] = sums[col]
+        df['%s_sumsq' % col] = sumsq[col]
+
+    return df
+
+
+def mergeRollupStats(rollups):
+    """
+    Merge partial aggregates of disjoint time ranges
+    :param rollups: {list} List of data frames created by rollupStats
+    :return: {pandas.DataFrame} Partial aggregates indexed by PLATFORM
+    """
+    df = _pd.concat(rollups).groupby(level='PLATFORM').sum()
+    df['NCycles'] = df['NCycles'].astype(_np.int64)
+
+    return df
+
+
+def tavgRollupStats(DF):
+    """
+    Time-average over PLATFORM from partial aggregates, the same as tavg(DF, level='PLATFORM') on the
+    statistics that were rolled up
+    :param DF: {pandas.DataFrame} Partial aggregates created by rollupStats or mergeRollupStats
+    :return: {tuple} Mean and standard deviation data frames
+    """
+    columns = ['TotImp', 'ObCnt', 'ObCntBen', 'ObCntNeu']
+    n = DF['NCycles'].astype(_np.float64)
+
+    df = _pd.DataFrame(index=DF.index)
+    df2 = _pd.DataFrame(index=DF.index)
+    for col in columns:
+        total = DF['%s_sum' % col]
+        df[col] = total / n
+        variance = ((DF['%s_sumsq' % col] - total * total / n) / (n - 1.)).clip(lower=0.)
+        df2[col] = _np.sqrt(variance.where(n > 1.))
+
+    for col in ['ObCnt', 'ObCntBen', 'ObCntNeu']:
+        df[col] = df[col].astype(_np.int64)
+        df2[col] = df2[col].fillna(0).astype(_np.int64)
+
+    return df, df2
+
+
+def _snap_down(values, edges):
+    """
+    Snap each value to the largest bin edge that is less than or equal to the value
+    :param values: {numpy.ndarray} Values to snap
+    :param edges: {numpy.ndarray} Bin edges in ascending order
+    :return: {numpy.ndarray} The bin edge for each value
+    """
+    indices = _np.digitize(values, edges, right=False) - 1
+    return edges[_np.clip(indices, 0, len(edges) - 1)]
+
+
+def _snap_up(values, edges):
+    """
+    Snap each value to the smallest bin edge that is greater than or equal to the value
+    :param values: {numpy.ndarray} Values to snap
+    :param edges: {numpy.ndarray} Bin edges in ascending order
+    :return: {numpy.ndarray} The bin edge for each value
+    """
+    indices = _np.digitize(values, edges, right=True)
+    return edges[_np.clip(indices, 0, len(edges) - 1)]
+
+
+def _prepare_bins(DF, dlat, dlon, dpres):
+    """
+    Prepare a dataframe for binning: wrap longitudes to [0, 360), clip latitudes at -90 and drop
+    or keep the pressure column
     :param DF: dataframe that needs to be binned
-    :param dlat: latitude box in degrees (default: 5.)
-    :param dlon: longitude box in degrees (default: 5.)
-    :param dpres: pressure box in hPa (default: None, column sum)
-    :return: binned dataframe
+    :param dlat: latitude box in degrees, or a list of latitude bin edges
+    :param dlon: longitude box in degrees, or a list of longitude bin edges
+    :param dpres: pressure box in hPa, or a list of pressure bin edges, or None for column sum
+    :return: {tuple} Flat dataframe, names of the group columns, latitude, longitude and pressure edges
     """
     tmp = DF.reset_index()
 
-    columns = ['TotImp', 'ObCnt']
     names = ['DATETIME', 'PLATFORM', 'OBTYPE', 'CHANNEL', 'LONGITUDE', 'LATITUDE']
 
     if dpres is None:
@@ -566,42 +857,97 @@ def bin_df(DF, dlat=5., dlon=5., dpres=None):
         if 'PRESSURE' in tmp.columns:
             names += ['PRESSURE']
 
-    df = _lutils.EmptyDataFrame(columns, names, dtype=_np.float)
-
     lons = tmp['LONGITUDE'].values
-    if _np.min(lons) < 0.:
-        lons[lons < 0.] = lons[lons < 0.] + 360.
-        tmp['LONGITUDE'] = lons
+    tmp['LONGITUDE'] = _np.where(lons < 0., lons + 360., lons)
 
     lats = tmp['LATITUDE'].values
-    if _np.min(lats) < -90.:
-        lats[lats < -90.] = -90.
-        tmp['LATITUDE'] = lats
+    tmp['LATITUDE'] = _np.where(lats < -90., -90., lats)
+
+    # a bin size is converted to the edges of a regular grid
+    if _np.ndim(dlat) == 0:
+        dlat = _np.arange(-90., 90. + dlat, dlat)
+    if _np.ndim(dlon) == 0:
+        dlon = _np.arange(0., 360. + dlon, dlon)
+    if dpres is not None and _np.ndim(dpres) == 0:
+        dpres = _np.arange(1000., 0., -1 * dpres)
 
-    tmp['LONGITUDE'] = tmp['LONGITUDE'].apply(
-        lambda x: [e for e in _np.arange(0., 360. + dlon, dlon) if e <= x][-1])
-    tmp['LATITUDE'] = tmp['LATITUDE'].apply(
-        lambda x: [e for e in _np.arange(-90., 90. + dlat, dlat) if e <= x][-1])
-    if not dpres is None:
-        tmp['PRESSURE'] = tmp['PRESSURE'].apply(
-            lambda x: [e for e in _np.arange(1000., 0., -1 * dpres) if e >= x][-1])
+    lat_edges = _np.sort(_np.asarray(dlat, dtype=_np.float64))
+    lon_edges = _np.sort(_np.asarray(dlon, dtype=_np.float64))
+    pres_edges = None if dpres is None else _np.sort(_np.asarray(dpres, dtype=_np.float64))
 
-    df[['TotImp', 'ObCnt']] = tmp.groupby(names)['IMPACT'].agg(['sum', 'count'])
-    df['ObCnt'] = df['ObCnt'].astype(_np.int)
+    return tmp, names, lat_edges, lon_edges, pres_edges
+
+
+def _sum_bins(tmp, names):
+    """
+    Sum the impact and count the observations in each bin
+    :param tmp: {pandas.DataFrame} Flat dataframe with binned coordinates
+    :param names: {list} Names of the group columns
+    :return: binned dataframe
+    """
+    df = tmp.groupby(names)['IMPACT'].agg(['sum', 'count'])
+    df.columns = ['TotImp', 'ObCnt']
+    df['ObCnt'] = df['ObCnt'].astype(_np.int64)
 
     return df
 
 
-def scipy_bin_df(df, dlat=5., dlon=5., dpres=None):
+def bin_df(DF, dlat=5., dlon=5., dpres=None):
     """
+    Bin a dataframe given dlat, dlon and dpres using Pandas method.  Each observation is snapped to
+    the lower latitude and longitude edge of its box and to the upper (higher pressure) pressure
+    edge of its layer.
+    :param DF: dataframe that needs to be binned
+    :param dlat: latitude box in degrees, or a list of latitude bin edges (default: 5.)
+    :param dlon: longitude box in degrees, or a list of longitude bin edges (default: 5.)
+    :param dpres: pressure box in hPa, or a list of pressure bin edges (default: None, column sum)
+    :return: binned dataframe
+    """
+    tmp, names, lat_edges, lon_edges, pres_edges = _prepare_bins(DF, dlat, dlon, dpres)
 
-    :param df:
-    :param dlat:
-    :param dlon:
-    :param dpres:
-    :return:
+    tmp['LONGITUDE'] = _snap_down(tmp['LONGITUDE'].values, lon_edges)
+    tmp['LATITUDE'] = _snap_down(tmp['LATITUDE'].values, lat_edges)
+    if 'PRESSURE' in names:
+        tmp['PRESSURE'] = _snap_up(tmp['PRESSURE'].values, pres_edges)
+
+    return _sum_bins(tmp, names)
+
+
+def scipy_bin_df(df, dlat=5., dlon=5., dpres=None):
     """
-    raise NotImplementedError('lib_obimpact.py - scipy_bin_df is not yet active')
+    Bin a dataframe given dlat, dlon and dpres using SciPy method.  Bins are assigned with
+    scipy.stats.binned_statistic_dd, so a value on an interior edge belongs to the bin above it and
+    a value on the last edge belongs to the last bin; otherwise the result is the same as bin_df.
+    :param df: dataframe that needs to be binned
+    :param dlat: latitude box in degrees, or a list of latitude bin edges (default: 5.)
+    :param dlon: longitude box in degrees, or a list of longitude bin edges (default: 5.)
+    :param dpres: pressure box in hPa, or a list of pressure bin edges (default: None, column sum)
+    :return: binned dataframe
+    """
+    try:
+        from scipy.stats import binned_statistic_dd
+    except ImportError:
+        log.error('lib_obimpact.py - scipy_bin_df requires scipy')
+        raise
+
+    tmp, names, lat_edges, lon_edges, pres_edges = _prepare_bins(df, dlat, dlon, dpres)
+
+    sample = [tmp['LONGITUDE'].values, tmp['LATITUDE'].values]
+    bins = [lon_edges, lat_edges]
+    if 'PRESSURE' in names:
+        sample.append(tmp['PRESSURE'].values)
+        bins.append(pres_edges)
+
+    result = binned_statistic_dd(sample, None, statistic='count', bins=bins, expand_binnumbers=True)
+
+    # bin number i is the bin between edges i-1 and i; values outside the edges go to the nearest edge
+    binnumber = result.binnumber
+    tmp['LONGITUDE'] = lon_edges[_np.clip(binnumber[0] - 1, 0, len(lon_edges) - 1)]
+    tmp['LATITUDE'] = lat_edges[_np.clip(binnumber[1] - 1, 0, len(lat_edges) - 1)]
+    if 'PRESSURE' in names:
+        tmp['PRESSURE'] = pres_edges[_np.clip(binnumber[2], 0, len(pres_edges) - 1)]
+
+    return _sum_bins(tmp, names)
 
 
 def summarymetrics(DF, level=None, mavg=None):
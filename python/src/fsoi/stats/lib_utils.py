@@ -2,11 +2,23 @@
 lib_utils.py contains handy utility functions
 """
 
+import re as _re
+import yaml as _yaml
+import pkgutil as _pkgutil
 import numpy as _np
 import pickle as _pickle
 import pandas as _pd
 from fsoi import log
 
+# index levels that are stored as integer codes from the shared code dictionary
+CODED_LEVELS = ['PLATFORM', 'OBTYPE']
+
+# names missing from the shared code dictionary are given file-local codes starting here
+LOCAL_CODE_START = 100000
+
+# the shared code dictionary (codes.yaml), loaded on first use
+shared_codes = {}
+
 
 def float10Power(value):
     """
@@ -74,7 +86,105 @@ def unpickle(fname, mode='rb'):
     return data
 
 
-def writeHDF(fname, vname, data, complevel=0, complib=None, fletcher32=False):
+def get_shared_codes():
+    """
+    Get the shared dictionary of codes for the coded index levels
+    :return: {dict} Level name to a dictionary of name to code
+    """
+    if not shared_codes:
+        codes = _yaml.full_load(_pkgutil.get_data('fsoi', 'codes.yaml'))
+        for level in CODED_LEVELS:
+            shared_codes[level] = {name: code for code, name in enumerate(codes[level])}
+
+    return shared_codes
+
+
+def encode_levels(data, file_codes=None):
+    """
+    Replace the names in the coded index levels with integer codes
+    :param data: {pandas.DataFrame} Data frame with a MultiIndex
+    :param file_codes: {dict} Codes already used in the file: level name to a dictionary of code to name
+    :return: {pandas.DataFrame, dict} A data frame with coded index levels, and the codes used in the file
+    """
+    file_codes = {level: dict((file_codes or {}).get(level, {})) for level in CODED_LEVELS}
+
+    index = data.index
+    if not isinstance(index, _pd.MultiIndex):
+        return data, file_codes
+
+    for level in CODED_LEVELS:
+        if level not in index.names:
+            continue
+        i = index.names.index(level)
+
+        known = get_shared_codes()[level]
+        local = {name: code for code, name in file_codes[level].items()}
+        next_code = max([code for code in file_codes[level] if code >= LOCAL_CODE_START] + [LOCAL_CODE_START - 1]) + 1
+
+        # each unique name is coded once; the rows keep their level codes
+        codes = []
+        for name in index.levels[i]:
+            if name in local:
+                code = local[name]
+            elif name in known:
+                code = known[name]
+            else:
+                code = next_code
+                next_code += 1
+            file_codes[level][code] = name
+            codes.append(code)
+
+        index = index.set_levels([_pd.Index(codes, dtype=_np.int64)], level=[i])
+
+    data = data.copy(deep=False)
+    data.index = index
+
+    return data, file_codes
+
+
+def decode_levels(data, file_codes):
+    """
+    Replace the integer codes in the coded index levels with names
+    :param data: {pandas.DataFrame} Data frame with coded index levels
+    :param file_codes: {dict} Codes used in the file: level name to a dictionary of code to name
+    :return: {pandas.DataFrame} A data frame with the names in the index levels
+    """
+    index = data.index
+    if not isinstance(index, _pd.MultiIndex):
+        return data
+
+    for level in file_codes:
+        if level not in index.names:
+            continue
+        i = index.names.index(level)
+        names = [file_codes[level][code] for code in index.levels[i]]
+        index = index.set_levels([_pd.Index(names, dtype=object)], level=[i])
+
+    data.index = index
+
+    return data
+
+
+def _encode_where(where, file_codes):
+    """
+    Replace names in equality conditions on coded index levels, e.g. 'PLATFORM="Radiosonde"', with codes
+    :param where: {str|list} A where condition or list of where conditions
+    :param file_codes: {dict} Codes used in the file: level name to a dictionary of code to name
+    :return: {str|list} The where condition(s) with codes in place of names
+    """
+    if isinstance(where, (list, tuple)):
+        return [_encode_where(term, file_codes) for term in where]
+    if not isinstance(where, str):
+        return where
+
+    def replace(match):
+        codes = {name: code for code, name in file_codes.get(match.group(1), {}).items()}
+        return '%s%s%d' % (match.group(1), match.group(2), codes.get(match.group(4), -1))
+
+    return _re.sub(r'\b(%s)\s*(==|!=|=)\s*(["\'])(.*?)\3' % '|'.join(CODED_LEVELS), replace, where)
+
+
+def writeHDF(fname, vname, data, complevel=0, complib=None, fletcher32=False, coded=False):
     """
     Write to an pytable HDF5 file
     :param fname:
@@ -83,6 +193,7 @@ def writeHDF(fname, vname, data, complevel=0, complib=None, fletcher32=False):
     :param complevel:
     :param complib:
     :param fletcher32:
+    :param coded: {bool} Store the PLATFORM and OBTYPE index levels as integer codes (default: False)
     :return:
     """
     log.debug('writing ... %s' % fname)
@@ -90,7 +201,12 @@ def writeHDF(fname, vname, data, complevel=0, complib=None, fletcher32=False):
         hdf = _pd.HDFStore(fname,
                            complevel=complevel, complib=complib,
                            fletcher32=fletcher32)
+        if coded:
+            file_codes = _get_file_codes(hdf, vname)
+            data, file_codes = encode_levels(data, file_codes)
         hdf.put(vname, data, format='table', append=True)
+        if coded:
+            hdf.get_storer(vname).attrs.fsoi_codes = file_codes
         hdf.close()
     except RuntimeError as re:
         log.error('Failed to write data to file: %s' % fname)
@@ -98,9 +214,23 @@ def writeHDF(fname, vname, data, complevel=0, complib=None, fletcher32=False):
     return
 
 
+def _get_file_codes(hdf, vname):
+    """
+    Get the codes used by a coded table in an HDF store
+    :param hdf: {pandas.HDFStore} An open HDF store
+    :param vname: {str} Name of the table
+    :return: {dict} Level name to a dictionary of code to name, or None if the table is not coded
+    """
+    if vname not in hdf:
+        return None
+    attrs = hdf.get_storer(vname).attrs
+    return attrs.fsoi_codes if 'fsoi_codes' in attrs else None
+
+
 def readHDF(fname, vname, **kwargs):
     """
-    Read from an pytable HDF5 file
+    Read from an pytable HDF5 file.  Coded index levels are decoded, and equality conditions on
+    them in where= may use names.
     :param fname:
     :param vname:
     :param kwargs:
@@ -108,7 +238,14 @@ def readHDF(fname, vname, **kwargs):
     """
     log.debug('reading ... %s' % fname)
     try:
-        data = _pd.read_hdf(fname, vname, **kwargs)
+        with _pd.HDFStore(fname, mode='r') as hdf:
+            file_codes = _get_file_codes(hdf, vname)
+            if file_codes is None:
+                data = hdf.select(vname, **kwargs)
+            else:
+                if 'where' in kwargs:
+                    kwargs['where'] = _encode_where(kwargs['where'], file_codes)
+                data = decode_levels(hdf.select(vname, **kwargs), file_codes)
     except RuntimeError:
         raise
     return data
@@ -1,4 +1,4 @@
 """
 FSOI Web Application (backend)
 """
-__all__ = ['request_handler', 'lambda_wrapper', 'serverless_tools']
+__all__ = ['request_handler', 'lambda_wrapper', 'serverless_tools', 'result_cache']
@@ -22,7 +22,8 @@ class RequestDao:
     def add_request(req_data):
         """
         Add a request to the dynamodb table
-        :param req_data: Must contain: req_hash, status_id, message, progress, connections, req_obj
+        :param req_data: Must contain: req_hash, status_id, message, progress, connections, req_obj; may contain
+                         res_obj, expires and purge_after (seconds since the epoch)
         :return:
         """
         dynamo = boto3.client('dynamodb')
@@ -36,6 +37,12 @@ class RequestDao:
         }
         if 'connections' in req_data:
             item['connections'] = {'SS': req_data['connections']}
+        if 'res_obj' in req_data:
+            item['res_obj'] = {'S': req_data['res_obj']}
+        if 'expires' in req_data:
+            item['expires'] = {'N': str(int(req_data['expires']))}
+        if 'purge_after' in req_data:
+            item['purge_after'] = {'N': str(int(req_data['purge_after']))}
 
         dynamo.put_item(TableName=RequestDao.REQUEST_TABLE_NAME, Item=item)
 
@@ -69,6 +76,10 @@ class RequestDao:
             item['req_obj'] = res['Item']['req_obj']['S']
         if 'res_obj' in res['Item']:
             item['res_obj'] = res['Item']['res_obj']['S']
+        if 'expires' in res['Item']:
+            item['expires'] = float(res['Item']['expires']['N'])
+        if 'cache_bytes' in res['Item']:
+            item.update(RequestDao._manifest_from_item(res['Item']))
         return item
 
     @staticmethod
@@ -92,26 +103,111 @@ class RequestDao:
         return res['ResponseMetadata']['HTTPStatusCode'] == 200
 
     @staticmethod
-    def add_response(req_hash, response):
+    def add_response(req_hash, response, manifest=None):
         """
-        Add a client URL to the dynamodb table for this request
+        Add the response and the cache manifest to the dynamodb table for this request
         :param req_hash: The request hash to identify a specific request
         :param response: The request's response as a dictionary
+        :param manifest: {dict} The cache manifest with keys, bytes, expires, purge_after and accessed
+                                attributes (see fsoi.web.result_cache.create_manifest), or None
         :return: True if successful, False if failed
         """
         dynamo = boto3.client('dynamodb')
 
         res_str = json.dumps(response)
         key = {'req_hash': {'S': req_hash}}
+        update = 'SET res_obj = :res_obj'
+        values = {':res_obj': {'S': res_str}}
+        if manifest is not None:
+            update += ', cache_bytes = :cache_bytes, expires = :expires, purge_after = :purge_after, ' \
+                      'accessed = :accessed'
+            values[':cache_bytes'] = {'N': str(manifest['bytes'])}
+            values[':expires'] = {'N': str(int(manifest['expires']))}
+            values[':purge_after'] = {'N': str(int(manifest['purge_after']))}
+            values[':accessed'] = {'N': str(int(manifest['accessed']))}
+            if manifest['keys']:
+                update += ', cache_keys = :cache_keys'
+                values[':cache_keys'] = {'SS': sorted(set(manifest['keys']))}
+
         res = dynamo.update_item(
             TableName=RequestDao.REQUEST_TABLE_NAME,
             Key=key,
-            UpdateExpression='SET res_obj = :res_obj',
-            ExpressionAttributeValues={':res_obj': {'S': res_str}}
+            UpdateExpression=update,
+            ExpressionAttributeValues=values
+        )
+
+        return res['ResponseMetadata']['HTTPStatusCode'] == 200
+
+    @staticmethod
+    def touch(req_hash, accessed):
+        """
+        Record when the cached results of a request were last used
+        :param req_hash: The request hash to identify a specific request
+        :param accessed: {float} The time in seconds since the epoch
+        :return: True if successful, False if failed
+        """
+        dynamo = boto3.client('dynamodb')
+
+        key = {'req_hash': {'S': req_hash}}
+        res = dynamo.update_item(
+            TableName=RequestDao.REQUEST_TABLE_NAME,
+            Key=key,
+            UpdateExpression='SET accessed = :accessed',
+            ExpressionAttributeValues={':accessed': {'N': str(int(accessed))}}
+        )
+
+        return res['ResponseMetadata']['HTTPStatusCode'] == 200
+
+    @staticmethod
+    def list_cached_results():
+        """
+        List the cache manifests of all requests with cached results
+        :return: {list} List of dictionaries with req_hash, cache_keys, cache_bytes, expires and accessed
+        """
+        dynamo = boto3.client('dynamodb')
+
+        manifests = []
+        paginator = dynamo.get_paginator('scan')
+        pages = paginator.paginate(
+            TableName=RequestDao.REQUEST_TABLE_NAME,
+            ProjectionExpression='req_hash, cache_keys, cache_bytes, expires, accessed',
+            FilterExpression='attribute_exists(cache_bytes)'
         )
+        for page in pages:
+            for item in page.get('Items', []):
+                manifests.append(RequestDao._manifest_from_item(item))
+
+        return manifests
+
+    @staticmethod
+    def delete_request(req_hash):
+        """
+        Delete a request from the dynamodb table
+        :param req_hash: The request hash to identify a specific request
+        :return: True if successful, False if failed
+        """
+        dynamo = boto3.client('dynamodb')
+
+        key = {'req_hash': {'S': req_hash}}
+        res = dynamo.delete_item(TableName=RequestDao.REQUEST_TABLE_NAME, Key=key)
 
         return res['ResponseMetadata']['HTTPStatusCode'] == 200
 
+    @staticmethod
+    def _manifest_from_item(item):
+        """
+        Get the cache manifest attributes from a dynamodb item
+        :param item: {dict} The dynamodb item
+        :return: {dict} Dictionary with req_hash, cache_keys, cache_bytes, expires and accessed
+        """
+        return {
+            'req_hash': item['req_hash']['S'],
+            'cache_keys': item['cache_keys']['SS'] if 'cache_keys' in item else [],
+            'cache_bytes': int(item['cache_bytes']['N']) if 'cache_bytes' in item else 0,
+            'expires': float(item['expires']['N']) if 'expires' in item else None,
+            'accessed': float(item['accessed']['N']) if 'accessed' in item else 0.
+        }
+
     @staticmethod
     def remove_client_url(req_hash, client_url):
         """
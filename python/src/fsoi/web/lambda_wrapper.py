@@ -5,9 +5,10 @@ H5 files from S3 and create plots using existing functions.
 
 import os
 import json
-import boto3
+import time
 from fsoi.web.data import ApiGatewaySender, RequestDao
 from fsoi.web.request_handler import FullRequestHandler, PartialRequestHandler
+from fsoi.web.result_cache import is_expired, evict
 from fsoi import log
 from fsoi.fsoilog import enable_cloudwatch_logs
 
@@ -42,7 +43,7 @@ def handle_request(event, context):
 
     # if this is a request for a cached job, return the cached images
     if 'cache_id' in request:
-        send_cached_response(request['cache_id'], client_url)
+        send_cached_response(RequestDao.get_request(request['cache_id']), client_url)
         return
 
     # if this is a request to return JSON data (bokeh), return the json data
@@ -60,11 +61,12 @@ def handle_request(event, context):
     # get the request hash value
     hash_value = FullRequestHandler.hash_request(validated_request)
 
-    # get the status of the request
-    job = RequestDao.get_request(hash_value)
+    # get the status of the request; partial requests are always processed, since the full request has
+    # already reused any earlier results
+    job = None if validated_request.get('is_partial') else RequestDao.get_request(hash_value)
 
-    # if the job has not previously been requested, or it failed, then submit a new request
-    if job is None or 'status_id' not in job or job['status_id'] == 'FAIL':
+    # if the job has not previously been requested, it failed, or its results expired, then submit a new request
+    if job is None or 'status_id' not in job or job['status_id'] == 'FAIL' or is_expired(job):
         handler = process_here(validated_request, hash_value, client_url, ref_id, lambda_function_name)
         if isinstance(handler, PartialRequestHandler):
             return handler.__getstate__()
@@ -74,9 +76,9 @@ def handle_request(event, context):
         send_status_to_client(job, client_url)
         RequestDao.add_client_url(hash_value, client_url)
 
-    # if the job has previously completed successfully, send a cached response
+    # if the job has previously completed successfully, send a cached response from the same read
     elif job['status_id'] == 'SUCCESS':
-        send_cached_response(job['req_hash'], client_url)
+        send_cached_response(job, client_url)
 
     # if we get here, we've missed some cases and need to fix code
     else:
@@ -136,16 +138,25 @@ def send_status_to_client(job, client_url):
     ApiGatewaySender.send_message_to_ws_client(client_url, json.dumps(job))
 
 
-def send_cached_response(req_hash, client_url):
+def send_cached_response(job, client_url):
     """
     Send a response with cached data values
-    :param req_hash: The request hash
+    :param job: The request information from RequestDao.get_request, including the response
     :param client_url: The URL to contact the client
     :return: None
     """
-    job = RequestDao.get_request(req_hash)
-    response = job['res_obj']
-    send_response(response, client_url)
+    if job is None or 'res_obj' not in job:
+        send_response('Cached results are not available', client_url)
+        return
+
+    send_response(job['res_obj'], client_url)
+
+    # record the use of the cached results after the response is sent, for the eviction policy
+    try:
+        RequestDao.touch(job['req_hash'], time.time())
+    except Exception as e:
+        log.warn('Failed to record the use of cached results: %s' % job['req_hash'])
+        log.warn(e)
 
 
 def send_json_data_response(request, client_url):
@@ -192,11 +203,8 @@ def validate_request(request):
         if 'cache_id' in request:
             return request
 
-        request['centers'] = request['centers'].split(',')
-        cycles = []
-        for item in request['cycles'].split(','):
-            cycles.append('%02d' % int(item.strip()))
-        request['cycles'] = cycles
+        # process the request with the same values that are hashed
+        request = FullRequestHandler.normalize_request(request)
         request['root_dir'] = os.environ['FSOI_ROOT_DIR']
         return request
     except Exception as e:
@@ -207,26 +215,26 @@ def validate_request(request):
 
 def get_cached_object_keys(hash_value):
     """
-    Determine if a request's results are available in the S3 cache
+    Determine if a request's results are available in the S3 cache from the request's cache manifest
     :param hash_value: The hash value of the request
     :return: A list of object keys or None
     """
-    # get the name of the s3 bucket used for caching results
-    bucket = os.environ['CACHE_BUCKET']
+    job = RequestDao.get_request(hash_value)
+    if job is None or not job.get('cache_keys') or is_expired(job):
+        return None
 
-    # get an S3 client
-    s3 = boto3.client('s3')
+    # extract a list of plot keys
+    return [key for key in job['cache_keys'] if key.endswith('.png')]
 
-    # get a list of objects
-    objects = s3.list_objects_v2(Bucket=bucket, Prefix=hash_value)
 
-    # if there are any objects returned
-    if objects['KeyCount'] == 0:
-        return None
+def evict_cached_results(event, context):
+    """
+    Remove expired and least recently used results from the S3 cache; run on a schedule
+    :param event: The scheduled event
+    :param context: Contains details of the lambda function
+    :return: {dict} The number of requests whose results were removed
+    """
+    enable_cloudwatch_logs(False)
+    removed = evict()
 
-    # extract a list of object keys
-    keys = []
-    for item in objects['Contents']:
-        if item['Key'].endswith('.png'):
-            keys.append(item['Key'])
-    return keys
+    return {'removed': len(removed)}
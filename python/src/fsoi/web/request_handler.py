@@ -6,26 +6,74 @@ H5 files from S3 and create plots using existing functions.
 import os
 import copy
 import json
+import time
 import boto3
 from concurrent.futures import ThreadPoolExecutor, Future
 from fsoi.web.data import RequestDao, ApiGatewaySender
 from fsoi import log
 from fsoi.data.datastore import ThreadedDataStore
 from fsoi.data.s3_datastore import S3DataStore
+from fsoi.data.frame_ipc import to_ipc, open_ipc, from_ipc, SchemaError
 from fsoi.plots.managers import SummaryPlotGenerator, ComparisonPlotGenerator
+from fsoi.ingest.cube import read_comparison_cube
+from fsoi.web.result_cache import create_manifest, is_expired, get_config, get_purge_after
 
 
 class Handler:
     """
     Base class for a request handler
     """
+    # request fields that do not change the results of a request
+    transient_fields = ['root_dir', 'hash_value', 'ref_id', 'skip_frames']
+
     def __init__(self):
         self.hash_value = None
 
+    @staticmethod
+    def normalize_request(request):
+        """
+        Normalize the format of the values of a request, so a request is processed with the same values
+        that are hashed: centers are a list without repeats, in the requested order, which is the order
+        of the comparison plots; platforms are a sorted set, since they are matched without regard to case
+        or order; cycles are sorted two-digit hours; and the norm is lower case
+        :param request: {dict} A request object
+        :return: {dict} A normalized copy of the request
+        """
+        normalized = copy.deepcopy(request)
+
+        def _to_list(value):
+            items = value.split(',') if isinstance(value, str) else value
+            return [item.strip() for item in items if item.strip()]
+
+        if 'centers' in normalized:
+            normalized['centers'] = list(dict.fromkeys(_to_list(normalized['centers'])))
+        if 'cycles' in normalized:
+            cycles = sorted({int(cycle) for cycle in _to_list(normalized['cycles'])})
+            normalized['cycles'] = ['%02d' % cycle for cycle in cycles]
+        if 'platforms' in normalized:
+            platforms = {platform.upper() for platform in _to_list(normalized['platforms'])}
+            normalized['platforms'] = ','.join(sorted(platforms))
+        if 'norm' in normalized:
+            normalized['norm'] = normalized['norm'].strip().lower()
+
+        return normalized
+
+    @staticmethod
+    def canonicalize_request(request):
+        """
+        Create a canonical form of a request, so requests that differ only in the format of their values
+        have the same hash: the values are normalized, and fields that do not change the results are removed
+        :param request: {dict} A request object
+        :return: {dict} The canonical request
+        """
+        canonical = Handler.normalize_request(request)
+
+        return {key: value for (key, value) in canonical.items() if key not in Handler.transient_fields}
+
     @staticmethod
     def hash_request(request):
         """
-        Create a hash of the request data
+        Create a hash of the canonical form of the request data
         :param request: {dict} A validated and sanitized request object
         :return:
         """
@@ -36,7 +84,7 @@ class Handler:
         if 'cache_id' in request:
             return request['cache_id']
 
-        req_str = json.dumps(request)
+        req_str = json.dumps(Handler.canonicalize_request(request), sort_keys=True)
         hasher = hashlib.sha256()
         hasher.update(req_str.encode('utf-8'))
         return base64.b16encode(hasher.digest()).decode()
@@ -127,11 +175,29 @@ class Handler:
 
         for file in files:
             name = file.split('/')[-1]
-            descriptor = {'bucket': bucket, 'prefix': 'data/%s' % self.hash_value, 'name': name}
+            descriptor = {'bucket': bucket, 'prefix': 'data/%s' % self.hash_value, 'name': name,
+                          'size': os.path.getsize(file)}
             descriptors.append(descriptor)
             datastore.save_from_local_file(file, descriptor)
             os.remove(file)  # TODO: Not necessary once S3 cache is sorted out
 
+    def _cache_frames_in_s3(self, datastore, frames, descriptors):
+        """
+        Save data frames in S3 as Arrow IPC files, without writing local files
+        :param datastore: {DataStore} An FSOI data store object
+        :param frames: {dict} Data frames keyed by object name
+        :param descriptors: {list} Append descriptors to this list
+        :return: None
+        """
+        # retrieve relevant environment variables
+        bucket = os.environ['CACHE_BUCKET']
+
+        for (name, df) in frames.items():
+            buffer = to_ipc(df)
+            descriptor = {'bucket': bucket, 'prefix': 'data/%s' % self.hash_value, 'name': name, 'size': len(buffer)}
+            if datastore.save_from_stream(open_ipc(buffer), descriptor):
+                descriptors.append(descriptor)
+
 
 class FullRequestHandler(Handler):
     """
@@ -148,8 +214,8 @@ class FullRequestHandler(Handler):
         # call the super constructor
         super().__init__()
 
-        # copy the request object
-        self.request = copy.deepcopy(request)
+        # copy the request object, in the normalized form that is hashed
+        self.request = self.normalize_request(request)
 
         # get the name of the current lambda function
         self.lambda_function_name = lambda_function_name
@@ -178,9 +244,10 @@ class FullRequestHandler(Handler):
         else:
             self.executor = ThreadPoolExecutor(max_workers=10)
 
-        # summary and comparison plot descriptors
+        # summary and comparison plot descriptors, and descriptors of the data from the partial requests
         self.plot_descriptors = []
         self.json_descriptors = []
+        self.frame_descriptors = []
 
     def __getstate__(self):
         """
@@ -195,7 +262,7 @@ class FullRequestHandler(Handler):
             'errors': self.errors,
             'plot_util': self.plot_util,
             'parallel_type': self.parallel_type,
-            'pickle_descriptors': self.pickle_descriptors
+            'frame_descriptors': self.frame_descriptors
         }
 
     def __setstate__(self, state):
@@ -211,7 +278,7 @@ class FullRequestHandler(Handler):
         self.errors = state['errors']
         self.plot_util = state['plot_util']
         self.parallel_type = state['parallel_type']
-        self.pickle_descriptors = state['pickle_descriptors']
+        self.frame_descriptors = state['frame_descriptors']
 
     def run(self):
         """
@@ -247,46 +314,42 @@ class FullRequestHandler(Handler):
             # track the progress percentage
             self._update_all_clients('RUNNING', 'Starting request processing', 1)
 
+            # read the comparison data from the cube, which does not need the partial requests
+            frames = read_comparison_cube(
+                self.request['centers'],
+                self.request['norm'],
+                self.request['cycles'],
+                self.request['start_date'],
+                self.request['end_date']
+            )
+
             # create and run all of the partial requests
             self._update_all_clients('RUNNING', 'Creating plots for all centers', 3)
-            part_handlers = self._run_partial_requests()
+            futures = self._submit_partial_requests(skip_frames=frames is not None)
+
+            # create the comparison plots from the cube while the partial requests run
+            if frames is not None:
+                log.info('Creating comparison plots from the comparison cube')
+                self._create_comparison_plots(list(frames), list(frames.values()))
 
             # aggregate results from partial requests
-            pickle_descriptors = []
+            part_handlers = self._collect_partial_requests(futures)
             for part_handler in part_handlers:
-                pickle_descriptors += part_handler.pickle_descriptors
+                self.frame_descriptors += part_handler.frame_descriptors
                 self.plot_descriptors += part_handler.plot_descriptors
                 self.json_descriptors += part_handler.json_descriptors
                 self.warns += part_handler.warns
 
-            # update clients
-            self._update_all_clients('RUNNING', 'Creating comparison plots', 95, sync=False)
-
-            # download the pickle files
-            pickles = self._download_pickles(pickle_descriptors)
-
-            # create a list of centers with data
-            centers_with_data = []
-            for part_handler in part_handlers:
-                if len(part_handler.pickle_descriptors) > 0:
-                    centers_with_data.append(part_handler.center)
-
-            # create the comparison summary plots
-            cpg = ComparisonPlotGenerator(
-                centers_with_data,
-                self.request['norm'],
-                [int(c) for c in self.request['cycles']],
-                self.request['platforms'],
-                self.plot_util,
-                pickles
-            )
-            cpg.create_plot_set()
-            self.errors += cpg.errors
-            self.warns += cpg.warns
-            self._cache_compare_plots_in_s3(cpg)
+            # create the comparison plots from the partial request data if the cube does not cover the request
+            if frames is None:
+                # update clients
+                self._update_all_clients('RUNNING', 'Creating comparison plots', 95, sync=False)
 
-            # clean up the working directory
-            cpg.clean_up()
+                # read the data handed off by the partial requests for the centers with data
+                handoffs = self._download_frames(part_handlers)
+                if handoffs is not None:
+                    self._create_comparison_plots([center for (center, _) in handoffs],
+                                                  [df for (_, df) in handoffs])
 
             # handle success cases
             if not self.errors:
@@ -303,48 +366,144 @@ class FullRequestHandler(Handler):
             log.error('Failed to process request: %s' % self.hash_value)
             log.error(e)
 
-    def _download_pickles(self, pickle_descriptors):
+    def _download_frames(self, part_handlers):
         """
-        Download pickle files
-        :param pickle_descriptors: {list} List of pickle descriptors
-        :return: {list} List of local files
+        Read the data frames handed off by the partial requests directly from S3 into memory
+        :param part_handlers: {list} List of PartialRequestHandlers
+        :return: {list} List of (center, data frame) tuples, or None if the data from a partial request
+                        have an incompatible schema
         """
         datastore = S3DataStore()
-        local_dir = self.request['root_dir']
-        files = []
-        for pickle_descriptor in pickle_descriptors:
-            file = '%s/%s' % (local_dir, pickle_descriptor['name'])
-            got_it = datastore.load_to_local_file(pickle_descriptor, file)
-            if not got_it:
-                log.error('Failed to download pickle file: %s' % file)
-            files.append(file)
-
-        return files
+        sources = [(part_handler.center, descriptor)
+                   for part_handler in part_handlers for descriptor in part_handler.frame_descriptors]
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            buffers = list(executor.map(datastore.load, [descriptor for (_, descriptor) in sources]))
+
+        handoffs = []
+        for ((center, descriptor), buffer) in zip(sources, buffers):
+            if buffer is None:
+                log.error('Failed to download comparison data: %s' % descriptor['name'])
+                self.errors.append('Comparison data are not available for %s' % center)
+                continue
+            try:
+                handoffs.append((center, from_ipc(buffer)))
+            except SchemaError as e:
+                log.error('Incompatible comparison data from %s' % center, e)
+                self.errors.append('Incompatible comparison data from %s' % center)
+                return None
+
+        return handoffs
+
+    def _create_comparison_plots(self, centers, frames):
+        """
+        Create the comparison summary plots and copy them to S3
+        :param centers: {list} List of centers with data
+        :param frames: {list} List of data frames with the aggregated group bulk statistics of the centers
+        :return: None
+        """
+        cpg = ComparisonPlotGenerator(
+            centers,
+            self.request['norm'],
+            [int(c) for c in self.request['cycles']],
+            self.request['platforms'],
+            self.plot_util,
+            frames
+        )
+        cpg.create_plot_set()
+        self.errors += cpg.errors
+        self.warns += cpg.warns
+        self._cache_compare_plots_in_s3(cpg)
+
+        # clean up the working directory
+        cpg.clean_up()
 
     def _run_partial_requests(self):
         """
         Create and run all of the partial requests
         :return: {list} List of PartialRequestHandlers
         """
-        # create and run a partial request for each center
+        return self._collect_partial_requests(self._submit_partial_requests())
+
+    def _submit_partial_requests(self, skip_frames=False):
+        """
+        Create and submit a partial request for each center
+        :param skip_frames: {bool} True if the comparison plots do not need the data from the partial requests
+        :return: {list} List of futures for the partial requests
+        """
         futures = []
-        centers = self.request['centers']
-        num_centers = len(self.request['centers'])
-        progress = 0
-        progress_delta = 100 / (num_centers + 1)
-        for center in centers:
+        for center in self.request['centers']:
             part_req = copy.deepcopy(self.request)
             part_req['centers'] = [center]
             part_req['is_partial'] = True
             part_req['hash_value'] = self.hash_value
             part_req['ref_id'] = self.ref_id
+            if skip_frames:
+                part_req['skip_frames'] = True
             part_handler = PartialRequestHandler(part_req, plot_util=self.plot_util)
-            futures.append(self._submit_partial_request(part_handler))
 
-        # get the completed partial handlers
+            # reuse the results of an earlier request for the same center, or submit a new partial request
+            reused = self._reuse_partial_result(part_handler, skip_frames)
+            futures.append(reused if reused is not None else self._submit_partial_request(part_handler))
+
+        return futures
+
+    def _reuse_partial_result(self, part_handler, skip_frames=False):
+        """
+        Copy the results of an earlier partial request for the same center and parameters into the
+        cache of this request
+        :param part_handler: {PartialRequestHandler} The partial request handler that has not been run
+        :param skip_frames: {bool} True if the comparison plots do not need the data from the partial request
+        :return: {PartialRequestHandler} The completed partial request handler, or None if there are no
+                                         results to reuse
+        """
+        try:
+            job = RequestDao.get_request(part_handler.reuse_hash)
+        except Exception as e:
+            log.warn('Failed to look up partial results: %s' % part_handler.reuse_hash)
+            log.warn(e)
+            return None
+
+        # the earlier results must be complete, current, and include the comparison data if needed
+        if job is None or job['status_id'] != 'SUCCESS' or 'res_obj' not in job or is_expired(job):
+            return None
+        state = json.loads(job['res_obj'])
+        if state['errors'] or (not skip_frames and state['request'].get('skip_frames')):
+            return None
+
+        # copy the objects on the server into the prefix of this request
+        copies = []
+        for attr in ['plot_descriptors', 'json_descriptors', 'frame_descriptors']:
+            targets = [dict(source, prefix='data/%s' % self.hash_value) for source in state[attr]]
+            copies += [(source, target) for (source, target) in zip(state[attr], targets) if source != target]
+            state[attr] = targets
+        datastore = S3DataStore()
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            copied = list(executor.map(lambda copy_args: datastore.copy(*copy_args), copies))
+        if not all(copied):
+            log.warn('Failed to copy partial results: %s' % part_handler.reuse_hash)
+            return None
+
+        log.info('Reused %s results: %s' % (part_handler.center, part_handler.reuse_hash))
+        state['request'] = part_handler.request
+        state['hash_value'] = self.hash_value
+        state['ref_id'] = self.ref_id
+        part_handler.__setstate__(state)
+
+        return part_handler
+
+    def _collect_partial_requests(self, futures):
+        """
+        Wait for the partial requests to complete
+        :param futures: {list} List of futures for the partial requests, or completed PartialRequestHandlers
+        :return: {list} List of PartialRequestHandlers
+        """
+        progress = 0
+        progress_delta = 100 / (len(futures) + 1)
         part_handlers = []
         for future in futures:
-            part_handler = self._get_partial_handler_from_future(future)
+            part_handler = future \
+                if isinstance(future, PartialRequestHandler) \
+                else self._get_partial_handler_from_future(future)
             part_handlers.append(part_handler)
             progress += progress_delta
             self._update_all_clients(
@@ -356,27 +515,6 @@ class FullRequestHandler(Handler):
 
         return part_handlers
 
-    def _retrieve_pickles(self, part_handler):
-        """
-        Download pickles from S3 for a request
-        :param part_handler: {PartialRequestHandler} Partial request handler
-        :return: {list} A list of pickles
-        """
-        # pull out the root directory for easy access
-        root_dir = self.request['root_dir']
-
-        # list of downloaded pickles
-        pickles = []
-
-        # download the pickles needed for the comparison plots
-        data_store = S3DataStore()
-        for pickle_source in part_handler.pickle_descriptors:
-            file = '%s/pickles/%s' % (root_dir, pickle_source['name'])
-            data_store.load_to_local_file(pickle_source, file)
-            pickles.append(file)
-
-        return pickles
-
     def _submit_partial_request(self, part_handler):
         """
         Submit a new partial request
@@ -433,7 +571,7 @@ class FullRequestHandler(Handler):
         # create the S3 data store
         datastore = S3DataStore()
 
-        # store the summary plots, comparison pickles, and maybe json files (if using bokeh)
+        # store the comparison plots, and maybe json files (if using bokeh)
         self._cache_file_list_in_s3(datastore, plot_gen.plots, self.plot_descriptors)
         if 'bokeh' == self.plot_util:
             self._cache_file_list_in_s3(datastore, plot_gen.json_data, self.json_descriptors)
@@ -448,7 +586,9 @@ class FullRequestHandler(Handler):
         else:
             self._create_success_response()
 
-        RequestDao.add_response(self.hash_value, self.response)
+        # save the response with a manifest of the cached objects, so a repeated request needs one read
+        manifest = create_manifest(self.plot_descriptors + self.json_descriptors + self.frame_descriptors)
+        RequestDao.add_response(self.hash_value, self.response, manifest)
         self._message_all_clients(self.response, True)
 
     def _create_error_response(self):
@@ -532,8 +672,8 @@ class PartialRequestHandler(Handler):
         # call the super constructor
         super().__init__()
 
-        # copy the request object
-        self.request = copy.deepcopy(request)
+        # copy the request object, in the normalized form that is hashed
+        self.request = self.normalize_request(request)
 
         # get the center name for easy access
         self.center = self.request['centers'][0]
@@ -542,6 +682,9 @@ class PartialRequestHandler(Handler):
         self.hash_value = self.request['hash_value']
         self.ref_id = self.request['ref_id']
 
+        # hash of the center and parameters, so later full requests can reuse the results
+        self.reuse_hash = self.hash_request(self.request)
+
         # empty arrays to hold warnings and errors
         self.warns = []
         self.errors = []
@@ -552,7 +695,7 @@ class PartialRequestHandler(Handler):
         self.plot_util = plot_util
 
         # empty list for data descriptors
-        self.pickle_descriptors = []
+        self.frame_descriptors = []
         self.plot_descriptors = []
         self.json_descriptors = []
 
@@ -569,7 +712,7 @@ class PartialRequestHandler(Handler):
             'warns': self.warns,
             'errors': self.errors,
             'plot_util': self.plot_util,
-            'pickle_descriptors': self.pickle_descriptors,
+            'frame_descriptors': self.frame_descriptors,
             'plot_descriptors': self.plot_descriptors,
             'json_descriptors': self.json_descriptors
         }
@@ -587,7 +730,7 @@ class PartialRequestHandler(Handler):
         self.warns = state['warns']
         self.errors = state['errors']
         self.plot_util = state['plot_util']
-        self.pickle_descriptors = state['pickle_descriptors']
+        self.frame_descriptors = state['frame_descriptors']
         self.plot_descriptors = state['plot_descriptors']
         self.json_descriptors = state['json_descriptors']
 
@@ -600,6 +743,10 @@ class PartialRequestHandler(Handler):
             # process the request
             self._process_request()
 
+            # save the results for later full requests
+            if not self.errors:
+                self._save_result()
+
             # return a representation of this object's state
             return self.__getstate__()
         except Exception as e:
@@ -639,6 +786,29 @@ class PartialRequestHandler(Handler):
             log.error(e)
             self.errors.append('Failed to process request for %s' % self.center)
 
+    def _save_result(self):
+        """
+        Save the state of the completed partial request with its reuse hash, so later full requests
+        that include the same center and parameters can copy the results instead of computing them
+        :return: None
+        """
+        try:
+            # the eviction skips requests without a cache manifest, so only the TTL removes this one
+            expires = time.time() + get_config()['ttl']
+            RequestDao.add_request({
+                'req_hash': self.reuse_hash,
+                'status_id': 'SUCCESS',
+                'message': 'Done.',
+                'progress': '100',
+                'req_obj': json.dumps(self.request),
+                'res_obj': json.dumps(self.__getstate__()),
+                'expires': expires,
+                'purge_after': get_purge_after(expires)
+            })
+        except Exception as e:
+            log.warn('Failed to save partial results: %s' % self.reuse_hash)
+            log.warn(e)
+
     def _cache_data_in_s3(self, plot_gen):
         """
         Copy all of the new summary plots to S3
@@ -648,8 +818,9 @@ class PartialRequestHandler(Handler):
         # create the S3 data store
         datastore = S3DataStore()
 
-        # store the summary plots, comparison pickles, and maybe json files (if using bokeh)
+        # store the summary plots, comparison data, and maybe json files (if using bokeh)
         self._cache_file_list_in_s3(datastore, plot_gen.plots, self.plot_descriptors)
-        self._cache_file_list_in_s3(datastore, plot_gen.pickles, self.pickle_descriptors)
+        if not self.request.get('skip_frames'):
+            self._cache_frames_in_s3(datastore, plot_gen.frames, self.frame_descriptors)
         if 'bokeh' == self.plot_util:
             self._cache_file_list_in_s3(datastore, plot_gen.json_data, self.json_descriptors)
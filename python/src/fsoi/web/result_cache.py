@@ -0,0 +1,101 @@
+"""
+Manage the cached results of web requests.  When a request finishes, a manifest of the objects it
+stored in the cache bucket (the keys, their total size, and when they expire) is saved with the
+request in the requests table, so a repeated request is answered with a single read, and the cache
+bucket is kept under a size limit by removing expired results and the results of the least recently
+used requests.
+"""
+
+import os
+import time
+import yaml
+import pkgutil
+from fsoi import log
+from fsoi.data.s3_datastore import S3DataStore
+from fsoi.web.data import RequestDao
+
+
+def get_config():
+    """
+    Get the result cache settings from datastore.yaml
+    :return: {dict} Dictionary with ttl and max_bytes attributes
+    """
+    return yaml.full_load(pkgutil.get_data('fsoi', 'data/datastore.yaml'))['fsoi']['result_cache']
+
+
+def create_manifest(descriptors, ttl=None, now=None):
+    """
+    Create the cache manifest of a request
+    :param descriptors: {list} Descriptors of the objects the request stored in the cache bucket; each may
+                               have a size attribute with the object size in bytes
+    :param ttl: {int} Seconds that the results are used, or None to use the value in datastore.yaml
+    :param now: {float} The current time in seconds since the epoch, or None for the current time
+    :return: {dict} Manifest with keys, bytes, expires, purge_after and accessed attributes
+    """
+    config = get_config()
+    ttl = config['ttl'] if ttl is None else ttl
+    now = time.time() if now is None else now
+
+    keys = [S3DataStore._to_bucket_and_key(descriptor)[1] for descriptor in descriptors]
+    size = sum(int(descriptor.get('size', 0)) for descriptor in descriptors)
+
+    return {'keys': keys, 'bytes': size, 'expires': now + ttl, 'purge_after': get_purge_after(now + ttl),
+            'accessed': now}
+
+
+def get_purge_after(expires):
+    """
+    Get the time when DynamoDB may remove a request.  The eviction removes expired results before then,
+    so the cached objects of a request are never left without the request that lists them.
+    :param expires: {float} The time the results expire, in seconds since the epoch
+    :return: {float} The time in seconds since the epoch
+    """
+    return expires + get_config()['purge_grace']
+
+
+def is_expired(job, now=None):
+    """
+    Check if the cached results of a request have expired
+    :param job: {dict} The request information from RequestDao.get_request
+    :param now: {float} The current time in seconds since the epoch, or None for the current time
+    :return: {bool} True if the results have expired, otherwise False
+    """
+    now = time.time() if now is None else now
+    return job.get('expires') is not None and job['expires'] <= now
+
+
+def evict(max_bytes=None, now=None):
+    """
+    Remove expired results, then the results of the least recently used requests until the cache
+    bucket is under the size limit.  The objects are removed before the request, so a request is
+    never answered from a partially removed result.
+    :param max_bytes: {int} Maximum size of the cached results, or None to use the value in datastore.yaml
+    :param now: {float} The current time in seconds since the epoch, or None for the current time
+    :return: {list} List of the request hashes whose results were removed
+    """
+    max_bytes = get_config()['max_bytes'] if max_bytes is None else max_bytes
+    now = time.time() if now is None else now
+    bucket = os.environ['CACHE_BUCKET']
+
+    manifests = RequestDao.list_cached_results()
+    evicted = [manifest for manifest in manifests if is_expired(manifest, now)]
+    live = sorted([manifest for manifest in manifests if not is_expired(manifest, now)],
+                  key=lambda manifest: manifest['accessed'])
+    size = sum(manifest['cache_bytes'] for manifest in live)
+    while live and size > max_bytes:
+        manifest = live.pop(0)
+        evicted.append(manifest)
+        size -= manifest['cache_bytes']
+
+    datastore = S3DataStore()
+    removed = []
+    for manifest in evicted:
+        deleted = datastore.delete_many([{'bucket': bucket, 'key': key} for key in manifest['cache_keys']])
+        if all(deleted) and RequestDao.delete_request(manifest['req_hash']):
+            removed.append(manifest['req_hash'])
+        else:
+            log.warn('Failed to remove cached results: %s' % manifest['req_hash'])
+
+    log.info('Result cache: removed %d of %d requests, %d bytes remain' % (len(removed), len(manifests), size))
+
+    return removed
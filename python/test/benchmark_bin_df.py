@@ -0,0 +1,39 @@
+"""
+Benchmark the vectorized bin_df against the original per-observation implementation on a synthetic
+frame with one million observations.
+
+usage: python benchmark_bin_df.py [number_of_observations]
+"""
+import sys
+import time
+from test_bin_df import make_observations, legacy_bin_df
+import fsoi.stats.lib_obimpact as loi
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    df = make_observations(n)
+
+    start = time.time()
+    actual = loi.bin_df(df)
+    vectorized = time.time() - start
+    print('bin_df:        %8.2f seconds' % vectorized)
+
+    try:
+        start = time.time()
+        loi.scipy_bin_df(df)
+        print('scipy_bin_df:  %8.2f seconds' % (time.time() - start))
+    except ImportError:
+        print('scipy_bin_df:  scipy is not installed')
+
+    start = time.time()
+    expected = legacy_bin_df(df)
+    legacy = time.time() - start
+    print('legacy bin_df: %8.2f seconds' % legacy)
+
+    print('speedup:       %8.1fx' % (legacy / vectorized))
+    print('identical:     %s' % expected.equals(actual))
+
+
+if __name__ == '__main__':
+    main()
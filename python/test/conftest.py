@@ -0,0 +1,24 @@
+"""
+Fixtures shared by the tests
+"""
+import boto3
+import pytest
+from botocore.stub import Stubber
+from fsoi.data.s3_datastore import S3DataStore
+
+
+@pytest.fixture
+def stubber(request, monkeypatch):
+    """
+    Replace the shared S3 client with a client that only accepts the expected requests.  Parametrize
+    the fixture indirectly with a bucket name to also set the CACHE_BUCKET environment variable.
+    :return: {botocore.stub.Stubber} The stubber
+    """
+    client = boto3.client('s3', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test')
+    monkeypatch.setattr(S3DataStore, 's3_client', client)
+    cache_bucket = getattr(request, 'param', None)
+    if cache_bucket is not None:
+        monkeypatch.setenv('CACHE_BUCKET', cache_bucket)
+    with Stubber(client) as stub:
+        yield stub
+        stub.assert_no_pending_responses()
@@ -0,0 +1,123 @@
+"""
+Test the backfill engine with a task function that does not need any data
+"""
+import os
+import json
+import time
+from fsoi.ingest.backfill import run_backfill, create_tasks, BackfillJournal
+
+
+def flaky_task(center, norm, date, path):
+    """
+    A task that fails on its first attempt for dates ending in 06, and always fails for dates ending in 12
+    :param center: {str} The center name
+    :param norm: {str} The norm
+    :param date: {str} Date and cycle YYYYMMDDHH
+    :param path: {str} Directory to record the attempts in
+    :return: {bool} True if successful, otherwise False
+    """
+    marker = '%s/%s.%s.%s' % (path, center, norm, date)
+    attempts = len(open(marker).read()) if os.path.exists(marker) else 0
+    with open(marker, 'a') as fh:
+        fh.write('x')
+
+    if date.endswith('12'):
+        raise ValueError('always fails')
+    return not (date.endswith('06') and attempts == 0)
+
+
+def crashing_task(center, norm, date, path):
+    """
+    A task that kills its worker process for dates ending in 06, and is slow for the other dates so
+    they are running when the worker dies
+    :param center: {str} The center name
+    :param norm: {str} The norm
+    :param date: {str} Date and cycle YYYYMMDDHH
+    :param path: {str} Directory to record the attempts in
+    :return: {bool} True if successful
+    """
+    with open('%s/%s.%s.%s' % (path, center, norm, date), 'a') as fh:
+        fh.write('x')
+
+    if date.endswith('06'):
+        time.sleep(0.2)
+        os._exit(1)
+    time.sleep(0.5)
+    return True
+
+
+def test_create_tasks():
+    """
+    Tasks cover every date, cycle and norm of each center
+    """
+    tasks = create_tasks(['NRL', 'GMAO'], '20200101', '20200102')
+    assert len(tasks) == 2 * (1 + 4 * 2)
+    assert tasks[0] == ('NRL', 'dry', '2020010100')
+    assert ('GMAO', 'moist', '2020010218') in tasks
+
+    assert create_tasks(['GMAO'], '20200101', '20200101', ['dry'], [6]) == [('GMAO', 'dry', '2020010106')]
+
+
+def test_run_backfill(tmp_path):
+    """
+    Failed tasks are retried, and a resumed backfill skips the tasks that are done
+    """
+    journal_file = str(tmp_path / 'journal.jsonl')
+    tasks = create_tasks(['MET'], '20200101', '20200103')
+
+    summary = run_backfill(tasks, journal_file, workers=2, retries=2, retry_delay=0., max_pending=3,
+                           path=str(tmp_path), task_function=flaky_task)
+    assert len(summary['done']) == 9
+    assert sorted(summary['failed']) == [('MET', 'moist', '2020010112'), ('MET', 'moist', '2020010212'),
+                                         ('MET', 'moist', '2020010312')]
+    assert open(str(tmp_path / 'MET.moist.2020010106')).read() == 'xx'
+    assert open(str(tmp_path / 'MET.moist.2020010112')).read() == 'xxx'
+
+    # every attempt is in the journal
+    entries = [json.loads(line) for line in open(journal_file)]
+    assert len(entries) == 9 + 3 + 3 * 3
+    assert BackfillJournal(journal_file).is_done(('MET', 'moist', '2020010306'))
+
+    # an interrupted write leaves an incomplete line that is ignored
+    with open(journal_file, 'a') as fh:
+        fh.write('{"task": "MET/mo')
+
+    # resume: only the failed tasks run again
+    summary = run_backfill(tasks, journal_file, workers=2, retries=0, path=str(tmp_path), task_function=flaky_task)
+    assert len(summary['skipped']) == 9
+    assert len(summary['failed']) == 3
+    assert open(str(tmp_path / 'MET.moist.2020010100')).read() == 'x'
+    assert json.loads(open(journal_file).readlines()[-1])['status'] == 'failed'
+
+
+def test_retry_delay(tmp_path):
+    """
+    Retries wait in the parent process, not in a worker, so other tasks run in the meantime
+    """
+    journal_file = str(tmp_path / 'journal.jsonl')
+    tasks = create_tasks(['MET'], '20200101', '20200101', cycles=[6, 0])
+
+    start = time.time()
+    summary = run_backfill(tasks, journal_file, workers=1, retries=1, retry_delay=0.5, path=str(tmp_path),
+                           task_function=flaky_task)
+    assert summary['done'] == [('MET', 'moist', '2020010100'), ('MET', 'moist', '2020010106')]
+    assert time.time() - start >= 0.5
+
+
+def test_broken_pool(tmp_path):
+    """
+    A task that kills its worker process fails after its retries, and the tasks that were running in
+    the same pool do not lose an attempt
+    """
+    journal_file = str(tmp_path / 'journal.jsonl')
+    tasks = create_tasks(['MET'], '20200101', '20200101')
+
+    summary = run_backfill(tasks, journal_file, workers=4, retries=1, retry_delay=0., path=str(tmp_path),
+                           task_function=crashing_task)
+    assert summary['failed'] == [('MET', 'moist', '2020010106')]
+    assert sorted(summary['done']) == [('MET', 'moist', '20200101%02d' % cycle) for cycle in [0, 12, 18]]
+
+    entries = [json.loads(line) for line in open(journal_file)]
+    assert [(e['status'], e['attempt']) for e in entries if e['task'] == 'MET/moist/2020010106'] == \
+        [('failed', 1), ('failed', 2)]
+    assert all(e['status'] == 'done' and e['attempt'] == 1 for e in entries if e['task'] != 'MET/moist/2020010106')
@@ -0,0 +1,123 @@
+"""
+Test the vectorized spatial binning against the original per-observation binning
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import datetime
+import fsoi.stats.lib_obimpact as loi
+
+
+def make_observations(n, seed=0):
+    """
+    Create a synthetic data frame of observations
+    :param n: {int} Number of observations
+    :param seed: {int} Random seed
+    :return: {pandas.DataFrame} Observations as created by columns_to_dataframe
+    """
+    rng = np.random.default_rng(seed)
+    platforms = np.array(['Radiosonde', 'Aircraft', 'Ship'], dtype=object)
+    obtypes = np.array(['u', 'v', 't'], dtype=object)
+    columns = {
+        'PLATFORM': platforms[rng.integers(0, len(platforms), n)],
+        'OBTYPE': obtypes[rng.integers(0, len(obtypes), n)],
+        'CHANNEL': np.full(n, -999),
+        'LONGITUDE': rng.random(n) * 360.0 - 180.0,
+        'LATITUDE': rng.random(n) * 180.0 - 90.0,
+        'PRESSURE': rng.random(n) * 999.0 + 1.0,
+        'IMPACT': rng.normal(0.0, 1.e-9, n),
+        'OMF': rng.random(n),
+        'OBERR': np.full(n, -999.)
+    }
+
+    # include values on the grid edges and below the south pole
+    columns['LONGITUDE'][:4] = [0.0, -180.0, 355.0, 5.0]
+    columns['LATITUDE'][:4] = [-90.0, -91.0, 85.0, 90.0]
+    columns['PRESSURE'][:4] = [1000.0, 950.0, 200.0, 50.0]
+
+    return loi.columns_to_dataframe(datetime(2020, 3, 1, 0), columns)
+
+
+def legacy_bin_df(DF, dlat=5., dlon=5., dpres=None):
+    """
+    The original per-observation implementation of bin_df
+    :param DF: dataframe that needs to be binned
+    :param dlat: latitude box in degrees
+    :param dlon: longitude box in degrees
+    :param dpres: pressure box in hPa
+    :return: binned dataframe
+    """
+    tmp = DF.reset_index()
+    names = ['DATETIME', 'PLATFORM', 'OBTYPE', 'CHANNEL', 'LONGITUDE', 'LATITUDE']
+    if dpres is None:
+        tmp.drop('PRESSURE', axis=1, inplace=True)
+    else:
+        names += ['PRESSURE']
+
+    lons = tmp['LONGITUDE'].values
+    lons[lons < 0.] = lons[lons < 0.] + 360.
+    tmp['LONGITUDE'] = lons
+    lats = tmp['LATITUDE'].values
+    lats[lats < -90.] = -90.
+    tmp['LATITUDE'] = lats
+
+    tmp['LONGITUDE'] = tmp['LONGITUDE'].apply(lambda x: [e for e in np.arange(0., 360. + dlon, dlon) if e <= x][-1])
+    tmp['LATITUDE'] = tmp['LATITUDE'].apply(lambda x: [e for e in np.arange(-90., 90. + dlat, dlat) if e <= x][-1])
+    if dpres is not None:
+        tmp['PRESSURE'] = tmp['PRESSURE'].apply(lambda x: [e for e in np.arange(1000., 0., -1 * dpres) if e >= x][-1])
+
+    df = tmp.groupby(names)['IMPACT'].agg(['sum', 'count'])
+    df.columns = ['TotImp', 'ObCnt']
+    df['ObCnt'] = df['ObCnt'].astype(np.int64)
+
+    return df
+
+
+def test_bin_df():
+    """
+    Compare bin_df with the original implementation, with and without pressure layers
+    :return: None
+    """
+    df = make_observations(5000)
+
+    for dlat, dlon, dpres in [(5., 5., None), (2.5, 10., None), (5., 5., 50.)]:
+        expected = legacy_bin_df(df, dlat=dlat, dlon=dlon, dpres=dpres)
+        actual = loi.bin_df(df, dlat=dlat, dlon=dlon, dpres=dpres)
+        assert expected.equals(actual)
+        assert expected.index.equals(actual.index)
+        assert list(expected.dtypes) == list(actual.dtypes)
+
+
+def test_bin_df_edges():
+    """
+    Bin with arbitrary bin edges
+    :return: None
+    """
+    df = make_observations(5000)
+
+    # bin edges on a regular grid give the same result as the bin size
+    edges = np.arange(-90., 95., 5.)
+    assert loi.bin_df(df, dlat=list(edges)).equals(loi.bin_df(df, dlat=5.))
+
+    binned = loi.bin_df(df, dlat=[-90., -30., 0., 30.], dlon=[0., 180.], dpres=[1000., 500., 100.])
+    assert set(binned.index.get_level_values('LATITUDE')) <= {-90., -30., 0., 30.}
+    assert set(binned.index.get_level_values('LONGITUDE')) == {0., 180.}
+    assert set(binned.index.get_level_values('PRESSURE')) <= {1000., 500., 100.}
+    assert binned['ObCnt'].sum() == len(df)
+    assert np.isclose(binned['TotImp'].sum(), df['IMPACT'].sum(), rtol=0., atol=1.e-15)
+
+
+def test_scipy_bin_df():
+    """
+    Compare scipy_bin_df with bin_df away from the bin edges
+    :return: None
+    """
+    pytest.importorskip('scipy')
+
+    df = make_observations(5000).iloc[4:]
+    for dpres in [None, 50.]:
+        expected = loi.bin_df(df, dpres=dpres)
+        actual = loi.scipy_bin_df(df, dpres=dpres)
+        assert expected.index.equals(actual.index)
+        assert (expected['ObCnt'] == actual['ObCnt']).all()
+        assert np.allclose(expected['TotImp'], actual['TotImp'], rtol=1.e-12, atol=0.)
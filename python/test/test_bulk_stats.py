@@ -0,0 +1,102 @@
+"""
+Test the fused bulk statistics against the original multi-pass implementation
+"""
+import numpy as np
+import pandas as pd
+from datetime import datetime
+import fsoi.stats.lib_obimpact as loi
+
+
+def _make_observations(n, seed):
+    """
+    Create a synthetic data frame of observations for two cycles
+    :param n: {int} Number of observations per cycle
+    :param seed: {int} Random seed
+    :return: {pandas.DataFrame} Observations as created by columns_to_dataframe
+    """
+    rng = np.random.default_rng(seed)
+    platforms = np.array(['Radiosonde', 'AMSUA_N15', 'NOAA15', 'Ship', 'Buoy', 'UNKNOWN', 'gps'], dtype=object)
+    obtypes = np.array(['u', 'v', 't', 'Tb', 'ps'], dtype=object)
+
+    frames = []
+    for hour in [0, 6]:
+        impact = rng.normal(0.0, 1.e-9, n)
+        impact[rng.random(n) < 0.2] = 0.0
+        impact[rng.random(n) < 0.01] = np.nan
+        columns = {
+            'PLATFORM': platforms[rng.integers(0, len(platforms), n)],
+            'OBTYPE': obtypes[rng.integers(0, len(obtypes), n)],
+            'CHANNEL': rng.integers(-1, 4, n),
+            'LONGITUDE': rng.random(n) * 360.0,
+            'LATITUDE': rng.random(n) * 180.0 - 90.0,
+            'PRESSURE': rng.random(n) * 1000.0,
+            'IMPACT': impact,
+            'OMF': rng.random(n),
+            'OBERR': np.full(n, -999.)
+        }
+        frames.append(loi.columns_to_dataframe(datetime(2020, 3, 1, hour), columns))
+
+    return pd.concat(frames)
+
+
+def _reference_bulk_stats(DF, Platforms, threshold=1.e-10):
+    """
+    The original BulkStats, accumBulkStats and groupBulkStats computations
+    :param DF: {pandas.DataFrame} Observations
+    :param Platforms: {dict} Aggregated platforms
+    :param threshold: {float} Neutral impact threshold
+    :return: {tuple} Bulk, accumulated and grouped statistics
+    """
+    names = ['DATETIME', 'PLATFORM', 'OBTYPE', 'CHANNEL']
+    tmp = DF.reset_index().drop(['LONGITUDE', 'LATITUDE', 'PRESSURE', 'OMF', 'OBERR'], axis=1)
+    bulk = tmp.groupby(names)['IMPACT'].agg(['sum', 'count'])
+    bulk.columns = ['TotImp', 'ObCnt']
+    bulk['ObCntBen'] = tmp.groupby(names)['IMPACT'].apply(lambda c: (c < -threshold).sum())
+    bulk['ObCntNeu'] = tmp.groupby(names)['IMPACT'].apply(lambda c: ((-threshold < c) & (c < threshold)).sum())
+    for col in ['ObCnt', 'ObCntBen', 'ObCntNeu']:
+        bulk[col] = bulk[col].astype(np.int64)
+
+    tmp = bulk.reset_index().drop(['OBTYPE', 'CHANNEL'], axis=1)
+    accum = tmp.groupby(['DATETIME', 'PLATFORM']).agg('sum')
+
+    tmp = accum.reset_index()
+    for key in Platforms:
+        tmp.replace(to_replace=Platforms[key], value=key, inplace=True)
+    group = tmp.groupby(['DATETIME', 'PLATFORM']).agg('sum')
+
+    return bulk, accum, group
+
+
+def test_all_bulk_stats():
+    """
+    Compare the fused bulk statistics with the original implementation
+    :return: None
+    """
+    platforms = loi.Platforms('OnePlatform')
+    df = _make_observations(20000, 0)
+
+    expected = _reference_bulk_stats(df, platforms)
+    actual = loi.allBulkStats(df, platforms)
+
+    for e, a in zip(expected, actual):
+        assert e.equals(a)
+        assert e.index.equals(a.index)
+        assert list(e.index.names) == list(a.index.names)
+        assert list(e.columns) == list(a.columns)
+        assert list(e.dtypes) == list(a.dtypes)
+
+    # the individual functions return the same products
+    bulk = loi.BulkStats(df)
+    assert bulk.equals(actual[0])
+    assert loi.accumBulkStats(bulk).equals(actual[1])
+    assert loi.groupBulkStats(actual[1], platforms).equals(actual[2])
+
+
+def test_map_platforms():
+    """
+    Test that platform names are renamed in the order of the aggregated platform keys
+    :return: None
+    """
+    platforms = {'A': ['a1', 'a2'], 'B': ['b1', 'A'], 'C': ['c1']}
+    mapped = loi.map_platforms(['a1', 'b1', 'x', 'a2', 'c1', 'x'], platforms)
+    assert list(mapped) == ['B', 'B', 'x', 'B', 'C', 'x']
@@ -0,0 +1,133 @@
+"""
+Test the comparison cube that is updated at ingest time
+"""
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import fsoi.stats.lib_obimpact as loi
+from fsoi.data.s3_datastore import S3DataStore, FsoiS3DataStore
+from fsoi.ingest.cube import update_cube, rebuild_cube, read_comparison_cube, read_cube
+from fsoi.plots.managers import ComparisonPlotGenerator
+from fsoi.stats import lib_utils
+
+
+class LocalDataStore(S3DataStore):
+    """
+    An S3 data store that keeps objects in a local directory
+    """
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+
+    def _path(self, descriptor):
+        return os.path.join(self.directory, descriptor['bucket'], descriptor['key'])
+
+    def save_from_local_file(self, local_file, target):
+        os.makedirs(os.path.dirname(self._path(target)), exist_ok=True)
+        shutil.copyfile(local_file, self._path(target))
+        return True
+
+    def load_to_local_file(self, source, local_file):
+        if not os.path.exists(self._path(source)):
+            return False
+        shutil.copyfile(self._path(source), local_file)
+        return True
+
+    def list_prefix(self, bucket, prefix):
+        keys = set()
+        for (root, _, files) in os.walk(os.path.join(self.directory, bucket)):
+            for file in files:
+                key = os.path.relpath(os.path.join(root, file), os.path.join(self.directory, bucket))
+                if key.startswith(prefix):
+                    keys.add(key)
+        return keys
+
+
+def _write_group_stats(datastore, center, norm, date_time, seed, tmp_path):
+    """
+    Write synthetic group bulk statistics for a cycle
+    :return: {pandas.DataFrame} The statistics
+    """
+    rng = np.random.default_rng(seed)
+    platforms = ['Radiosonde', 'Aircraft', 'AMSUA_N15', 'AMSUA_N18', 'GPSRO']
+    index = pd.MultiIndex.from_product(
+        [[pd.Timestamp(date_time[:8] + ' ' + date_time[8:])], platforms, ['u', 'v']],
+        names=['DATETIME', 'PLATFORM', 'OBTYPE'])
+    count = rng.integers(100, 10000, len(index))
+    df = pd.DataFrame({'TotImp': rng.normal(-1.0, 0.5, len(index)), 'ObCnt': count,
+                       'ObCntBen': count // 2, 'ObCntNeu': count // 10}, index=index)
+
+    descriptor = FsoiS3DataStore.create_descriptor(center=center, norm=norm, datetime=date_time, type='groupbulk')
+    bucket, key = FsoiS3DataStore._to_bucket_and_key(descriptor)
+    local_file = str(tmp_path / os.path.basename(key))
+    lib_utils.writeHDF(local_file, 'df', df)
+    datastore.save_from_local_file(local_file, {'bucket': bucket, 'key': key})
+    os.remove(local_file)
+
+    return df
+
+
+def test_update_cube(tmp_path):
+    """
+    Cycles are added to the cube at ingest time, and a reprocessed cycle replaces the old one
+    """
+    datastore = LocalDataStore(str(tmp_path / 's3'))
+    date_times = ['2020013118', '2020020100', '2020020106']
+    for (i, date_time) in enumerate(date_times):
+        _write_group_stats(datastore, 'GMAO', 'moist', date_time, i, tmp_path)
+        assert update_cube('GMAO', 'moist', date_time, datastore)
+
+    df, dates = read_cube(datastore, 'GMAO', 'moist', '202002', str(tmp_path))
+    assert dates == date_times[1:]
+    assert len(df.index.get_level_values('DATETIME').unique()) == 2
+
+    # reprocess a cycle
+    new = _write_group_stats(datastore, 'GMAO', 'moist', '2020020100', 10, tmp_path)
+    assert update_cube('GMAO', 'moist', '2020020100', datastore)
+    df, dates = read_cube(datastore, 'GMAO', 'moist', '202002', str(tmp_path))
+    cycle = df.loc[df.index.get_level_values('DATETIME') == pd.Timestamp('2020-02-01 00:00')]
+    assert dates == date_times[1:]
+    assert np.allclose(cycle.sum()['TotImp'], new['TotImp'].sum())
+
+    # a rebuilt month is the same as the incrementally updated month
+    assert rebuild_cube('GMAO', 'moist', '202002', datastore)
+    rebuilt, rebuilt_dates = read_cube(datastore, 'GMAO', 'moist', '202002', str(tmp_path))
+    assert rebuilt_dates == dates
+    pd.testing.assert_frame_equal(rebuilt, df)
+
+
+def test_read_comparison_cube(tmp_path):
+    """
+    Comparison data from the cube matches the data from the summary plots, and the cube is not
+    used if it is missing a cycle with statistics
+    """
+    datastore = LocalDataStore(str(tmp_path / 's3'))
+    stats = {'GMAO': [], 'NRL': []}
+    for (i, date_time) in enumerate(['2020022912', '2020030100', '2020030112']):
+        for center in stats:
+            df = _write_group_stats(datastore, center, 'dry', date_time, i + len(center), tmp_path)
+            stats[center].append(loi.aggregate_by_platform(df))
+            assert update_cube(center, 'dry', date_time, datastore)
+
+    # a center without statistics has no data, but the cube still covers the request
+    frames = read_comparison_cube(['GMAO', 'MET', 'NRL'], 'dry', ['00', '12'], '20200229', '20200301', datastore)
+    assert list(frames) == ['GMAO', 'NRL']
+
+    # the comparison statistics are the same as those from the summary plots
+    from_cube = ComparisonPlotGenerator(list(frames), 'dry', [0, 12], None, 'bokeh', list(frames.values()))
+    from_summary = ComparisonPlotGenerator(list(frames), 'dry', [0, 12], None, 'bokeh',
+                                           [pd.concat(dict(enumerate(stats[center])), axis=0) for center in frames])
+    cube_dfs = from_cube._load_centers()
+    assert len(cube_dfs) == 2
+    for (cube_df, summary_df) in zip(cube_dfs, from_summary._load_centers()):
+        pd.testing.assert_frame_equal(cube_df.sort_index(), summary_df.sort_index(), check_index_type=False)
+
+    # only the requested cycles are read
+    frames = read_comparison_cube(['NRL'], 'dry', ['12'], '20200301', '20200301', datastore)
+    assert list(frames['NRL'].index.get_level_values('DATETIME').unique()) == [pd.Timestamp('2020-03-01 12:00')]
+
+    # a cycle that is missing from the cube is read from the partial requests instead
+    _write_group_stats(datastore, 'NRL', 'dry', '2020030200', 5, tmp_path)
+    assert read_comparison_cube(['GMAO', 'NRL'], 'dry', ['00'], '20200301', '20200302', datastore) is None
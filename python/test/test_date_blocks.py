@@ -0,0 +1,215 @@
+"""
+Test the statistics of whole blocks of dates that are shared by overlapping summary requests
+"""
+import os
+import hashlib
+import shutil
+import numpy as np
+import pandas as pd
+from fsoi.data.datastore import DataStore
+from fsoi.data.frame_cache import FrameCache
+from fsoi.data.s3_datastore import S3DataStore, FsoiS3DataStore
+from fsoi.ingest.cube import rebuild_cube, update_cube
+from fsoi.ingest.rollup import rebuild_rollup, update_rollups
+from fsoi.plots import managers
+from fsoi.plots.managers import SummaryPlotGenerator
+from fsoi.stats import lib_utils
+
+
+class LocalCache(DataStore):
+    """
+    A data store that keeps group bulk statistics, rollups and the comparison cube in a local directory,
+    and records the group bulk objects loaded
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.loaded = []
+        self.stale = set()
+
+    def _path(self, descriptor):
+        return os.path.join(self.directory, *(S3DataStore._to_bucket_and_key(descriptor) or
+                                              FsoiS3DataStore._to_bucket_and_key(descriptor)))
+
+    def _etag(self, descriptor):
+        path = self._path(descriptor)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    def etag(self, descriptor):
+        # the ETag of the copy read, which is out of date for the dates in self.stale
+        if descriptor.get('date') in self.stale:
+            return 'stale'
+        return self._etag(descriptor)
+
+    def etags_many(self, descriptors):
+        return [self._etag(descriptor) for descriptor in descriptors]
+
+    def exists_many(self, descriptors):
+        return [os.path.exists(self._path(descriptor)) for descriptor in descriptors]
+
+    def load_to_local_file(self, descriptor, local_file):
+        if not os.path.exists(self._path(descriptor)):
+            return False
+        if 'date' in descriptor:
+            self.loaded.append(descriptor['date'] + descriptor['hour'])
+        os.makedirs(os.path.dirname(local_file), exist_ok=True)
+        shutil.copyfile(self._path(descriptor), local_file)
+        return True
+
+    def save_from_local_file(self, local_file, descriptor):
+        os.makedirs(os.path.dirname(self._path(descriptor)), exist_ok=True)
+        shutil.copyfile(local_file, self._path(descriptor))
+        return True
+
+
+def _write_group_stats(cache, date_time, seed):
+    """
+    Write synthetic group bulk statistics for a cycle
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.MultiIndex.from_product(
+        [[pd.Timestamp(date_time[:8] + ' ' + date_time[8:])], ['Radiosonde', 'Aircraft', 'GPSRO'], ['u', 'v']],
+        names=['DATETIME', 'PLATFORM', 'OBTYPE'])
+    count = rng.integers(100, 10000, len(index))
+    df = pd.DataFrame({'TotImp': rng.normal(-1.0, 0.5, len(index)), 'ObCnt': count,
+                       'ObCntBen': count // 2, 'ObCntNeu': count // 10}, index=index)
+
+    descriptor = FsoiS3DataStore.create_descriptor(center='GMAO', norm='dry', date=date_time[:8],
+                                                   hour=date_time[8:], type='groupbulk', format='hdf5')
+    path = cache._path(descriptor)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lib_utils.writeHDF(path, 'df', df)
+
+
+def test_split_into_blocks():
+    """
+    A range is split into whole weeks or months and the dates at the edges
+    """
+    dates = SummaryPlotGenerator._dates_in_range('20200301', '20200330')
+    units = SummaryPlotGenerator._split_into_blocks(dates)
+    assert [label for (label, _) in units] == [None] + ['2020W%02d' % week for week in range(10, 14)] + [None]
+    assert units[0][1] == ['20200301'] and units[1][1][0] == '20200302' and units[-1][1] == ['20200330']
+    assert sum([block_dates for (_, block_dates) in units], []) == dates
+
+    units = SummaryPlotGenerator._split_into_blocks(SummaryPlotGenerator._dates_in_range('20200131', '20200301'),
+                                                    'month')
+    assert [label for (label, _) in units] == [None, '202002', None]
+
+
+def test_sliding_window(tmp_path, monkeypatch):
+    """
+    A window that moves by a day reads only the dates that are not in a cached whole week, and the
+    statistics are the same as those of a request that reads every date
+    """
+    cache = LocalCache(str(tmp_path / 's3'))
+    for (i, date) in enumerate(SummaryPlotGenerator._dates_in_range('20200301', '20200331')):
+        _write_group_stats(cache, date + '00', i)
+    results = []
+    monkeypatch.setattr(managers, 'get_shared_cache', lambda: cache)
+    monkeypatch.setattr(managers, 'get_shared_frame_cache', lambda: frame_cache)
+    monkeypatch.setattr(managers, 'bokehsummaryplot', lambda df, **kwargs: results.append(df))
+    monkeypatch.setattr(managers, 'bokehsummarytseriesplot', lambda df, **kwargs: None)
+
+    def _run(start_date, end_date):
+        results.clear()
+        cache.loaded.clear()
+        spg = SummaryPlotGenerator(start_date, end_date, 'GMAO', 'dry', ['00'], 'Radiosonde,Aircraft,GPSRO', 'bokeh')
+        spg.create_plot_set()
+        spg.clean_up()
+        return results[0], spg.frames['GMAO_group_stats.arrow']
+
+    frame_cache = FrameCache(max_bytes=2 ** 30)
+    _run('20200301', '20200330')
+    df, frames = _run('20200302', '20200331')
+    assert sorted(cache.loaded) == ['2020033000', '2020033100']
+
+    # the same statistics without cached blocks
+    frame_cache = FrameCache(max_bytes=2 ** 30)
+    expected, expected_frames = _run('20200302', '20200331')
+    assert len(cache.loaded) == 30
+    pd.testing.assert_frame_equal(df, expected)
+    pd.testing.assert_frame_equal(frames, expected_frames)
+
+    # a reprocessed cycle is read again
+    _write_group_stats(cache, '2020031000', 99)
+    _run('20200302', '20200331')
+    assert sorted(cache.loaded) == ['202003%02d00' % day for day in list(range(9, 16)) + [30, 31]]
+
+    # a block is not cached if a file read is older than the listed version
+    frame_cache = FrameCache(max_bytes=2 ** 30)
+    cache.stale = {'20200304'}
+    _run('20200302', '20200331')
+    cache.stale = set()
+    _run('20200302', '20200331')
+    assert sorted(cache.loaded) == ['202003%02d00' % day for day in list(range(2, 9)) + [30, 31]]
+
+
+def test_rollup_periods(tmp_path, monkeypatch):
+    """
+    A whole month is read from the rollups and the comparison cube instead of one object per cycle, with
+    the same statistics, unless a rollup is out of date
+    """
+    cache = LocalCache(str(tmp_path / 's3'))
+    for (i, date) in enumerate(SummaryPlotGenerator._dates_in_range('20200131', '20200302')):
+        if date != '20200210':
+            _write_group_stats(cache, date + '00', i)
+    assert rebuild_rollup('GMAO', 'dry', 0, '202002', cache)
+    assert rebuild_cube('GMAO', 'dry', '202002', cache)
+    results = []
+    monkeypatch.setattr(managers, 'get_shared_cache', lambda: cache)
+    monkeypatch.setattr(managers, 'get_shared_frame_cache', lambda: FrameCache(max_bytes=2 ** 30))
+    monkeypatch.setattr(managers, 'bokehsummaryplot', lambda df, **kwargs: results.append(df))
+    monkeypatch.setattr(managers, 'bokehsummarytseriesplot', lambda df, **kwargs: None)
+
+    def _run(datastore):
+        results.clear()
+        cache.loaded.clear()
+        spg = SummaryPlotGenerator('20200131', '20200302', 'GMAO', 'dry', ['00'], 'Radiosonde,Aircraft,GPSRO', 'bokeh',
+                                   datastore)
+        spg.create_plot_set()
+        spg.clean_up()
+        frames = spg.frames['GMAO_group_stats.arrow'].droplevel(0).sort_index()
+        warns.clear()
+        warns.extend(spg.warns)
+        return results[0], frames, list(spg.periods)
+
+    warns = []
+    df, frames, periods = _run(cache)
+    assert periods == ['202002']
+    assert sorted(cache.loaded) == ['2020013100', '2020030100', '2020030200']
+    assert [warn for warn in warns if warn.startswith('Missing data')] == \
+           ['Missing data: type=groupbulk, center=GMAO, norm=dry, date=20200210, hour=00']
+
+    # the same statistics from the group bulk objects
+    expected, expected_frames, periods = _run(LocalCache(str(tmp_path / 'empty')))
+    assert periods == [] and len(cache.loaded) == 31
+    pd.testing.assert_frame_equal(frames, expected_frames)
+    df = df.loc[expected.index]
+    assert np.allclose(df['TotImp'], expected['TotImp'])
+    assert (df['ObCnt'].values == expected['ObCnt'].values).all()
+
+    # a cycle that is in the cube but not in the rollup
+    _write_group_stats(cache, '2020021000', 99)
+    assert update_cube('GMAO', 'dry', '2020021000', cache)
+    _, _, periods = _run(cache)
+    assert periods == [] and len(cache.loaded) == 32
+    assert update_rollups('GMAO', 'dry', '2020021000', cache)
+    _, _, periods = _run(cache)
+    assert periods == ['202002']
+
+    # a reprocessed cycle that is in the cube, and in the rollup from its earlier version
+    _write_group_stats(cache, '2020021500', 98)
+    assert update_cube('GMAO', 'dry', '2020021500', cache)
+    _, _, periods = _run(cache)
+    assert periods == [] and len(cache.loaded) == 32
+
+    # the rollup is rebuilt with the reprocessed cycle
+    assert update_rollups('GMAO', 'dry', '2020021500', cache)
+    df, _, periods = _run(cache)
+    assert periods == ['202002']
+    expected, _, _ = _run(LocalCache(str(tmp_path / 'empty')))
+    df = df.loc[expected.index]
+    assert np.allclose(df['TotImp'], expected['TotImp'])
@@ -0,0 +1,162 @@
+"""
+Test the read-through disk cache against stubbed S3 responses
+"""
+import io
+import os
+import threading
+from botocore.response import StreamingBody
+from fsoi.data.s3_datastore import S3DataStore
+from fsoi.data.disk_cache import DiskCache
+
+
+def _expect_get(stubber, key, data, etag, if_none_match=None):
+    """
+    Expect a get_object request
+    :param stubber: {botocore.stub.Stubber} The stubber
+    :param key: {str} The S3 key
+    :param data: {bytes} The data to return, or None to return 304 Not Modified
+    :param etag: {str} The ETag of the data
+    :param if_none_match: {str} The expected If-None-Match ETag
+    :return: None
+    """
+    params = {'Bucket': 'b', 'Key': key}
+    if if_none_match is not None:
+        params['IfNoneMatch'] = if_none_match
+    if data is None:
+        stubber.add_client_error('get_object', '304', http_status_code=304, expected_params=params)
+    else:
+        stubber.add_response('get_object', {'Body': StreamingBody(io.BytesIO(data), len(data)), 'ETag': etag}, params)
+
+
+def test_read_through(stubber, tmp_path):
+    """
+    Repeated loads do not use the network until the cached file must be validated, and a changed
+    object is downloaded again
+    """
+    cache = DiskCache(S3DataStore(), str(tmp_path / 'cache'), max_bytes=1024 * 1024, revalidate_after=3600)
+    source = {'bucket': 'b', 'key': 'GMAO/groupbulk.GMAO.dry.2020010100.h5'}
+
+    _expect_get(stubber, source['key'], b'version 1', '"e1"')
+    for i in range(3):
+        assert cache.load_to_local_file(source, str(tmp_path / ('work%d' % i) / 'file.h5'))
+        assert (tmp_path / ('work%d' % i) / 'file.h5').read_bytes() == b'version 1'
+    assert (cache.misses, cache.hits) == (1, 2)
+    assert cache.data_exist(source)
+
+    # an unchanged object is validated with a conditional request
+    cache.revalidate_after = 0
+    _expect_get(stubber, source['key'], None, None, if_none_match='"e1"')
+    assert cache.load(source) == b'version 1'
+    assert cache.revalidations == 1
+
+    # a changed object is downloaded again
+    _expect_get(stubber, source['key'], b'version 2', '"e2"', if_none_match='"e1"')
+    assert cache.load(source) == b'version 2'
+
+    # a recently validated file is validated again if a different ETag was listed
+    cache.revalidate_after = 3600
+    _expect_get(stubber, source['key'], b'version 3', '"e3"', if_none_match='"e2"')
+    assert cache.load(dict(source, etag='"e3"')) == b'version 3'
+    assert cache.load(dict(source, etag='"e3"')) == b'version 3'
+
+    # a missing object is not cached
+    stubber.add_client_error('get_object', 'NoSuchKey', http_status_code=404,
+                             expected_params={'Bucket': 'b', 'Key': 'missing.h5'})
+    assert not cache.load_to_local_file({'bucket': 'b', 'key': 'missing.h5'}, str(tmp_path / 'missing.h5'))
+
+
+def test_eviction(stubber, tmp_path):
+    """
+    The least recently used files are removed to stay under the size cap, and the same content is
+    stored once
+    """
+    cache = DiskCache(S3DataStore(), str(tmp_path / 'cache'), max_bytes=250, revalidate_after=3600)
+    objects = {'a': b'a' * 100, 'b': b'b' * 100, 'c': b'c' * 100}
+
+    _expect_get(stubber, 'a', objects['a'], '"ea"')
+    _expect_get(stubber, 'a-copy', objects['a'], '"ea"')
+    _expect_get(stubber, 'b', objects['b'], '"eb"')
+    assert cache.load({'bucket': 'b', 'key': 'a'}) == objects['a']
+    assert cache.load({'bucket': 'b', 'key': 'a-copy'}) == objects['a']
+    assert cache.load({'bucket': 'b', 'key': 'b'}) == objects['b']
+    assert cache.size == 200
+
+    # use 'a' so that 'b' is the least recently used
+    os.utime(cache._object_file('"eb"'), (1, 1))
+    assert cache.load({'bucket': 'b', 'key': 'a'}) == objects['a']
+
+    _expect_get(stubber, 'c', objects['c'], '"ec"')
+    assert cache.load({'bucket': 'b', 'key': 'c'}) == objects['c']
+    assert cache.size <= 250
+    assert not os.path.exists(cache._object_file('"eb"'))
+    assert os.path.exists(cache._object_file('"ea"'))
+
+    # the evicted object is forgotten, and is downloaded again
+    assert 'b/b' not in cache.refs
+    _expect_get(stubber, 'b', objects['b'], '"eb"')
+    assert cache.load({'bucket': 'b', 'key': 'b'}) == objects['b']
+
+
+def test_fetch_survives_eviction(stubber, tmp_path):
+    """
+    A file returned by fetch can still be read after another load evicts it, and the per-object
+    locks are released once the loads are done
+    """
+    cache = DiskCache(S3DataStore(), str(tmp_path / 'cache'), max_bytes=150, revalidate_after=3600)
+
+    _expect_get(stubber, 'a', b'a' * 100, '"ea"')
+    fh = cache.fetch({'bucket': 'b', 'key': 'a'})
+
+    _expect_get(stubber, 'b', b'b' * 100, '"eb"')
+    assert cache.load({'bucket': 'b', 'key': 'b'}) == b'b' * 100
+    assert not os.path.exists(cache._object_file('"ea"'))
+
+    with fh:
+        assert fh.read() == b'a' * 100
+    assert cache.key_locks == {}
+
+
+def test_concurrent_loads(stubber, tmp_path):
+    """
+    Threads loading the same object at the same time download it once
+    """
+    cache = DiskCache(S3DataStore(), str(tmp_path / 'cache'), max_bytes=1024 * 1024, revalidate_after=3600)
+    source = {'bucket': 'b', 'key': 'shared.h5'}
+    _expect_get(stubber, 'shared.h5', b'x' * 10000, '"es"')
+
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(
+        cache.load_to_local_file(source, str(tmp_path / ('out%d.h5' % i))))) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [True] * 8
+    assert cache.misses == 1 and cache.hits == 7
+
+
+def test_failed_revalidation(stubber, tmp_path):
+    """
+    A cached file is still used when it cannot be validated, and is validated on the next load
+    """
+    cache = DiskCache(S3DataStore(), str(tmp_path / 'cache'), max_bytes=1024 * 1024, revalidate_after=0)
+    source = {'bucket': 'b', 'key': 'GMAO/groupbulk.GMAO.dry.2020010100.h5'}
+
+    _expect_get(stubber, source['key'], b'version 1', '"e1"')
+    assert cache.load(source) == b'version 1'
+
+    stubber.add_client_error('get_object', 'InternalError', http_status_code=500,
+                             expected_params={'Bucket': 'b', 'Key': source['key'], 'IfNoneMatch': '"e1"'})
+    assert cache.load_to_local_file(source, str(tmp_path / 'work' / 'file.h5'))
+    assert (tmp_path / 'work' / 'file.h5').read_bytes() == b'version 1'
+    assert cache.etag(source) == '"e1"'
+
+    _expect_get(stubber, source['key'], None, None, if_none_match='"e1"')
+    assert cache.load(source) == b'version 1'
+    assert cache.revalidations == 1
+
+    # an object that was never cached is not loaded if the request fails
+    stubber.add_client_error('get_object', 'InternalError', http_status_code=500,
+                             expected_params={'Bucket': 'b', 'Key': 'other.h5'})
+    assert cache.load({'bucket': 'b', 'key': 'other.h5'}) is None
@@ -0,0 +1,119 @@
+"""
+Test the GMAO downloader against a local HTTP server
+"""
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+from fsoi.data.datastore import DataStore
+from fsoi.ingest.gmao.download_gmao import Downloader
+
+
+class MemoryDataStore(DataStore):
+    """
+    A data store that keeps data in memory and records the largest read from a stream
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.largest_read = 0
+        self.lock = threading.Lock()
+
+    def save_from_stream(self, stream, target):
+        chunks = []
+        while True:
+            chunk = stream.read(64 * 1024)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            with self.lock:
+                self.largest_read = max(self.largest_read, len(chunk))
+        with self.lock:
+            self.data[target['key']] = b''.join(chunks)
+        return True
+
+
+class GmaoHandler(BaseHTTPRequestHandler):
+    """
+    Serve files from memory, failing the first requests for some files, and record how many
+    requests were active at once
+    """
+    files = {}
+    failures = {}
+    requests = []
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        name = self.path.split('/')[-1]
+        with GmaoHandler.lock:
+            GmaoHandler.requests.append(name)
+            GmaoHandler.active += 1
+            GmaoHandler.max_active = max(GmaoHandler.max_active, GmaoHandler.active)
+            failures = GmaoHandler.failures.get(name, 0)
+            if failures > 0:
+                GmaoHandler.failures[name] = failures - 1
+        try:
+            if name not in GmaoHandler.files:
+                self.send_error(404)
+            elif failures > 0:
+                self.send_error(503)
+            else:
+                data = GmaoHandler.files[name]
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                for i in range(0, len(data), 256 * 1024):
+                    self.wfile.write(data[i:i + 256 * 1024])
+        finally:
+            with GmaoHandler.lock:
+                GmaoHandler.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """
+    Start a local HTTP server
+    :return: {str} The base URL
+    """
+    GmaoHandler.files = {'GEOS.fp.%02d.ods' % i: os.urandom(1024 * 1024 + i) for i in range(8)}
+    GmaoHandler.failures = {'GEOS.fp.03.ods': 2}
+    GmaoHandler.requests = []
+    GmaoHandler.max_active = 0
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), GmaoHandler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.1}, daemon=True)
+    thread.start()
+    yield 'http://%s:%d' % server.server_address
+    server.shutdown()
+    server.server_close()
+    thread.join(5)
+
+
+def test_download_all(http_server):
+    """
+    Files stream to the data store with a bounded number of requests at once, and failed
+    downloads are retried
+    """
+    datastore = MemoryDataStore()
+    downloader = Downloader(datastore, workers=3, retries=2, retry_delay=0.01)
+
+    names = sorted(GmaoHandler.files) + ['GEOS.fp.missing.ods']
+    transfers = [('%s/obs/%s' % (http_server, name), {'bucket': 'b', 'key': name}) for name in names]
+    sizes = downloader.download_all(transfers)
+
+    assert sizes == [len(GmaoHandler.files[name]) for name in names[:-1]] + [None]
+    for name in names[:-1]:
+        assert datastore.data[name] == GmaoHandler.files[name]
+
+    # the body is read in small pieces rather than all at once
+    assert datastore.largest_read <= 64 * 1024
+    assert GmaoHandler.max_active <= 3
+
+    # a server error is retried, but a missing file is not
+    assert GmaoHandler.requests.count('GEOS.fp.03.ods') == 3
+    assert GmaoHandler.requests.count('GEOS.fp.missing.ods') == 1
@@ -0,0 +1,70 @@
+"""
+Test checking the existence of many S3 objects with a few list requests
+"""
+from fsoi.data.s3_datastore import S3DataStore, FsoiS3DataStore
+
+
+class ListedS3DataStore(FsoiS3DataStore):
+    """
+    An FSOI S3 data store that lists keys from a set and records the prefixes that were listed
+    """
+
+    def __init__(self, keys):
+        super().__init__()
+        self.keys = keys
+        self.prefixes = []
+
+    def list_prefix(self, bucket, prefix):
+        self.prefixes.append(prefix)
+        return {key for key in self.keys if key.startswith(prefix)}
+
+
+def _descriptors(norms, dates, hours):
+    """
+    Create group bulk descriptors
+    :return: {list} List of descriptors
+    """
+    return [FsoiS3DataStore.create_descriptor(type='groupbulk', center='GMAO', norm=norm, date=date, hour=hour)
+            for norm in norms for date in dates for hour in hours]
+
+
+def test_group_keys():
+    """
+    Keys are grouped by directory, then the shortest prefixes are split within the limit
+    """
+    keys = ['a/x.dry.20200301', 'a/x.dry.20200302', 'a/x.moist.20200301', 'b/y.1', 'b/y.2']
+    groups = S3DataStore._group_keys(keys, 3)
+    assert groups == {'a/x.dry.2020030': keys[:2], 'a/x.moist.20200301': keys[2:3], 'b/y.': keys[3:]}
+    assert sorted(sum(S3DataStore._group_keys(keys, 100).values(), [])) == sorted(keys)
+    assert len(S3DataStore._group_keys(keys, 1)) == 2
+
+
+def test_exists_many():
+    """
+    The existence of each object is found with at most the requested number of list requests
+    """
+    dates = ['202003%02d' % day for day in range(1, 32)]
+    descriptors = _descriptors(['dry', 'moist'], dates, ['00', '06', '12', '18'])
+    descriptors.append({'center': 'GMAO'})
+
+    # every other cycle exists, and other files share the prefixes
+    keys = {FsoiS3DataStore._to_bucket_and_key(d)[1] for d in descriptors[:-1:2]}
+    keys |= {FsoiS3DataStore._to_bucket_and_key(d)[1] for d in _descriptors(['dry'], ['20200401'], ['00'])}
+    datastore = ListedS3DataStore(keys)
+
+    exists = datastore.exists_many(descriptors, max_prefixes=4)
+    assert exists == [i % 2 == 0 for i in range(len(descriptors) - 1)] + [False]
+    assert len(datastore.prefixes) <= 4
+
+
+def test_etags_many():
+    """
+    The ETag of each object is found with the same list requests, and None for missing objects
+    """
+    descriptors = _descriptors(['dry'], ['20200301', '20200302'], ['00', '06'])
+    keys = [FsoiS3DataStore._to_bucket_and_key(d)[1] for d in descriptors]
+    datastore = ListedS3DataStore({keys[0], keys[3]})
+    datastore.list_prefix_etags = lambda bucket, prefix: {key: '"%s"' % key[-6:] for key in datastore.keys
+                                                          if key.startswith(prefix)}
+
+    assert datastore.etags_many(descriptors) == ['"%s"' % keys[0][-6:], None, None, '"%s"' % keys[3][-6:]]
@@ -0,0 +1,49 @@
+"""
+Test the in-memory cache of aggregated data frames
+"""
+import numpy as np
+import pandas as pd
+from fsoi.data.frame_cache import FrameCache
+
+
+def _frame(n, value):
+    """
+    Create a data frame with one row per platform
+    :param n: {int} Number of rows
+    :param value: {float} Value of the TotImp column
+    :return: {pandas.DataFrame} The data frame
+    """
+    index = pd.Index(['P%03d' % i for i in range(n)], name='PLATFORM')
+    return pd.DataFrame({'TotImp': np.full(n, value), 'ObCnt': np.arange(n)}, index=index)
+
+
+def test_frame_cache():
+    """
+    Data frames are returned until the source version changes, and the least recently used data
+    frames are removed to stay under the size cap
+    """
+    size = int(_frame(100, 0.).memory_usage(index=True, deep=True).sum())
+    cache = FrameCache(max_bytes=int(2.5 * size))
+
+    cache.put(('GMAO', 'dry', '2020010100'), _frame(100, 1.), '"e1"')
+    cache.put(('GMAO', 'dry', '2020010106'), _frame(100, 2.), '"e2"')
+    assert cache.get(('GMAO', 'dry', '2020010100'), '"e1"')['TotImp'].iloc[0] == 1.
+    assert cache.get(('NRL', 'dry', '2020010100'), '"e1"') is None
+
+    # the least recently used data frame is removed
+    cache.put(('GMAO', 'dry', '2020010112'), _frame(100, 3.), '"e3"')
+    assert cache.get(('GMAO', 'dry', '2020010106'), '"e2"') is None
+    assert cache.get(('GMAO', 'dry', '2020010100'), '"e1"') is not None
+    assert cache.size <= cache.max_bytes
+
+    # a data frame from another version of the file is removed
+    assert cache.get(('GMAO', 'dry', '2020010100'), '"e9"') is None
+    assert cache.get(('GMAO', 'dry', '2020010100'), '"e1"') is None
+
+    # a data frame that is larger than the cache is not added
+    cache.put(('GMAO', 'dry', '2020010118'), _frame(1000, 4.), '"e4"')
+    assert cache.get(('GMAO', 'dry', '2020010118'), '"e4"') is None
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['entries']) == (2, 5, 1, 1)
+    assert stats['bytes'] == cache.size
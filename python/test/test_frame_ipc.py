@@ -0,0 +1,107 @@
+"""
+Test the Arrow IPC handoff of comparison data from partial requests to the full request
+"""
+import io
+import boto3
+import numpy as np
+import pandas as pd
+import pytest
+from types import SimpleNamespace
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+from fsoi.data.s3_datastore import S3DataStore
+from fsoi.data.frame_ipc import to_ipc, open_ipc, from_ipc, read_ipc_file, get_schema, SchemaError, version_key
+from fsoi.web.request_handler import FullRequestHandler
+
+pa = pytest.importorskip('pyarrow')
+
+
+def _make_summary_frame():
+    """
+    Create aggregated group bulk statistics like the summary plots concatenate for a center
+    :return: {pandas.DataFrame} Statistics with an outer level and DATETIME and PLATFORM index levels
+    """
+    rng = np.random.default_rng(1)
+    ddf = {}
+    for (i, date_time) in enumerate(['2020-03-01 00:00', '2020-03-01 06:00']):
+        index = pd.MultiIndex.from_product([[pd.Timestamp(date_time)], ['Radiosonde', 'AMSUA', 'GPSRO']],
+                                           names=['DATETIME', 'PLATFORM'])
+        count = rng.integers(100, 10000, len(index)).astype(np.float64)
+        ddf[i] = pd.DataFrame({'TotImp': rng.normal(-1.0, 0.5, len(index)), 'ObCnt': count,
+                               'ObCntBen': count // 2, 'ObCntNeu': count // 10}, index=index)
+
+    return pd.concat(ddf, axis=0)
+
+
+def test_round_trip(tmp_path):
+    """
+    A data frame is the same after it is written to memory and read from memory or a memory map
+    """
+    df = _make_summary_frame()
+    expected = df.droplevel(0)
+
+    buffer = to_ipc(df)
+    assert isinstance(buffer, pa.Buffer)
+    pd.testing.assert_frame_equal(from_ipc(buffer), expected)
+    pd.testing.assert_frame_equal(from_ipc(open_ipc(buffer).read()), expected)
+
+    (tmp_path / 'GMAO_group_stats.arrow').write_bytes(buffer)
+    pd.testing.assert_frame_equal(read_ipc_file(str(tmp_path / 'GMAO_group_stats.arrow')), expected)
+
+
+def test_schema_checks():
+    """
+    Data from an incompatible build are rejected on both sides of the handoff
+    """
+    df = _make_summary_frame()
+    with pytest.raises(SchemaError):
+        to_ipc(df.drop(columns=['ObCntNeu']))
+
+    # a different handoff version
+    schema = get_schema().with_metadata({version_key: b'0'})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, schema) as writer:
+        writer.write_table(pa.Table.from_pandas(df.reset_index()[schema.names], schema=schema, preserve_index=False))
+    with pytest.raises(SchemaError, match='version'):
+        from_ipc(sink.getvalue())
+
+    # a different column type
+    table = pa.Table.from_pandas(df.reset_index()[schema.names], preserve_index=False)
+    table = table.set_column(3, 'ObCnt', table.column('ObCnt').cast(pa.int64()))
+    table = table.replace_schema_metadata({version_key: get_schema().metadata[version_key]})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    with pytest.raises(SchemaError, match='schema'):
+        from_ipc(sink.getvalue())
+
+    # a pickle
+    with pytest.raises(SchemaError):
+        from_ipc(b'\x80\x04not an arrow file')
+
+
+def test_download_frames(monkeypatch):
+    """
+    The full request reads the handoff straight from the S3 response body
+    """
+    client = boto3.client('s3', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test')
+    monkeypatch.setattr(S3DataStore, 's3_client', client)
+
+    df = _make_summary_frame()
+    buffer = to_ipc(df)
+    descriptor = {'bucket': 'cache', 'prefix': 'data/HASH', 'name': 'GMAO_group_stats.arrow'}
+    part_handler = SimpleNamespace(center='GMAO', frame_descriptors=[descriptor])
+    handler = FullRequestHandler({'centers': ['GMAO'], 'cycles': ['00'], 'norm': 'dry'})
+
+    with Stubber(client) as stubber:
+        stubber.add_response('get_object', {'Body': StreamingBody(io.BytesIO(buffer), len(buffer))},
+                             {'Bucket': 'cache', 'Key': 'data/HASH/GMAO_group_stats.arrow'})
+        handoffs = handler._download_frames([part_handler])
+
+        stubber.add_response('get_object', {'Body': StreamingBody(io.BytesIO(b'pickle'), 6)},
+                             {'Bucket': 'cache', 'Key': 'data/HASH/GMAO_group_stats.arrow'})
+        assert handler._download_frames([part_handler]) is None
+
+    assert [center for (center, _) in handoffs] == ['GMAO']
+    pd.testing.assert_frame_equal(handoffs[0][1], df.droplevel(0))
+    assert handler.errors == ['Incompatible comparison data from GMAO']
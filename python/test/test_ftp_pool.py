@@ -0,0 +1,105 @@
+"""
+Test the pool of FTP sessions against a local FTP server
+"""
+import os
+import threading
+import pytest
+from fsoi.data.ftp_pool import FtpConnectionPool
+
+pyftpdlib = pytest.importorskip('pyftpdlib')
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+
+
+class RecordingHandler(FTPHandler):
+    """
+    An FTP handler that records logins and REST commands
+    """
+    logins = []
+    rests = []
+
+    def on_login(self, username):
+        RecordingHandler.logins.append(username)
+
+    def ftp_REST(self, line):
+        RecordingHandler.rests.append(int(line))
+        return FTPHandler.ftp_REST(self, line)
+
+
+@pytest.fixture
+def ftp_server(tmp_path):
+    """
+    Start a local FTP server with a user and anonymous access
+    :return: {tuple} (host, port, directory served)
+    """
+    root = tmp_path / 'remote'
+    (root / 'receive').mkdir(parents=True)
+
+    authorizer = DummyAuthorizer()
+    authorizer.add_user('user', 'secret', str(root), perm='elr')
+    authorizer.add_anonymous(str(root))
+    RecordingHandler.authorizer = authorizer
+    RecordingHandler.logins = []
+    RecordingHandler.rests = []
+
+    server = ThreadedFTPServer(('127.0.0.1', 0), RecordingHandler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'timeout': 0.1}, daemon=True)
+    thread.start()
+    yield server.address[0], server.address[1], root
+    server.close_all()
+    thread.join(5)
+
+
+def _write_remote(root, name, size):
+    """
+    Create a file on the FTP server
+    :param root: {pathlib.Path} The directory served
+    :param name: {str} The file name
+    :param size: {int} Size of the file in bytes
+    :return: {bytes} The file contents
+    """
+    data = os.urandom(size)
+    (root / 'receive' / name).write_bytes(data)
+    return data
+
+
+def test_download_many(ftp_server, tmp_path):
+    """
+    Several files download in parallel over a few sessions, which are reused
+    """
+    host, port, root = ftp_server
+    expected = {'file_%02d.bz2' % i: _write_remote(root, 'file_%02d.bz2' % i, 50000 + 1000 * i) for i in range(12)}
+
+    files = [('receive/' + name, str(tmp_path / name)) for name in expected]
+    files.append(('receive/missing.bz2', str(tmp_path / 'missing.bz2')))
+    with FtpConnectionPool(host, 'user', 'secret', size=3, port=port) as pool:
+        results = pool.download_many(files)
+
+    assert results == [True] * len(expected) + [False]
+    for name in expected:
+        assert (tmp_path / name).read_bytes() == expected[name]
+
+    # sessions are reused instead of logging in for every file
+    assert 1 <= len(RecordingHandler.logins) <= 3
+    assert set(RecordingHandler.logins) == {'user'}
+
+
+def test_resume(ftp_server, tmp_path):
+    """
+    A partial local file is completed with REST instead of downloading the whole file again
+    """
+    host, port, root = ftp_server
+    data = _write_remote(root, 'partial.bz2', 200000)
+
+    local_file = tmp_path / 'partial.bz2'
+    local_file.write_bytes(data[:75000])
+    with FtpConnectionPool(host, port=port) as pool:
+        assert pool.download('receive/partial.bz2', str(local_file))
+
+        # a complete file is not downloaded again
+        assert pool.download('receive/partial.bz2', str(local_file))
+
+    assert local_file.read_bytes() == data
+    assert RecordingHandler.rests == [75000]
+    assert RecordingHandler.logins == ['anonymous']
@@ -0,0 +1,90 @@
+"""
+Test writing and reading HDF products with coded PLATFORM and OBTYPE index levels
+"""
+import os
+import tempfile
+import numpy as np
+from datetime import datetime
+import fsoi.stats.lib_obimpact as loi
+import fsoi.stats.lib_utils as lutils
+
+
+def _make_observations(n=20000, seed=0):
+    """
+    Create a synthetic data frame of observations, including a platform missing from codes.yaml
+    :param n: {int} Number of observations
+    :param seed: {int} Random seed
+    :return: {pandas.DataFrame} Observations as created by columns_to_dataframe
+    """
+    rng = np.random.default_rng(seed)
+    platforms = np.array(['Radiosonde', 'AMSUA_N15', 'Aircraft', 'NOT_IN_CODES'], dtype=object)
+    obtypes = np.array(['u', 'v', 'T', 'Tb', 'new_obtype'], dtype=object)
+    columns = {
+        'PLATFORM': platforms[rng.integers(0, len(platforms), n)],
+        'OBTYPE': obtypes[rng.integers(0, len(obtypes), n)],
+        'CHANNEL': rng.integers(-1, 4, n),
+        'LONGITUDE': rng.random(n) * 360.0,
+        'LATITUDE': rng.random(n) * 180.0 - 90.0,
+        'PRESSURE': rng.random(n) * 1000.0,
+        'IMPACT': rng.normal(0.0, 1.e-9, n),
+        'OMF': rng.random(n),
+        'OBERR': np.full(n, -999.)
+    }
+    return loi.columns_to_dataframe(datetime(2020, 3, 1, 0), columns)
+
+
+def test_coded_round_trip():
+    """
+    Write coded products, read them back, and query them with where= conditions on names
+    :return: None
+    """
+    df = _make_observations()
+    platforms = loi.Platforms('OnePlatform')
+    products = [df] + list(loi.allBulkStats(df, platforms))
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for i, product in enumerate(products):
+            coded_file = os.path.join(work_dir, 'coded.%d.h5' % i)
+            plain_file = os.path.join(work_dir, 'plain.%d.h5' % i)
+            lutils.writeHDF(coded_file, 'df', product, complevel=1, complib='zlib', fletcher32=True, coded=True)
+            lutils.writeHDF(plain_file, 'df', product, complevel=1, complib='zlib', fletcher32=True)
+
+            # coded and uncoded files read back to the original data frame
+            for fname in [coded_file, plain_file]:
+                data = lutils.readHDF(fname, 'df')
+                assert data.equals(product)
+                assert list(data.index.dtypes) == list(product.index.dtypes)
+
+            # the coded file is smaller
+            if i == 0:
+                assert os.path.getsize(coded_file) < os.path.getsize(plain_file)
+
+            # where conditions on names are translated to codes
+            for where in [['PLATFORM="Radiosonde"'], 'PLATFORM="NOT_IN_CODES"', ['PLATFORM!="Aircraft"'],
+                          'PLATFORM="NOT_IN_FILE"']:
+                coded = lutils.readHDF(coded_file, 'df', where=where)
+                plain = lutils.readHDF(plain_file, 'df', where=where)
+                assert coded.equals(plain)
+
+        # appending to a coded file keeps the codes of names already in the file
+        fname = os.path.join(work_dir, 'append.h5')
+        lutils.writeHDF(fname, 'df', df.iloc[:10000], coded=True)
+        lutils.writeHDF(fname, 'df', df.iloc[10000:], coded=True)
+        assert lutils.readHDF(fname, 'df').equals(df)
+
+
+def test_encode_levels():
+    """
+    Names in the shared dictionary use shared codes, and other names use file-local codes
+    :return: None
+    """
+    df = _make_observations(100)
+    coded, file_codes = lutils.encode_levels(df)
+
+    shared = lutils.get_shared_codes()
+    assert file_codes['PLATFORM'][shared['PLATFORM']['Radiosonde']] == 'Radiosonde'
+    assert file_codes['PLATFORM'][lutils.LOCAL_CODE_START] == 'NOT_IN_CODES'
+    assert file_codes['OBTYPE'][lutils.LOCAL_CODE_START] == 'new_obtype'
+    assert coded.index.get_level_values('PLATFORM').dtype == np.int64
+
+    assert lutils.decode_levels(coded, file_codes).equals(df)
@@ -0,0 +1,95 @@
+"""
+Test reading lines from compressed files in batches
+"""
+import bz2
+import gzip
+import pytest
+from fsoi.ingest.line_batches import read_line_batches
+
+
+def _write_lines(fname, opener, lines, terminator=b'\n'):
+    """
+    Write lines to a compressed file
+    :param fname: {str} Full path to the file
+    :param opener: {function} bz2.open or gzip.open
+    :param lines: {list} List of lines as {bytes}
+    :param terminator: {bytes} The line terminator
+    :return: None
+    """
+    with opener(fname, 'wb') as fh:
+        fh.write(terminator.join(lines) + terminator)
+
+
+def test_read_line_batches(tmp_path):
+    """
+    Batches contain every line once, in order, for any block and batch size
+    """
+    lines = [('line %d ' % i).encode() * (i % 7) for i in range(1000)]
+
+    for opener in [bz2.open, gzip.open]:
+        fname = str(tmp_path / 'lines')
+        _write_lines(fname, opener, lines)
+        for (batch_size, block_size) in [(1, 7), (64, 100), (333, 4096), (5000, 1 << 20)]:
+            with opener(fname, 'rb') as fh:
+                batches = list(read_line_batches(fh, batch_size, block_size=block_size))
+            assert all(len(batch) == batch_size for batch in batches[:-1])
+            assert 0 < len(batches[-1]) <= batch_size
+            assert [line for batch in batches for line in batch] == lines
+
+        # skip a header
+        with opener(fname, 'rb') as fh:
+            batches = list(read_line_batches(fh, 100, skip_lines=75, block_size=50))
+        assert [line for batch in batches for line in batch] == lines[75:]
+
+
+def test_read_line_batches_dos(tmp_path):
+    """
+    DOS line terminators are removed
+    """
+    lines = [b'first', b'second', b'third']
+    fname = str(tmp_path / 'lines.gz')
+    _write_lines(fname, gzip.open, lines, b'\r\n')
+
+    with gzip.open(fname, 'rb') as fh:
+        assert list(read_line_batches(fh, 2, block_size=3)) == [[b'first', b'second'], [b'third']]
+
+
+def test_read_line_batches_truncated(tmp_path):
+    """
+    A truncated file raises an error, unless the lines before the end of the data are allowed
+    """
+    lines = [('%08d' % i).encode() * 10 for i in range(5000)]
+    fname = str(tmp_path / 'lines.gz')
+    _write_lines(fname, gzip.open, lines)
+    with open(fname, 'rb') as fh:
+        data = fh.read()
+    with open(fname, 'wb') as fh:
+        fh.write(data[:len(data) // 2])
+
+    with pytest.raises(EOFError):
+        with gzip.open(fname, 'rb') as fh:
+            [line for batch in read_line_batches(fh, 1000, block_size=1000) for line in batch]
+
+    with gzip.open(fname, 'rb') as fh:
+        read = [line for batch in read_line_batches(fh, 1000, block_size=1000, allow_truncated=True)
+                for line in batch]
+    assert 0 < len(read) < len(lines)
+    assert read[:-1] == lines[:len(read) - 1]
+
+
+def test_read_line_batches_corrupt(tmp_path):
+    """
+    A corrupt byte in a bzip2 file raises an error instead of ending the file early
+    """
+    lines = [('%08d %x' % (i, i * 2654435761)).encode() for i in range(100000)]
+    fname = str(tmp_path / 'lines.bz2')
+    _write_lines(fname, bz2.open, lines)
+    with open(fname, 'rb') as fh:
+        data = bytearray(fh.read())
+    data[len(data) // 2] ^= 0xff
+    with open(fname, 'wb') as fh:
+        fh.write(bytes(data))
+
+    with pytest.raises(OSError):
+        with bz2.open(fname, 'rb') as fh:
+            [line for batch in read_line_batches(fh, 1000) for line in batch]
@@ -0,0 +1,74 @@
+"""
+Test the array-native conversion of ODS observations for GMAO and MERRA
+"""
+import numpy as np
+from datetime import datetime
+import fsoi.stats.lib_obimpact as loi
+from fsoi.ingest.gmao.process_gmao import ods_to_columns as gmao_ods_to_columns
+from fsoi.ingest.merra.process_merra import ods_to_columns as merra_ods_to_columns
+
+
+class FakeODS:
+    """
+    A minimal stand-in for an ODS object that has already been read
+    """
+    def __init__(self):
+        self.kx = np.array([120, 220, 999, 120, 180, 998, 220], dtype=np.int32)
+        self.kt = np.array([11, 4, 33, 40, 11, 4, 33], dtype=np.int32)
+        self.lev = np.array([500.0, 850.0, 1000.0, 7.0, 300.0, 250.0, 1013.0], dtype=np.float32)
+        self.lon = np.array([-170.5, 20.0, -0.5, 359.0, 0.0, -90.0, 45.0], dtype=np.float32)
+        self.lat = np.array([10.0, -20.0, 30.0, -40.0, 50.0, -60.0, 70.0], dtype=np.float32)
+        self.obs = np.array([1.0, 2.0, 1010.0, 250.0, 5.0, 6.0, 990.0], dtype=np.float32)
+        self.xvec = np.array([-0.1, 0.2, -0.3, 0.4, -0.5, 0.6, -0.7], dtype=np.float32)
+        self.omf = np.array([1.5, -1.5, 2.5, -2.5, 3.5, -3.5, 4.5], dtype=np.float32)
+        self.n_obs = len(self.kx)
+
+
+KX = {120: 'Radiosonde', 220: 'Radiosonde', 180: 'Ship'}
+KT = {4: ['u', 'm/s'], 11: ['q', 'g/kg'], 33: ['ps', 'hPa'], 40: ['Tb', 'K']}
+
+
+def _loop_rows(ods, platform, unknown_value):
+    """
+    Convert the ODS observations one at a time, as the ingest did before
+    :param ods: {FakeODS} The observations
+    :param platform: {str} The platform name or CONV
+    :param unknown_value: {str} The platform for unknown kx values, or None to drop the observation
+    :return: {list} List of rows
+    """
+    rows = []
+    for o in range(ods.n_obs):
+        plat = KX.get(ods.kx[o], unknown_value) if platform in ['CONV'] else platform
+        if plat is None:
+            continue
+        obtype = KT[ods.kt[o]][0]
+        channel = -999 if platform in ['CONV'] else int(ods.lev[o])
+        lon = ods.lon[o] if ods.lon[o] >= 0.0 else ods.lon[o] + 360.0
+        if obtype == 'ps':
+            lev = ods.obs[o]
+        elif obtype == 'Tb':
+            lev = -999.
+        else:
+            lev = ods.lev[o]
+        rows.append([plat, obtype, channel, lon, ods.lat[o], lev, ods.xvec[o], ods.omf[o], -999.])
+    return rows
+
+
+def test_ods_to_columns():
+    """
+    Compare the data frames built from columns with those built from the per-observation loop
+    :return: None
+    """
+    date = datetime(2020, 3, 1, 0)
+    for ods_to_columns, unknown_value in [(gmao_ods_to_columns, 'UNKNOWN'), (merra_ods_to_columns, None)]:
+        for platform in ['CONV', 'AMSUA_N15']:
+            ods = FakeODS()
+            unknown = []
+            columns = ods_to_columns(ods, platform, KX, KT, unknown)
+            if platform in ['CONV']:
+                assert unknown == [999, 998]
+
+            expected = loi.list_to_dataframe(date, _loop_rows(ods, platform, unknown_value))
+            actual = loi.columns_to_dataframe(date, columns)
+            assert expected.equals(actual)
+            assert expected.index.equals(actual.index)
@@ -0,0 +1,142 @@
+"""
+Test decompressing bzip2 files with a pool of threads
+"""
+import bz2
+import pytest
+from fsoi.ingest.line_batches import read_line_batches
+from fsoi.ingest import parallel_bz2
+from fsoi.ingest.parallel_bz2 import ParallelBZ2Reader, find_markers
+
+
+def _make_data(n):
+    """
+    Create text data that compresses into several bzip2 blocks
+    :param n: {int} Number of lines
+    :return: {bytes} The data
+    """
+    return b''.join(b'%08d %.6e observation %x\n' % (i, i * 0.37, (i * 2654435761) % 4294967296) for i in range(n))
+
+
+def _read_all(reader, size):
+    """
+    Read all of the data from a reader
+    :param reader: {ParallelBZ2Reader} The reader
+    :param size: {int} Number of bytes to read at a time
+    :return: {bytes} The data
+    """
+    chunks = []
+    while True:
+        chunk = reader.read(size)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+
+def test_parallel_bz2(tmp_path):
+    """
+    Multi-block and multi-stream files decompress to the same data as the bz2 module
+    """
+    data = _make_data(60000)
+    fname = str(tmp_path / 'data.bz2')
+    with open(fname, 'wb') as fh:
+        # one stream with 100k blocks, and a second stream like a pbzip2 file
+        fh.write(bz2.compress(data, 1) + bz2.compress(data[:12345], 9))
+    expected = data + data[:12345]
+
+    with open(fname, 'rb') as fh:
+        markers = find_markers(fh.read())
+    assert len([kind for (_, kind) in markers if kind == 'block']) > 10
+    assert len([kind for (_, kind) in markers if kind == 'end']) == 2
+
+    for (workers, read_size, size) in [(1, 1 << 20, 1000), (3, 1000, 100000), (4, 50000, -1)]:
+        with ParallelBZ2Reader(fname, workers, read_size) as reader:
+            assert _read_all(reader, size) == expected
+
+    with ParallelBZ2Reader(fname, 2, 10000) as reader:
+        lines = [line for batch in read_line_batches(reader, 1000) for line in batch]
+    assert lines == expected.splitlines()
+
+
+def test_parallel_bz2_errors(tmp_path):
+    """
+    Truncated and corrupt files raise an error on the read that fails, and files that are not bzip2
+    are rejected
+    """
+    data = _make_data(20000)
+    compressed = bz2.compress(data, 1)
+    fname = str(tmp_path / 'truncated.bz2')
+    with open(fname, 'wb') as fh:
+        fh.write(compressed[:len(compressed) // 2])
+
+    # the data before the truncated block are read, then the read of the truncated block fails
+    with ParallelBZ2Reader(fname, 2) as reader:
+        chunks = []
+        with pytest.raises(EOFError):
+            while True:
+                chunks.append(reader.read(1000))
+    assert 0 < len(b''.join(chunks)) < len(data)
+    assert data.startswith(b''.join(chunks))
+
+    # a corrupt byte in the middle of the file
+    corrupt = bytearray(compressed)
+    corrupt[len(corrupt) // 2] ^= 0xff
+    fname = str(tmp_path / 'corrupt.bz2')
+    with open(fname, 'wb') as fh:
+        fh.write(bytes(corrupt))
+    with pytest.raises(OSError):
+        with ParallelBZ2Reader(fname, 2, 10000) as reader:
+            [line for batch in read_line_batches(reader, 1000) for line in batch]
+
+    # the end of the stream CRC is missing, or does not match the blocks
+    for cut in range(1, 5):
+        fname = str(tmp_path / 'short.bz2')
+        with open(fname, 'wb') as fh:
+            fh.write(compressed[:-cut])
+        with pytest.raises(EOFError):
+            with ParallelBZ2Reader(fname, 2, 10000) as reader:
+                _read_all(reader, 1000)
+
+    fname = str(tmp_path / 'crc.bz2')
+    with open(fname, 'wb') as fh:
+        fh.write(compressed[:-4] + bytes(b ^ 0xff for b in compressed[-4:]))
+    with pytest.raises(OSError):
+        with ParallelBZ2Reader(fname, 2, 10000) as reader:
+            _read_all(reader, 1000)
+
+    fname = str(tmp_path / 'plain.txt')
+    with open(fname, 'wb') as fh:
+        fh.write(data)
+    with pytest.raises(IOError):
+        with ParallelBZ2Reader(fname, 2) as reader:
+            reader.read()
+
+
+def test_parallel_bz2_false_marker(tmp_path, monkeypatch):
+    """
+    A block magic number that appears by chance inside compressed data splits a block in two, and
+    the file is decompressed sequentially from the start of the split block
+    """
+    data = _make_data(60000)
+    fname = str(tmp_path / 'data.bz2')
+    with open(fname, 'wb') as fh:
+        fh.write(bz2.compress(data, 1) + bz2.compress(data[:12345], 9))
+    expected = data + data[:12345]
+
+    def _find_markers(compressed):
+        markers = find_markers(compressed)
+        blocks = [pos for (pos, kind) in markers if kind == 'block']
+        if len(blocks) > 2:
+            markers = sorted(markers + [((blocks[1] + blocks[2]) // 2, 'block')])
+        return markers
+
+    monkeypatch.setattr(parallel_bz2, 'find_markers', _find_markers)
+    for (workers, read_size, size) in [(1, 1 << 20, 1000), (2, 1000, 1000), (3, 1 << 30, -1)]:
+        with ParallelBZ2Reader(fname, workers, read_size) as reader:
+            assert _read_all(reader, size) == expected
+
+    # the stream CRC is checked by the sequential decompression too
+    with open(fname, 'wb') as fh:
+        fh.write(bz2.compress(data, 1)[:-2])
+    with pytest.raises(EOFError):
+        with ParallelBZ2Reader(fname, 2, 10000) as reader:
+            _read_all(reader, 1000)
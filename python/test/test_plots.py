@@ -1,4 +1,8 @@
 import os
+import numpy
+import pandas
+from datetime import datetime
+from fsoi.stats import lib_obimpact
 from fsoi.plots.managers import SummaryPlotGenerator, ComparisonPlotGenerator
 
 
@@ -6,17 +10,17 @@ def test_bokeh_plots():
     platforms = 'IASI,Aircraft'
     centers = ['NRL', 'GMAO']
     spgs = {}
-    pickles = []
+    frames = []
 
     # create the summary plots
     for center in centers:
         spg = SummaryPlotGenerator('20200301', '20200331', center, 'both', [0], platforms, 'bokeh')
         spg.create_plot_set()
         spgs[center] = spg
-        pickles += spg.pickles
+        frames += list(spg.frames.values())
 
     # create the comparison plots
-    cpg = ComparisonPlotGenerator(centers, 'both', [0], platforms, 'bokeh', pickles)
+    cpg = ComparisonPlotGenerator(centers, 'both', [0], platforms, 'bokeh', frames)
     spgs['COMP'] = cpg
     cpg.create_plot_set()
 
@@ -36,3 +40,64 @@ def test_bokeh_plots():
             assert os.path.isfile(json_datum)
         pg.clean_up()
         assert not os.path.exists(pg.work_dir)
+
+
+def _legacy_aggregate_by_platform(df):
+    """
+    The original row-by-row implementation of SummaryPlotGenerator._aggregate_by_platform
+    """
+    platform_to_aggregate_map = {}
+    unified_platforms = lib_obimpact.Platforms('OnePlatform')
+    for common_platform in unified_platforms:
+        for specific_platform in unified_platforms[common_platform]:
+            platform_to_aggregate_map[specific_platform] = common_platform
+        platform_to_aggregate_map[common_platform] = common_platform
+
+    columns = ['TotImp', 'ObCnt', 'ObCntBen', 'ObCntNeu']
+    common_row_map = {}
+    for index, row in df.iterrows():
+        dt, specific_platform = index
+        common_platform = platform_to_aggregate_map.get(specific_platform, 'Unknown')
+        common_index = (dt, common_platform)
+        if common_index not in common_row_map:
+            common_row_map[common_index] = [dt, common_platform] + [0] * len(columns)
+        common_row = common_row_map[common_index]
+        for i in range(len(row)):
+            common_row[i + 2] += row[i]
+
+    common_values = [common_row_map[common_index][2:] for common_index in common_row_map]
+    common_platform_list = [common_index[1] for common_index in common_row_map]
+    levels = [[list(common_row_map)[0][0]], common_platform_list]
+    codes = [[0] * len(common_platform_list), list(range(len(common_platform_list)))]
+    new_index = pandas.MultiIndex(levels=levels, codes=codes, names=['DATETIME', 'PLATFORM'])
+    return pandas.DataFrame(common_values, index=new_index, columns=columns)
+
+
+def test_aggregate_by_platform():
+    """
+    Compare the vectorized platform aggregation with the original row-by-row implementation
+    :return: None
+    """
+    unified_platforms = lib_obimpact.Platforms('OnePlatform')
+    specific_platforms = [platform for common in unified_platforms for platform in unified_platforms[common]]
+    specific_platforms += list(unified_platforms)[:5] + ['NotAPlatform']
+
+    rng = numpy.random.default_rng(0)
+    platforms = list(rng.permutation(specific_platforms))
+    n = len(platforms)
+    index = pandas.MultiIndex.from_arrays([[datetime(2020, 3, 1, 6)] * n, platforms], names=['DATETIME', 'PLATFORM'])
+    df = pandas.DataFrame({
+        'TotImp': rng.normal(0.0, 1.e-6, n),
+        'ObCnt': rng.integers(1, 10000, n),
+        'ObCntBen': rng.integers(0, 5000, n),
+        'ObCntNeu': rng.integers(0, 1000, n)
+    }, index=index)
+
+    expected = _legacy_aggregate_by_platform(df)
+    actual = SummaryPlotGenerator._aggregate_by_platform(df)
+
+    assert expected.index.equals(actual.index)
+    assert list(expected.index.get_level_values('PLATFORM')) == list(actual.index.get_level_values('PLATFORM'))
+    assert list(expected.columns) == list(actual.columns)
+    assert list(expected.dtypes) == list(actual.dtypes)
+    pandas.testing.assert_frame_equal(expected, actual, check_exact=False, rtol=1.e-12)
@@ -0,0 +1,95 @@
+"""
+Test the batch MET decoder against the line-by-line parser
+"""
+import gzip
+import yaml
+import pkgutil
+import numpy as np
+from fortranformat import FortranRecordReader, FortranRecordWriter
+from fsoi.ingest.fixed_width import FixedWidthReader
+from fsoi.ingest.line_batches import read_line_batches
+from fsoi.ingest.met.process_met import _parse_line, _parse_lines, _parse_each_line
+
+
+def _make_lines(config, n, seed):
+    """
+    Create synthetic MET lines that exercise the platform, channel and skip logic
+    :param config: {dict} The UK Met configuration read from met_ingest.yaml
+    :param n: {int} Number of lines
+    :param seed: {int} Random seed
+    :return: {list} List of lines as {bytes}
+    """
+    rng = np.random.default_rng(seed)
+    writer = FortranRecordWriter(config['fortran_format_string'])
+    observations = [
+        (2, 'TEMP 12345', 101),
+        (3, 'AIRCRAFT ABC', 4),
+        (1, 'BUOY 62001', 10210),
+        (1, 'BUOY 62002', 10312),
+        (4, 'GOES 257', 7),
+        (10, 'METOP2 (A) ATOVS AMSUA CH-5 X', 3),
+        (10, 'NOAA19 ATOVS HIRS CH-12 X', 3),
+        (2, 'MYSTERY', 5),
+        (10, 'MYSTERY CH-1 X', 3),
+        (10, 'NOAA19 ATOVS HIRS NOCHANNEL', 3)
+    ]
+
+    lines = []
+    for i in range(n):
+        obtyp, schar, instyp = observations[rng.integers(0, len(observations))]
+        sens = 1.e-4 if rng.random() < 0.05 else rng.normal(0.0, 1.e-5)
+        lev = -9999.9999 if rng.random() < 0.3 else rng.random() * 1000.0
+        values = [i, rng.random(), rng.normal(), sens, rng.random() * 180. - 90., rng.random() * 198. - 99.,
+                  lev, obtyp, instyp, 0, rng.random(), 0.0, schar]
+        lines.append(writer.write(values).encode())
+
+    return lines
+
+
+def test_parse_lines():
+    """
+    Compare the batch decoder with the line-by-line parser
+    """
+    config = yaml.full_load(pkgutil.get_data('fsoi', 'ingest/met/met_ingest.yaml'))
+    lines = _make_lines(config, 500, 11)
+
+    unknown = []
+    data = _parse_lines(config, lines, FixedWidthReader(config['fortran_format_string']), unknown)
+    expected_unknown = []
+    expected = _parse_each_line(config, lines, FortranRecordReader(config['fortran_format_string']),
+                                expected_unknown)
+
+    assert 0 < len(data['impact']) < len(lines)
+    assert set(unknown) == set(expected_unknown)
+    for key in expected:
+        assert len(data[key]) == len(expected[key])
+        if data[key].dtype == object:
+            assert (data[key] == expected[key]).all()
+        else:
+            assert np.allclose(data[key], expected[key])
+
+    # the radiance channel is parsed from the station characters
+    assert set(data['channel'][data['platform'] == 'HIRS_N19']) == {12}
+
+
+def test_parse_line_batches(tmp_path):
+    """
+    Decoding a gzip file in small batches gives the same result as decoding every line at once
+    """
+    config = yaml.full_load(pkgutil.get_data('fsoi', 'ingest/met/met_ingest.yaml'))
+    lines = _make_lines(config, 300, 12)
+    reader = FixedWidthReader(config['fortran_format_string'])
+    fname = str(tmp_path / 'met.gz')
+    with gzip.open(fname, 'wb') as fh:
+        fh.write(b'\n'.join(lines) + b'\n')
+
+    batches = []
+    with gzip.open(fname, 'rb') as fh:
+        for batch in read_line_batches(fh, batch_size=64, block_size=1000):
+            batches.append(_parse_lines(config, batch, reader, []))
+    data = {key: np.concatenate([batch[key] for batch in batches]) for key in batches[0]}
+    expected = _parse_lines(config, lines, reader, [])
+
+    assert len(batches) == 5
+    for key in expected:
+        assert (data[key] == expected[key]).all()
@@ -0,0 +1,117 @@
+"""
+Test the columnar NRL decoder against the line-by-line parser
+"""
+import os
+import yaml
+import pkgutil
+from datetime import datetime
+from fortranformat import FortranRecordReader
+from fsoi.ingest.fixed_width import FixedWidthReader
+from fsoi.ingest.nrl.process_nrl import _parse_line, _parse_lines
+import fsoi.stats.lib_obimpact as loi
+
+
+def _load_sample_lines():
+    """
+    Load the sample NRL lines and add lines that exercise the platform and skip logic
+    :return: {list} List of lines
+    """
+    resource = os.path.join(os.path.dirname(__file__), '../test_resources/nrl_sample_input_data.yaml')
+    lines = yaml.full_load(open(resource))['lines']
+
+    # replace instyp (columns 98-101) and the a16 field (columns 122-138) of a sample line
+    template = lines[0]
+    variations = [
+        (' 10', 'BUOY    12345   '),
+        (' 10', 'DRIFTER 12345   '),
+        (' 10', 'SHIP    12345   '),
+        ('  1', 'SYNOP   12345   '),
+        ('101', 'PIBAL   12345   '),
+        ('101', 'RECO    12345   '),
+        ('210', 'NOAA15 CH 5     '),
+        ('210', 'METOPB CH12     '),
+        ('188', 'METOPA CH 123   '),
+        ('184', 'NOAA19 CH    5  '),
+        ('999', 'MYSTERY         '),
+        ('998', 'MYSTERY         '),
+        ('999', 'MYSTERY         ')
+    ]
+    for instyp, schar in variations:
+        lines.append(template[:98] + instyp + template[101:122] + schar + template[138:])
+
+    # a land surface observation with zero impact should be skipped
+    lines.append(template[:98] + '  1' + template[101:205] + '  0.000000E+00')
+
+    return lines
+
+
+def test_fixed_width_reader():
+    """
+    Compare every field read by the FixedWidthReader with the FortranRecordReader
+    :return: None
+    """
+    config = yaml.full_load(pkgutil.get_data('fsoi', 'ingest/nrl/nrl_ingest.yaml'))
+    fortran_format = config['fortran_format_string']
+    lines = _load_sample_lines()
+
+    columns = FixedWidthReader(fortran_format).read_columns(lines)
+    line_reader = FortranRecordReader(fortran_format)
+
+    for n, line in enumerate(lines):
+        expected = line_reader.read(line)
+        assert len(expected) == len(columns)
+        for i in range(len(expected)):
+            assert columns[i][n] == expected[i]
+
+
+def test_parse_lines_parity():
+    """
+    Parse the sample lines with _parse_lines and _parse_line, and compare the results
+    :return: None
+    """
+    config = yaml.full_load(pkgutil.get_data('fsoi', 'ingest/nrl/nrl_ingest.yaml'))
+    fortran_format = config['fortran_format_string']
+    kt = config['kt']
+    kx = config['kx']
+    lines = _load_sample_lines()
+
+    expected_unknown = []
+    expected = []
+    for line in lines:
+        data = _parse_line(line, kt, kx, fortran_format, expected_unknown)
+        if data is not None:
+            expected.append(data)
+
+    unknown = []
+    data = _parse_lines([line.encode() for line in lines], kt, kx, FixedWidthReader(fortran_format), unknown)
+
+    assert unknown == expected_unknown == [999, 998]
+    assert len(expected) == len(lines) - 1
+    for key in expected[0]:
+        assert len(data[key]) == len(expected)
+        for n in range(len(expected)):
+            assert data[key][n] == expected[n][key]
+
+    # the data frame from columns must match the data frame from rows
+    date = datetime(2020, 3, 1, 0)
+    rows = []
+    for d in expected:
+        lon = d['lon'] if d['lon'] >= 0.0 else d['lon'] + 360.0
+        rows.append([d['platform'], d['obtype'], d['channel'], lon, d['lat'], d['lev'], d['impact'], d['omf'],
+                     d['oberr']])
+    columns = {
+        'PLATFORM': data['platform'],
+        'OBTYPE': data['obtype'],
+        'CHANNEL': data['channel'],
+        'LONGITUDE': data['lon'],
+        'LATITUDE': data['lat'],
+        'PRESSURE': data['lev'],
+        'IMPACT': data['impact'],
+        'OMF': data['omf'],
+        'OBERR': data['oberr']
+    }
+    df_rows = loi.list_to_dataframe(date, rows)
+    df_columns = loi.columns_to_dataframe(date, columns)
+    assert df_rows.equals(df_columns)
+    assert df_rows.index.equals(df_columns.index)
+    assert list(df_rows.index.dtypes) == list(df_columns.index.dtypes)
@@ -0,0 +1,73 @@
+"""
+Test reading ODS files in a pool of processes
+"""
+import os
+import tempfile
+import shutil
+import numpy as np
+from netCDF4 import Dataset
+from fsoi.ingest.gmao.process_gmao import read_ods_files as gmao_read_ods_files
+from fsoi.ingest.merra.process_merra import read_ods_files as merra_read_ods_files
+
+
+KX = {120: 'Radiosonde', 220: 'Radiosonde', 180: 'Ship'}
+KT = {4: ['u', 'm/s'], 11: ['q', 'g/kg'], 33: ['ps', 'hPa'], 40: ['Tb', 'K']}
+
+
+def _write_ods(fname, n, seed):
+    """
+    Write a synthetic ODS file
+    :param fname: {str} Full path to the file
+    :param n: {int} Number of observations
+    :param seed: {int} Random seed
+    :return: None
+    """
+    rng = np.random.default_rng(seed)
+    with Dataset(fname, 'w') as nc:
+        nc.createDimension('nobs', n)
+        values = {
+            'lat': rng.random(n) * 180.0 - 90.0,
+            'lon': rng.random(n) * 360.0 - 180.0,
+            'lev': rng.integers(1, 1000, n),
+            'time': np.zeros(n),
+            'kt': rng.choice(list(KT), n),
+            'kx': rng.choice([120, 220, 180, 999], n),
+            'ks': np.arange(n),
+            'xm': np.zeros(n),
+            'obs': rng.random(n),
+            'omf': rng.random(n),
+            'oma': rng.random(n),
+            'xvec': rng.normal(0.0, 1.e-3, n),
+            'qcexcl': rng.choice([0, 0, 0, 1], n),
+            'qchist': np.zeros(n)
+        }
+        for name in values:
+            dtype = 'i4' if name in ['kt', 'kx', 'ks', 'qcexcl', 'qchist'] else 'f4'
+            nc.createVariable(name, dtype, ('nobs',))[:] = values[name]
+
+
+def test_read_ods_files():
+    """
+    Reading files in a pool of processes gives the same results, in the same order, as reading serially
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        paths = []
+        for i in range(6):
+            paths.append('%s/file%d.ods' % (work_dir, i))
+            _write_ods(paths[-1], 50 + 40 * i, i)
+        platforms = ['CONV', 'AMSUA_N15', 'CONV', 'MHS_N19', 'CONV', 'AIRS_AQUA']
+
+        for read_ods_files in [gmao_read_ods_files, merra_read_ods_files]:
+            serial = read_ods_files(paths, platforms, KX, KT, workers=1)
+            parallel = read_ods_files(paths, platforms, KX, KT, workers=3)
+
+            assert len(serial) == len(parallel) == len(paths)
+            assert serial[0][2] == [999]
+            for ((columns, n_obs, unknown), (p_columns, p_n_obs, p_unknown)) in zip(serial, parallel):
+                assert n_obs == p_n_obs
+                assert unknown == p_unknown
+                for col in columns:
+                    assert (columns[col] == p_columns[col]).all()
+    finally:
+        shutil.rmtree(work_dir)
@@ -0,0 +1,107 @@
+"""
+Test the canonical form of requests and the reuse of partial results from earlier requests
+"""
+import json
+import boto3
+from botocore.stub import Stubber
+from fsoi.data.s3_datastore import S3DataStore
+from fsoi.web.data import RequestDao
+from fsoi.web.request_handler import Handler, FullRequestHandler, PartialRequestHandler
+
+
+def _make_request(**kwargs):
+    """
+    Create a validated request
+    :return: {dict} The request
+    """
+    request = {'start_date': '20200301', 'end_date': '20200305', 'centers': ['GMAO', 'NRL'], 'norm': 'dry',
+               'cycles': ['00', '12'], 'platforms': 'Radiosonde,AMSUA,GPSRO', 'interval': '1'}
+    request.update(kwargs)
+    return request
+
+
+def test_hash_request():
+    """
+    Requests that differ only in the format of their values have the same hash, but the order of the
+    centers, which is the order of the comparison plots, changes the hash
+    """
+    expected = Handler.hash_request(_make_request())
+
+    assert Handler.hash_request(dict(reversed(list(_make_request().items())))) == expected
+    assert Handler.hash_request(_make_request(centers='GMAO, NRL')) == expected
+    assert Handler.hash_request(_make_request(cycles=['12', '0'])) == expected
+    assert Handler.hash_request(_make_request(cycles='0, 12')) == expected
+    assert Handler.hash_request(_make_request(platforms='gpsro,Radiosonde,AMSUA')) == expected
+    assert Handler.hash_request(_make_request(norm='DRY')) == expected
+    assert Handler.hash_request(_make_request(hash_value='H', ref_id='R', skip_frames=True)) == expected
+
+    assert Handler.hash_request(_make_request(end_date='20200306')) != expected
+    assert Handler.hash_request(_make_request(centers=['NRL', 'GMAO'])) != expected
+    assert Handler.hash_request(_make_request(centers=['GMAO'])) != expected
+    assert Handler.hash_request(_make_request(cycles=['00'])) != expected
+    assert Handler.hash_request(_make_request(platforms='Radiosonde,AMSUA')) != expected
+    assert Handler.hash_request(_make_request(centers=['GMAO'], is_partial=True)) != \
+        Handler.hash_request(_make_request(centers=['GMAO']))
+    assert Handler.hash_request({'cache_id': 'ABC'}) == 'ABC'
+
+
+def test_normalize_request():
+    """
+    A request is processed with the same normalized values that are hashed
+    """
+    handler = FullRequestHandler(_make_request(centers='NRL, GMAO', cycles='12,0', norm='DRY',
+                                               platforms='gpsro,Radiosonde, AMSUA'))
+    assert handler.request['centers'] == ['NRL', 'GMAO']
+    assert handler.request['cycles'] == ['00', '12']
+    assert handler.request['norm'] == 'dry'
+    assert handler.request['platforms'] == 'AMSUA,GPSRO,RADIOSONDE'
+    assert handler.hash_value == Handler.hash_request(handler.request)
+
+
+def test_reuse_partial_result(monkeypatch):
+    """
+    A request for GMAO and NRL copies the results for GMAO from an earlier request for GMAO alone
+    """
+    client = boto3.client('s3', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test')
+    monkeypatch.setattr(S3DataStore, 's3_client', client)
+
+    # the results of a partial request that was part of an earlier request for GMAO alone
+    earlier = FullRequestHandler(_make_request(centers=['GMAO']))
+    part_req = _make_request(centers=['GMAO'], is_partial=True, hash_value=earlier.hash_value, ref_id='R')
+    part_handler = PartialRequestHandler(part_req)
+    part_handler.plot_descriptors = [{'bucket': 'cache', 'prefix': 'data/%s' % earlier.hash_value,
+                                      'name': 'GMAO_TotImp_00Z.png', 'size': 1000}]
+    part_handler.frame_descriptors = [{'bucket': 'cache', 'prefix': 'data/%s' % earlier.hash_value,
+                                       'name': 'GMAO_group_stats.arrow', 'size': 30}]
+    jobs = {part_handler.reuse_hash: {'status_id': 'SUCCESS', 'res_obj': json.dumps(part_handler.__getstate__()),
+                                      'expires': 2e10}}
+    monkeypatch.setattr(RequestDao, 'get_request', staticmethod(lambda req_hash: jobs.get(req_hash)))
+
+    handler = FullRequestHandler(_make_request(centers=['GMAO', 'NRL']))
+    submitted = []
+    monkeypatch.setattr(handler, '_submit_partial_request', lambda part: submitted.append(part.center) or part)
+
+    with Stubber(client) as stubber:
+        for name in ['GMAO_TotImp_00Z.png', 'GMAO_group_stats.arrow']:
+            stubber.add_response('copy_object', {}, {
+                'Bucket': 'cache', 'Key': 'data/%s/%s' % (handler.hash_value, name),
+                'CopySource': {'Bucket': 'cache', 'Key': 'data/%s/%s' % (earlier.hash_value, name)}})
+        futures = handler._submit_partial_requests()
+        stubber.assert_no_pending_responses()
+
+    # only NRL is computed, and the GMAO results are in the cache of the new request
+    assert submitted == ['NRL']
+    reused = futures[0]
+    assert isinstance(reused, PartialRequestHandler) and reused.center == 'GMAO'
+    assert reused.hash_value == handler.hash_value
+    assert [d['prefix'] for d in reused.plot_descriptors + reused.frame_descriptors] == \
+        ['data/%s' % handler.hash_value] * 2
+    assert reused.plot_descriptors[0]['size'] == 1000
+
+    # results without the comparison data are not reused when the comparison data are needed
+    part_handler.request['skip_frames'] = True
+    part_handler.frame_descriptors = []
+    jobs[part_handler.reuse_hash]['res_obj'] = json.dumps(part_handler.__getstate__())
+    submitted.clear()
+    handler._submit_partial_requests()
+    assert submitted == ['GMAO', 'NRL']
@@ -0,0 +1,87 @@
+"""
+Test the cache manifests and eviction of web request results against stubbed AWS responses
+"""
+import boto3
+import pytest
+from botocore.stub import Stubber
+from fsoi.data.s3_datastore import S3DataStore
+from fsoi.web import data as web_data
+from fsoi.web import result_cache
+from fsoi.web.data import RequestDao
+
+
+def test_manifest_round_trip(monkeypatch):
+    """
+    The manifest is saved with the response and returned with the request in a single read
+    """
+    client = boto3.client('dynamodb', region_name='us-east-1', aws_access_key_id='test',
+                          aws_secret_access_key='test')
+    monkeypatch.setattr(web_data.boto3, 'client', lambda name: client)
+
+    descriptors = [{'bucket': 'cache', 'prefix': 'data/H', 'name': 'GMAO_TotImp_00Z.png', 'size': 1000},
+                   {'bucket': 'cache', 'prefix': 'data/H', 'name': 'GMAO_TotImp_00Z.json', 'size': 200},
+                   {'bucket': 'cache', 'prefix': 'data/H', 'name': 'GMAO_group_stats.arrow', 'size': 30}]
+    manifest = result_cache.create_manifest(descriptors, ttl=100, now=1000.)
+    assert manifest == {'keys': ['data/H/GMAO_TotImp_00Z.png', 'data/H/GMAO_TotImp_00Z.json',
+                                 'data/H/GMAO_group_stats.arrow'], 'bytes': 1230, 'expires': 1100.,
+                        'purge_after': 1100. + result_cache.get_config()['purge_grace'], 'accessed': 1000.}
+    purge_after = str(int(manifest['purge_after']))
+
+    item = {'req_hash': {'S': 'H'}, 'status_id': {'S': 'SUCCESS'}, 'message': {'S': 'Done.'},
+            'progress': {'N': '100'}, 'res_obj': {'S': '{}'}, 'cache_keys': {'SS': sorted(manifest['keys'])},
+            'cache_bytes': {'N': '1230'}, 'expires': {'N': '1100'}, 'accessed': {'N': '1000'}}
+    with Stubber(client) as stubber:
+        stubber.add_response('update_item', {'ResponseMetadata': {'HTTPStatusCode': 200}}, {
+            'TableName': 'ios_requests', 'Key': {'req_hash': {'S': 'H'}},
+            'UpdateExpression': 'SET res_obj = :res_obj, cache_bytes = :cache_bytes, expires = :expires, '
+                                'purge_after = :purge_after, accessed = :accessed, cache_keys = :cache_keys',
+            'ExpressionAttributeValues': {':res_obj': {'S': '{}'}, ':cache_bytes': {'N': '1230'},
+                                          ':expires': {'N': '1100'}, ':purge_after': {'N': purge_after},
+                                          ':accessed': {'N': '1000'},
+                                          ':cache_keys': {'SS': sorted(manifest['keys'])}}})
+        stubber.add_response('get_item', {'Item': item},
+                             {'TableName': 'ios_requests', 'Key': {'req_hash': {'S': 'H'}}})
+        assert RequestDao.add_response('H', {}, manifest)
+        job = RequestDao.get_request('H')
+
+    assert job['res_obj'] == '{}' and job['cache_bytes'] == 1230
+    assert sorted(job['cache_keys']) == sorted(manifest['keys'])
+    assert not result_cache.is_expired(job, now=1099.)
+    assert result_cache.is_expired(job, now=1100.)
+
+
+@pytest.mark.parametrize('stubber', ['cache'], indirect=True)
+def test_evict(stubber, monkeypatch):
+    """
+    Expired results are removed, then the least recently used results until the cache is under the
+    size limit
+    """
+    manifests = [
+        {'req_hash': 'old', 'cache_keys': ['data/old/a.png'], 'cache_bytes': 10, 'expires': 50., 'accessed': 40.},
+        {'req_hash': 'lru', 'cache_keys': ['data/lru/a.png', 'data/lru/b.json'], 'cache_bytes': 100,
+         'expires': 500., 'accessed': 60.},
+        {'req_hash': 'mru', 'cache_keys': ['data/mru/a.png'], 'cache_bytes': 100, 'expires': 500., 'accessed': 90.}
+    ]
+    deleted = []
+    monkeypatch.setattr(RequestDao, 'list_cached_results', staticmethod(lambda: manifests))
+    monkeypatch.setattr(RequestDao, 'delete_request', staticmethod(lambda req_hash: deleted.append(req_hash) or True))
+
+    for (keys, errors) in [(['data/old/a.png'], []), (['data/lru/a.png', 'data/lru/b.json'], [])]:
+        stubber.add_response('delete_objects', {'Errors': errors},
+                                {'Bucket': 'cache', 'Delete': {'Objects': [{'Key': key} for key in keys], 'Quiet': True}})
+
+    assert result_cache.evict(max_bytes=150, now=100.) == ['old', 'lru']
+    assert deleted == ['old', 'lru']
+
+
+@pytest.mark.parametrize('stubber', ['cache'], indirect=True)
+def test_delete_many(stubber):
+    """
+    Objects are deleted in bulk, and objects that could not be deleted are reported
+    """
+    targets = [{'bucket': 'cache', 'key': 'data/H/%d.png' % i} for i in range(3)]
+    stubber.add_response('delete_objects', {'Errors': [{'Key': 'data/H/1.png', 'Code': 'AccessDenied'}]},
+                            {'Bucket': 'cache', 'Delete': {'Objects': [{'Key': t['key']} for t in targets],
+                                                           'Quiet': True}})
+
+    assert S3DataStore().delete_many(targets) == [True, False, True]
@@ -0,0 +1,77 @@
+"""
+Test the monthly and seasonal rollups of group bulk statistics
+"""
+import numpy as np
+import pandas as pd
+import fsoi.stats.lib_obimpact as loi
+from fsoi.ingest.rollup import get_periods, get_period_dates, split_date_range
+
+
+def _make_group_stats(dates, seed):
+    """
+    Create synthetic group bulk statistics for a list of cycles
+    :param dates: {list} List of datetimes YYYYMMDDHH
+    :param seed: {int} Random seed
+    :return: {pandas.DataFrame} Statistics with DATETIME and PLATFORM index levels
+    """
+    rng = np.random.default_rng(seed)
+    platforms = ['Radiosonde', 'Aircraft', 'AMSUA', 'GPSRO', 'Ship']
+
+    frames = []
+    for date in dates:
+        # not every platform is in every cycle
+        names = [p for p in platforms if rng.random() > 0.2]
+        index = pd.MultiIndex.from_product([[pd.Timestamp(date[:8] + ' ' + date[8:])], names],
+                                           names=['DATETIME', 'PLATFORM'])
+        count = rng.integers(100, 10000, len(names))
+        frames.append(pd.DataFrame({
+            'TotImp': rng.normal(-1.0, 0.5, len(names)),
+            'ObCnt': count,
+            'ObCntBen': count // 2,
+            'ObCntNeu': count // 10
+        }, index=index))
+
+    return pd.concat(frames)
+
+
+def test_rollup_matches_tavg():
+    """
+    Merged rollups of two partial time ranges give the same averages as tavg over all cycles
+    """
+    dates = ['202003%02d00' % day for day in range(1, 21)]
+    df = _make_group_stats(dates, 3)
+
+    first = loi.rollupStats(df.loc[df.index.get_level_values('DATETIME') < pd.Timestamp('2020-03-11')])
+    second = loi.rollupStats(df.loc[df.index.get_level_values('DATETIME') >= pd.Timestamp('2020-03-11')])
+    mean, std = loi.tavgRollupStats(loi.mergeRollupStats([first, second]))
+    expected_mean, expected_std = loi.tavg(df, level='PLATFORM')
+
+    mean = mean.loc[expected_mean.index]
+    std = std.loc[expected_std.index]
+    assert np.allclose(mean['TotImp'], expected_mean['TotImp'])
+    assert np.allclose(std['TotImp'], expected_std['TotImp'])
+    for col in ['ObCnt', 'ObCntBen', 'ObCntNeu']:
+        assert (mean[col].values == expected_mean[col].values).all()
+        assert (np.abs(std[col].values - expected_std[col].values) <= 1).all()
+
+
+def test_periods():
+    """
+    Dates map to a month and a season, and December belongs to the following year's winter
+    """
+    assert get_periods('2020031506') == ['202003', '2020MAM']
+    assert get_periods('20191231') == ['201912', '2020DJF']
+    assert len(get_period_dates('202002')) == 29
+    assert get_period_dates('2020DJF')[0] == '20191201'
+    assert get_period_dates('2020DJF')[-1] == '20200229'
+
+
+def test_split_date_range():
+    """
+    A date range is covered by whole seasons, then whole months, then single dates
+    """
+    assert split_date_range('20191201', '20200331') == (['2020DJF', '202003'], [])
+
+    periods, dates = split_date_range('20200115', '20200402')
+    assert periods == ['202002', '202003']
+    assert dates[0] == '20200115' and dates[-1] == '20200402' and len(dates) == 17 + 2
@@ -0,0 +1,53 @@
+"""
+Test S3 loads and ranged loads against stubbed S3 responses
+"""
+import io
+from botocore.response import StreamingBody
+from fsoi.data.s3_datastore import S3DataStore
+
+
+def _body(data):
+    """
+    Create a get_object response body
+    :param data: {bytes} The data
+    :return: {dict} The response
+    """
+    return {'Body': StreamingBody(io.BytesIO(data), len(data))}
+
+
+def test_load_without_head(stubber):
+    """
+    A load is a single GET request, and a missing object is None
+    """
+    stubber.add_response('get_object', _body(b'{"a": 1}'), {'Bucket': 'b', 'Key': 'k.json'})
+    stubber.add_client_error('get_object', 'NoSuchKey', http_status_code=404,
+                             expected_params={'Bucket': 'b', 'Key': 'missing.json'})
+
+    datastore = S3DataStore()
+    assert datastore.load({'bucket': 'b', 'key': 'k.json'}) == b'{"a": 1}'
+    assert datastore.load({'bucket': 'b', 'key': 'missing.json'}) is None
+
+
+def test_load_range(stubber):
+    """
+    Ranges are converted to HTTP range headers with an inclusive end
+    """
+    data = bytes(range(256))
+    source = {'bucket': 'b', 'key': 'k.parquet'}
+    stubber.add_response('get_object', _body(data[10:20]), {'Bucket': 'b', 'Key': 'k.parquet', 'Range': 'bytes=10-19'})
+    stubber.add_response('get_object', _body(data[-8:]), {'Bucket': 'b', 'Key': 'k.parquet', 'Range': 'bytes=-8'})
+    stubber.add_response('get_object', _body(data[200:]), {'Bucket': 'b', 'Key': 'k.parquet', 'Range': 'bytes=200-'})
+
+    datastore = S3DataStore(max_concurrency=1)
+    assert datastore.load_ranges(source, [(10, 20), (-8, None), (200, None)]) == [data[10:20], data[-8:], data[200:]]
+    assert datastore.load_range(source, 5, 5) is None
+
+
+def test_transfer_config():
+    """
+    Transfer settings come from datastore.yaml unless they are given
+    """
+    datastore = S3DataStore(max_concurrency=3)
+    assert datastore.transfer_config.max_concurrency == 3
+    assert datastore.transfer_config.multipart_chunksize == datastore.multipart_chunksize > 0
+    assert datastore.stream_transfer_config.max_concurrency == datastore.stream_concurrency
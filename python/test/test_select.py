@@ -0,0 +1,86 @@
+"""
+Test the mask-based select against the original successive slicing
+"""
+import numpy as np
+import pandas as pd
+from datetime import datetime
+import fsoi.stats.lib_obimpact as loi
+
+
+def _legacy_select(df, cycles=None, dates=None, platforms=None, obtypes=None, channels=None, latitudes=None,
+                   longitudes=None, pressures=None):
+    """
+    The original implementation of select
+    """
+    for name, values in [('PLATFORM', platforms), ('OBTYPE', obtypes), ('CHANNEL', channels)]:
+        if values is not None:
+            indx = df.index.get_level_values(name) == ''
+            for value in values:
+                indx = np.ma.logical_or(indx, df.index.get_level_values(name) == value)
+            df = df.iloc[indx]
+    if cycles is not None:
+        indx = df.index.get_level_values('DATETIME') == ''
+        for cycle in cycles:
+            indx = np.ma.logical_or(indx, df.index.get_level_values('DATETIME').hour == cycle)
+        df = df.iloc[indx]
+    if dates is not None:
+        indx = df.index.get_level_values('DATETIME') == ''
+        for date in dates:
+            indx = np.ma.logical_or(indx, df.index.get_level_values('DATETIME') == date)
+        df = df.iloc[indx]
+    for name, bounds in [('LATITUDE', latitudes), ('LONGITUDE', longitudes), ('PRESSURE', pressures)]:
+        if bounds is not None:
+            indx1 = df.index.get_level_values(name) >= np.min(bounds)
+            indx2 = df.index.get_level_values(name) <= np.max(bounds)
+            df = df.iloc[np.ma.logical_and(indx1, indx2)]
+    return df
+
+
+def _make_binned(n=5000, seed=0):
+    """
+    Create a synthetic binned data frame with DATETIME, PLATFORM, OBTYPE, CHANNEL, LONGITUDE, LATITUDE
+    and PRESSURE index levels
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(datetime(2020, 3, 1, 0), periods=8, freq='6H')
+    df = pd.DataFrame({
+        'DATETIME': dates[rng.integers(0, len(dates), n)],
+        'PLATFORM': np.array(['Radiosonde', 'Aircraft', 'Ship', 'AMSUA'], dtype=object)[rng.integers(0, 4, n)],
+        'OBTYPE': np.array(['u', 'v', 't', 'Tb'], dtype=object)[rng.integers(0, 4, n)],
+        'CHANNEL': rng.integers(-1, 5, n),
+        'LONGITUDE': rng.integers(0, 72, n) * 5.0,
+        'LATITUDE': rng.integers(-18, 18, n) * 5.0,
+        'PRESSURE': rng.integers(1, 20, n) * 50.0,
+        'TotImp': rng.normal(0.0, 1.0, n),
+        'ObCnt': rng.integers(1, 100, n)
+    })
+    return df.set_index(['DATETIME', 'PLATFORM', 'OBTYPE', 'CHANNEL', 'LONGITUDE', 'LATITUDE', 'PRESSURE'])
+
+
+def test_select():
+    """
+    Compare select with the original implementation for single and combined criteria
+    :return: None
+    """
+    df = _make_binned()
+    criteria = [
+        {},
+        {'cycles': [0, 12]},
+        {'cycles': []},
+        {'dates': [datetime(2020, 3, 1, 6), datetime(2020, 3, 2, 18)]},
+        {'platforms': ['Ship', 'AMSUA', 'NotAPlatform']},
+        {'obtypes': ['u']},
+        {'channels': [-1, 3]},
+        {'latitudes': [30.0, -20.0], 'longitudes': [0.0, 180.0], 'pressures': [100.0, 500.0]},
+        {'cycles': [6], 'platforms': ['Radiosonde', 'Aircraft'], 'obtypes': ['t', 'u'], 'channels': [-1],
+         'latitudes': [-45.0, 45.0]}
+    ]
+    for kwargs in criteria:
+        expected = _legacy_select(df, **kwargs)
+        actual = loi.select(df, **kwargs)
+        assert expected.equals(actual)
+        assert expected.index.equals(actual.index)
+
+    # a sliced frame has unused level values, which must not match
+    sliced = df.iloc[df.index.get_level_values('PLATFORM') != 'Ship']
+    assert loi.select(sliced, platforms=['Ship']).empty
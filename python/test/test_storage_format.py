@@ -0,0 +1,86 @@
+"""
+Test the HDF5 and Parquet storage formats
+"""
+import os
+import tempfile
+import numpy as np
+from datetime import datetime
+import fsoi.stats.lib_obimpact as loi
+from fsoi.data.storage_format import get_storage_format, get_storage_format_for_file
+from fsoi.data.convert_storage_format import convert_key
+
+
+def _make_groupbulk(n=5000, seed=0):
+    """
+    Create a synthetic group bulk statistics data frame
+    :param n: {int} Number of observations used to create the statistics
+    :param seed: {int} Random seed
+    :return: {pandas.DataFrame} Group bulk statistics
+    """
+    rng = np.random.default_rng(seed)
+    platforms = np.array(['Radiosonde', 'AMSUA_N15', 'Aircraft', 'NOT_IN_CODES'], dtype=object)
+    columns = {
+        'PLATFORM': platforms[rng.integers(0, len(platforms), n)],
+        'OBTYPE': np.array(['u', 'v', 'T'], dtype=object)[rng.integers(0, 3, n)],
+        'CHANNEL': rng.integers(-1, 4, n),
+        'LONGITUDE': rng.random(n) * 360.0,
+        'LATITUDE': rng.random(n) * 180.0 - 90.0,
+        'PRESSURE': rng.random(n) * 1000.0,
+        'IMPACT': rng.normal(0.0, 1.e-9, n),
+        'OMF': rng.random(n),
+        'OBERR': np.full(n, -999.)
+    }
+    df = loi.columns_to_dataframe(datetime(2020, 3, 1, 0), columns)
+    return loi.allBulkStats(df, loi.Platforms('OnePlatform'))[0]
+
+
+def test_storage_formats():
+    """
+    Write and read each storage format with column projection and filters
+    :return: None
+    """
+    df = _make_groupbulk()
+    columns = ['TotImp', 'ObCnt']
+    filters = {'PLATFORM': ['Radiosonde', 'NOT_IN_CODES'], 'CHANNEL': [-1, 2]}
+    mask = df.index.get_level_values('PLATFORM').isin(filters['PLATFORM']) & \
+        df.index.get_level_values('CHANNEL').isin(filters['CHANNEL'])
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name in ['hdf5', 'parquet']:
+            storage_format = get_storage_format(name)
+            fname = os.path.join(work_dir, 'groupbulk.%s' % storage_format.extension)
+            storage_format.write(fname, df)
+
+            assert get_storage_format_for_file(fname).name == name
+            assert storage_format.read(fname).equals(df)
+            assert storage_format.read(fname, columns=columns).equals(df[columns])
+            assert storage_format.read(fname, columns=columns, filters=filters).equals(df[columns][mask])
+            assert storage_format.read(fname, filters={'PLATFORM': []}).empty
+
+
+def test_storage_format_selection():
+    """
+    Select the storage format by name, by environment variable and by default
+    :return: None
+    """
+    assert get_storage_format().name == 'hdf5'
+    assert get_storage_format('nope') is None
+
+    os.environ['FSOI_STORAGE_FORMAT'] = 'parquet'
+    try:
+        assert get_storage_format().name == 'parquet'
+    finally:
+        del os.environ['FSOI_STORAGE_FORMAT']
+
+
+def test_convert_key():
+    """
+    Convert S3 keys between storage formats
+    :return: None
+    """
+    hdf5 = get_storage_format('hdf5')
+    parquet = get_storage_format('parquet')
+    key = 'intercomp/hdf5/NRL/groupbulk.NRL.moist.2020030100.h5'
+    assert convert_key(key, hdf5, parquet) == 'intercomp/parquet/NRL/groupbulk.NRL.moist.2020030100.parquet'
+    assert convert_key(convert_key(key, hdf5, parquet), parquet, hdf5) == key
+    assert convert_key('intercomp/other/NRL/NRL.moist.2020030100.h5', hdf5, parquet) is None
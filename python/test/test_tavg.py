@@ -0,0 +1,73 @@
+"""
+Test the streaming time-average accumulator against tavg on the concatenated statistics
+"""
+import numpy as np
+import pandas as pd
+import fsoi.stats.lib_obimpact as loi
+
+
+def _make_cycles(n, seed):
+    """
+    Create synthetic statistics aggregated by platform, one data frame per cycle
+    :param n: {int} Number of cycles
+    :param seed: {int} Random seed
+    :return: {list} List of data frames with DATETIME and PLATFORM index levels
+    """
+    rng = np.random.default_rng(seed)
+    platforms = ['Radiosonde', 'Aircraft', 'AMSUA', 'GPSRO', 'Ship', 'Buoy']
+
+    frames = []
+    for (i, date) in enumerate(pd.date_range('2020-03-01', periods=n, freq='6H')):
+        # not every platform is in every cycle, and one platform is in only one cycle
+        names = [p for p in platforms[:-1] if rng.random() > 0.2] + (['Buoy'] if i == 3 else [])
+        index = pd.MultiIndex.from_product([[date], names], names=['DATETIME', 'PLATFORM'])
+        count = rng.integers(100, 10000, len(names))
+        frames.append(pd.DataFrame({
+            'TotImp': rng.normal(-1.e3, 5.e2, len(names)),
+            'ObCnt': count,
+            'ObCntBen': count // 2,
+            'ObCntNeu': count // 10
+        }, index=index))
+
+    return frames
+
+
+def _assert_same(result, expected):
+    """
+    Compare mean and standard deviation data frames
+    :param result: {tuple} Mean and standard deviation from the accumulator
+    :param expected: {tuple} Mean and standard deviation from tavg
+    :return: None
+    """
+    for (df, df_expected) in zip(result, expected):
+        assert list(df.index) == list(df_expected.index)
+        assert list(df.columns) == list(df_expected.columns)
+        assert np.allclose(df['TotImp'], df_expected['TotImp'], rtol=1.e-10, equal_nan=True)
+        for col in ['ObCnt', 'ObCntBen', 'ObCntNeu']:
+            assert (df[col].values == df_expected[col].values).all()
+
+
+def test_tavg_accumulator():
+    """
+    Adding cycles one at a time gives the same result as tavg
+    """
+    frames = _make_cycles(40, 5)
+    accumulator = loi.TavgAccumulator('PLATFORM')
+    for df in frames:
+        accumulator.add(df)
+
+    _assert_same(accumulator.result(), loi.tavg(pd.concat(frames), 'PLATFORM'))
+
+
+def test_tavg_accumulator_merge():
+    """
+    Merging accumulators of partial results gives the same result as tavg
+    """
+    frames = _make_cycles(40, 7)
+    parts = [loi.TavgAccumulator('PLATFORM') for _ in range(3)]
+    for (i, df) in enumerate(frames):
+        parts[i % 3].add(df)
+    parts[0].merge(parts[1]).merge(parts[2]).merge(loi.TavgAccumulator('PLATFORM'))
+
+    _assert_same(parts[0].result(), loi.tavg(pd.concat(frames), 'PLATFORM'))
+    assert loi.TavgAccumulator().result() == (None, None)